@@ -0,0 +1,130 @@
+"""Time raster exchange with GRASS as ASCII grids and as GeoTIFFs.
+
+Builds a synthetic climate gradient, resistance and core area grid, then for
+each exchange format Climate Linkage Mapper supports (cc_env.grass_exchange)
+times the steps of its GRASS CWD run:
+
+    write   -- copy the input GRIDs to exchange files
+    read    -- import (r.in.gdal) or link (r.external) them into GRASS
+    walk    -- run r.walk for one core and export its CWD and back rasters
+    copy    -- copy the exported rasters back to ARCINFO grids
+
+Run with ArcGIS Pro's Python, e.g.
+
+    python cc_grass_benchmark.py "C:\\Program Files\\GRASS GIS 7.8" 2000
+
+where 2000 is the number of rows and columns of the synthetic grid.
+
+"""
+
+import os
+import shutil
+import sys
+import time
+
+import numpy as npy
+
+CELL_SIZE = 1000
+NODATA = -9999
+
+
+def synthetic_grids(out_dir, size):
+    """Save synthetic climate, resistance and core GRIDs. Returns paths."""
+    import arcpy
+    rows, cols = npy.indices((size, size))
+    random = npy.random.RandomState(0)
+    climate = (rows * 10.0 / size +
+               random.normal(0, 0.1, (size, size))).astype(npy.float32)
+    resist = random.uniform(1, 10, (size, size)).astype(npy.float32)
+    cores = npy.full((size, size), NODATA, dtype=npy.int32)
+    block = max(size // 20, 1)
+    cores[block:2 * block, block:2 * block] = 1
+    cores[-2 * block:-block, -2 * block:-block] = 2
+
+    spatial_ref = arcpy.SpatialReference(5070)  # NAD83 Conus Albers
+    corner = arcpy.Point(0, 0)
+    grids = []
+    for name, array in (("bclimate", climate), ("bresist", resist),
+                        ("bcores", cores)):
+        grid = os.path.join(out_dir, name)
+        arcpy.NumPyArrayToRaster(array, corner, CELL_SIZE, CELL_SIZE,
+                                 NODATA).save(grid)
+        arcpy.DefineProjection_management(grid, spatial_ref)
+        grids.append(grid)
+    return grids
+
+
+def time_exchange(cc_grass_cwd, cc_env, grids, out_dir):
+    """Run one core through GRASS. Returns seconds taken by each step."""
+    import arcpy
+    exchange = cc_env.grass_exchange
+    ext = cc_grass_cwd.EXCHANGE_EXT[exchange]
+    work_dir = os.path.join(out_dir, exchange)
+    os.makedirs(work_dir)
+    cc_env.scratch_dir = work_dir
+    gisdbase = os.path.join(work_dir, "cc_grass")
+    grassrc = os.path.join(work_dir, "cc_grassrc")
+    layers = ("climate", "resist", "cores")
+    files = [os.path.join(work_dir, "b" + layer + ext) for layer in layers]
+    times = []
+
+    start_time = time.time()
+    for grid, exch_file in zip(grids, files):
+        cc_grass_cwd.write_exchange(grid, exch_file)
+    times.append(time.time() - start_time)
+
+    cc_grass_cwd.write_grassrc(grassrc, gisdbase)
+    cc_grass_cwd.setup_wrkspace(gisdbase, grassrc, files[0])
+    start_time = time.time()
+    for exch_file, layer in zip(files, layers):
+        cc_grass_cwd.read_exchange(exch_file, layer)
+    times.append(time.time() - start_time)
+
+    env = cc_grass_cwd.make_worker_envs(gisdbase, 1)[0]
+    walk_coeff = "1,{0},-{0},-{0}".format(cc_env.climate_cost)
+    start_time = time.time()
+    outputs = cc_grass_cwd.core_cwd_back(1, layers[0], layers[1], layers[2],
+                                         walk_coeff, "1", env)
+    times.append(time.time() - start_time)
+
+    start_time = time.time()
+    for rtype, exch_grid in zip(("bcwd", "bback"), outputs):
+        arcpy.CopyRaster_management(exch_grid, os.path.join(work_dir, rtype))
+    times.append(time.time() - start_time)
+    return times
+
+
+def main():
+    """Build grids and print times for each exchange format."""
+    gisbase = sys.argv[1]
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    demo_path = os.path.abspath(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    sys.path.append(os.path.join(demo_path, '..', 'toolbox', 'scripts'))
+    out_dir = os.path.join(demo_path, 'output', 'cc_grass_benchmark')
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    from cc_config import cc_env
+    cc_env.configure(
+        [os.path.basename(__file__), out_dir, '#', '#', '#', '#', gisbase,
+         0, 0, 1, 1000, 'false', 1, 'Cost-Weighted', 'false'])
+    os.environ["PATH"] = cc_env.gpath + os.environ["PATH"]
+    import cc_grass_cwd  # Cannot import until configured
+
+    grids = synthetic_grids(out_dir, size)
+    steps = ("write", "read", "walk", "copy")
+    print("{0} x {0} cells".format(size))
+    print("{:<10}".format("format") +
+          "".join("{:>10}".format(step) for step in steps + ("total",)))
+    for exchange in sorted(cc_grass_cwd.EXCHANGE_EXT):
+        cc_env.grass_exchange = exchange
+        times = time_exchange(cc_grass_cwd, cc_env, grids, out_dir)
+        print("{:<10}".format(exchange) +
+              "".join("{:>10.1f}".format(secs)
+                      for secs in times + [sum(times)]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Time centrality solves from scratch and as updates of the last network.
+
+Builds a synthetic core network like those of Linkage Mapper step 7 (each
+core linked to its nearest neighbors), solves it and saves its state as step
+7 does, then for a growing number of link edits times
+
+    full    -- building and solving the edited network from scratch
+    update  -- loading the saved network and applying the edits as low-rank
+               updates (lm_circuit.NetworkCircuit.update_links)
+
+Edits change the resistance of random links. Run with ArcGIS Pro's Python,
+or any Python 3 with NumPy and SciPy, e.g.
+
+    python cm_update_benchmark.py 2000
+
+where 2000 is the number of cores.
+
+"""
+
+import os
+import shutil
+import sys
+import time
+
+import numpy as npy
+
+NEIGHBORS = 4
+REPEATS = 3
+
+
+def synthetic_links(num_cores):
+    """Return core1, core2 and resistance of links between nearby cores."""
+    random = npy.random.RandomState(0)
+    points = random.uniform(0, 1000, (num_cores, 2))
+    pairs = set()
+    for core, point in enumerate(points):
+        dists = npy.hypot(*(points - point).T)
+        for other in npy.argsort(dists)[1:NEIGHBORS + 1]:
+            pairs.add((min(core, other) + 1, max(core, other) + 1))
+    core1, core2 = npy.array(sorted(pairs)).T
+    resistance = npy.hypot(*(points[core1 - 1] - points[core2 - 1]).T)
+    return core1, core2, resistance
+
+
+def solve(network):
+    """Find currents as step 7 does."""
+    network.node_currents(network.branch_currents())
+
+
+def best_time(func):
+    """Return least seconds taken by func over REPEATS runs."""
+    times = []
+    for _ in range(REPEATS):
+        start_time = time.time()
+        func()
+        times.append(time.time() - start_time)
+    return min(times)
+
+
+def time_edits(lc, links, state_file, num_edits):
+    """Time full and incremental solves after num_edits link changes."""
+    core1, core2, resistance = links
+    random = npy.random.RandomState(num_edits)
+    edited = resistance.copy()
+    changed = random.choice(len(edited), num_edits, replace=False)
+    edited[changed] *= random.uniform(0.5, 2.0, num_edits)
+
+    def full():
+        solve(lc.NetworkCircuit(core1, core2, edited))
+
+    def update():
+        network = lc.NetworkCircuit.load(state_file)
+        if network.update_links(core1, core2, edited,
+                                max_changes=num_edits) is None:
+            raise RuntimeError('Network update refused')
+        solve(network)
+
+    return best_time(full), best_time(update)
+
+
+def main():
+    """Save a network and print solve times as the edit count grows."""
+    num_cores = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    demo_path = os.path.abspath(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    sys.path.append(os.path.join(demo_path, '..', 'toolbox', 'scripts'))
+    out_dir = os.path.join(demo_path, 'output', 'cm_update_benchmark')
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    import lm_circuit as lc
+
+    links = synthetic_links(num_cores)
+    state_file = os.path.join(out_dir, 'centrality_state.npz')
+    network = lc.NetworkCircuit(*links)
+    solve(network)
+    network.save(state_file)
+
+    print("{} cores, {} links".format(num_cores, len(links[0])))
+    print("{:>8}{:>10}{:>10}{:>10}".format("edits", "full", "update",
+                                           "speedup"))
+    num_edits = 1
+    while num_edits <= max(num_cores // 4, 1):
+        full_secs, update_secs = time_edits(lc, links, state_file, num_edits)
+        print("{:>8}{:>10.3f}{:>10.3f}{:>10.1f}".format(
+            num_edits, full_secs, update_secs, full_secs / update_secs))
+        num_edits *= 2
+
+
+if __name__ == "__main__":
+    main()
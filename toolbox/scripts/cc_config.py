@@ -9,6 +9,7 @@ Classes:
 
 import os
 import sys
+from os import cpu_count
 
 import lm_util_config as util
 
@@ -36,12 +37,20 @@ class ClimateConfig(object):
         self.climate_rast = arg[4]  # Climate raster (+ path)
         self.resist_rast = util.nullstring(arg[5])  # Resist raster (+ path)
 
+        # GRASS path. If not given, CWDs are calculated with cc_rwalk.
+        self.gisbase = util.nullstring(arg[6])
+        self.use_grass = bool(self.gisbase)
+
         # Setup GRASS environmental variables
-        self.gisbase = os.environ['GISBASE'] = arg[6]  # GRASS path
-        sys.path.append(os.path.join(os.environ['GISBASE'], "etc", "python"))
-        self.gpath = (''.join([os.path.join(cc_env.gisbase, gpath) + os.pathsep
-                               for gpath in [r'mysys\bin', 'bin', 'extrabin',
-                                             'lib', r'etc\python', 'etc']]))
+        if self.use_grass:
+            os.environ['GISBASE'] = self.gisbase
+            sys.path.append(os.path.join(os.environ['GISBASE'], "etc",
+                                         "python"))
+            self.gpath = (''.join([os.path.join(cc_env.gisbase, gpath) +
+                                   os.pathsep
+                                   for gpath in [r'mysys\bin', 'bin',
+                                                 'extrabin', 'lib',
+                                                 r'etc\python', 'etc']]))
 
         # Tool settings
         self.min_euc_dist = float(arg[7])  # Min distance between core pairs
@@ -66,6 +75,11 @@ class ClimateConfig(object):
         self.prj_climate_rast = "climate"
         self.prj_core_rast = "cores"
         self.simplify_cores = True
+        # Most GRASS processes running r.walk at once, each in its own
+        # mapset. Fewer are run if they won't fit in available memory.
+        self.grass_processes = max(1, (cpu_count() or 1) - 1)
+        # Format rasters are exchanged with GRASS in, "GTiff" or "AAIGrid"
+        self.grass_exchange = "GTiff"
         self.WRITETRUNCRASTER = "true"
         self.CWDTHRESH = "200000"
         self.OUTPUTFORMODELBUILDER = "#"
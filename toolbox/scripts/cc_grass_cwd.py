@@ -1,9 +1,20 @@
 # Authors: Darren Kavanagh and Brad McRae
 
-"""Create CWD and Back rasters using GRASS GIS r.walk function."""
+"""Create CWD and Back rasters using GRASS GIS r.walk function.
+
+By default rasters are exchanged with GRASS as deflate compressed GeoTIFFs.
+Inputs are linked into GRASS with r.external rather than imported, so no
+copy is made. Set cc_env.grass_exchange to "AAIGrid" to exchange ASCII grids
+imported with r.in.gdal instead (see demo/scripts/cc_grass_benchmark.py).
+
+"""
 
 import os
+import queue
+import shutil
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import arcpy
 
@@ -14,6 +25,18 @@ from cc_config import cc_env
 from lm_config import tool_env as lm_env
 import lm_util
 
+LOCATION = "gcwd"
+
+# File extension of each format rasters can be exchanged with GRASS in
+EXCHANGE_EXT = {"GTiff": ".tif", "AAIGrid": ".asc"}
+
+# Estimated memory footprint of a worker's r.walk run. r.walk is given
+# WALK_MEMORY_MB for its segment cache and needs about WALK_CELL_BYTES a
+# cell of the region in it, on top of WALK_BASE_BYTES for the process.
+WALK_MEMORY_MB = 300
+WALK_CELL_BYTES = 40
+WALK_BASE_BYTES = 100 * 1048576
+
 
 def grass_cwd(core_list):
     """Create CWD and Back rasters using GRASS."""
@@ -22,9 +45,10 @@ def grass_cwd(core_list):
     gisdbase = os.path.join(out_fldr, "cc_grass")
 
     ccr_grassrc = os.path.join(out_fldr, "cc_grassrc")
-    climate_asc = os.path.join(out_fldr, "cc_gclimate.asc")
-    resist_asc = os.path.join(out_fldr, "cc_gresist.asc")
-    core_asc = os.path.join(out_fldr, "cc_gcores.asc")
+    ext = EXCHANGE_EXT[cc_env.grass_exchange]
+    climate_file = os.path.join(out_fldr, "cc_gclimate" + ext)
+    resist_file = os.path.join(out_fldr, "cc_gresist" + ext)
+    core_file = os.path.join(out_fldr, "cc_gcores" + ext)
     climate_lyr = "climate"
     resist_lyr = "resist"
     core_lyr = "cores"
@@ -35,39 +59,74 @@ def grass_cwd(core_list):
 
         start_path = os.environ["PATH"]
 
-        # Convert input GRID rasters to ASCII
-        lm_util.gprint("Converting ARCINFO GRID rasters to ASCII")
-        arcpy.RasterToASCII_conversion(cc_env.prj_climate_rast, climate_asc)
-        arcpy.RasterToASCII_conversion(cc_env.prj_resist_rast, resist_asc)
-        arcpy.RasterToASCII_conversion(cc_env.prj_core_rast, core_asc)
+        # Copy input GRID rasters to exchange format
+        lm_util.gprint("Copying ARCINFO GRID rasters to " +
+                       cc_env.grass_exchange)
+        start_time = time.clock()
+        write_exchange(cc_env.prj_climate_rast, climate_file)
+        write_exchange(cc_env.prj_resist_rast, resist_file)
+        write_exchange(cc_env.prj_core_rast, core_file)
+        lm_util.elapsed_time(start_time)
 
         # Create resource file and setup workspace
         os.environ["PATH"] = cc_env.gpath
         write_grassrc(ccr_grassrc, gisdbase)
-        setup_wrkspace(gisdbase, ccr_grassrc, climate_asc)
+        setup_wrkspace(gisdbase, ccr_grassrc, climate_file)
 
         # Make cwd folder/s for Linkage Mapper
         lm_util.make_raster_paths(max(core_list), lm_env.CWDBASEDIR,
                                   lm_env.CWDSUBDIR_NM)
 
-        # Import files into GRASS
-        lm_util.gprint("Importing raster files into GRASS")
-        run_grass_cmd("r.in.gdal", input=climate_asc, output=climate_lyr)
-        run_grass_cmd("r.in.gdal", input=resist_asc, output=resist_lyr)
-        run_grass_cmd("r.in.gdal", input=core_asc, output=core_lyr)
+        # Link or import files into GRASS
+        lm_util.gprint("Reading raster files into GRASS")
+        start_time = time.clock()
+        read_exchange(climate_file, climate_lyr)
+        read_exchange(resist_file, resist_lyr)
+        read_exchange(core_file, core_lyr)
+        lm_util.elapsed_time(start_time)
 
         # Generate CWD and Back rasters
-        gen_cwd_back(core_list, climate_lyr, resist_lyr, core_lyr)
+        desc = arcpy.Describe(cc_env.prj_climate_rast)
+        workers = walk_workers(cc_env.grass_processes,
+                               desc.height * desc.width,
+                               lm_util.get_mem_bytes()[1])
+        if workers < cc_env.grass_processes:
+            lm_util.gprint("Limiting GRASS processes to " + str(workers) +
+                           " to fit in available memory")
+        worker_envs = make_worker_envs(gisdbase, workers)
+        gen_cwd_back(core_list, climate_lyr, resist_lyr, core_lyr,
+                     worker_envs)
 
     except Exception:
         raise
     finally:
         os.environ["PATH"] = start_path
-        for data in ([gisdbase, ccr_grassrc, climate_asc, resist_asc,
-                      core_asc]):
+        for data in ([gisdbase, ccr_grassrc, climate_file, resist_file,
+                      core_file]):
             lm_util.delete_data(data)
 
 
+def write_exchange(in_rast, out_file):
+    """Copy raster to file in the format exchanged with GRASS."""
+    if cc_env.grass_exchange == "AAIGrid":
+        arcpy.RasterToASCII_conversion(in_rast, out_file)
+        return
+    compression = arcpy.env.compression
+    arcpy.env.compression = "LZ77"  # Deflate
+    try:
+        arcpy.CopyRaster_management(in_rast, out_file)
+    finally:
+        arcpy.env.compression = compression
+
+
+def read_exchange(in_file, grass_lyr):
+    """Link GeoTIFF or import ASCII grid into GRASS."""
+    if cc_env.grass_exchange == "AAIGrid":
+        run_grass_cmd("r.in.gdal", input=in_file, output=grass_lyr)
+    else:
+        run_grass_cmd("r.external", input=in_file, output=grass_lyr)
+
+
 def write_grassrc(ccr_grassrc, gisdbase):
     """Write GRASS resource file to project folder."""
     with open(ccr_grassrc, 'w') as rc_file:
@@ -80,7 +139,7 @@ def setup_wrkspace(gisdbase, ccr_grassrc, geo_file):
     """Configure GRASS workspace."""
     lm_util.gprint("Creating GRASS workspace")
     gisbase = cc_env.gisbase
-    location = "gcwd"
+    location = LOCATION
     mapset = "PERMANENT"
 
     os.environ['GISRC'] = ccr_grassrc
@@ -103,81 +162,168 @@ def setup_wrkspace(gisdbase, ccr_grassrc, geo_file):
     os.environ['GRASS_VERBOSE'] = "0"  # Only errors and warnings are printed
 
 
-def gen_cwd_back(core_list, climate_lyr, resist_lyr, core_lyr):
-    """Generate CWD and back rasters using r.walk in GRASS."""
+def walk_workers(processes, cells, avail_bytes):
+    """Return number of GRASS workers to run, capped by memory.
+
+    Workers use up to half of avail_bytes, at the estimated footprint of
+    an r.walk run on a region of cells.
+    """
+    walk_bytes = (min(cells * WALK_CELL_BYTES, WALK_MEMORY_MB * 1048576) +
+                  WALK_BASE_BYTES)
+    return max(1, min(processes, int(avail_bytes * 0.5) // walk_bytes))
+
+
+def make_worker_envs(gisdbase, workers):
+    """Create a mapset and resource file for each worker.
+
+    GRASS processes can run at once in separate mapsets of a location.
+    Imported rasters stay in PERMANENT, which every mapset can read.
+    Returns list of process environments, one per worker.
+    """
+    location_dir = os.path.join(gisdbase, LOCATION)
+    worker_envs = []
+    for worker in range(workers):
+        mapset = "worker" + str(worker + 1)
+        mapset_dir = os.path.join(location_dir, mapset)
+        if not os.path.isdir(mapset_dir):
+            os.mkdir(mapset_dir)
+        # A mapset starts with the location's region
+        shutil.copy(os.path.join(location_dir, "PERMANENT", "WIND"),
+                    mapset_dir)
+
+        worker_grassrc = os.path.join(gisdbase, mapset + "_grassrc")
+        with open(worker_grassrc, 'w') as rc_file:
+            rc_file.write("GISDBASE: %s\n" % gisdbase)
+            rc_file.write("LOCATION_NAME: %s\n" % LOCATION)
+            rc_file.write("MAPSET: %s\n" % mapset)
+            rc_file.write("OVERWRITE: 1\n")
+        env = os.environ.copy()
+        env['GISRC'] = worker_grassrc
+        worker_envs.append(env)
+    return worker_envs
+
+
+def gen_cwd_back(core_list, climate_lyr, resist_lyr, core_lyr, worker_envs):
+    """Generate CWD and back rasters using r.walk in GRASS.
+
+    Cores are run at once in the workers' mapsets, and each core's rasters
+    are copied to ARCINFO grids as it finishes.
+    """
     slope_factor = "1"
     walk_coeff_flat = "1"
     walk_coeff_uphill = str(cc_env.climate_cost)
     walk_coeff_downhill = str(cc_env.climate_cost * -1)
     walk_coeff = (walk_coeff_flat + "," + walk_coeff_uphill + "," +
                   walk_coeff_downhill + "," + walk_coeff_downhill)
+    no_cores = str(len(core_list))
+
+    # Get spatial reference for defining ARCINFO raster projections
+    desc_data = arcpy.Describe(cc_env.prj_core_rast)
+    spatial_ref = desc_data.spatialReference
+
+    def create_arcgrid(core_no, rtype, exch_grid):
+        """Copy exported raster to ARCINFO grid."""
+        # Get cwd path (e.g. ..\datapass\cwd\cw\cwd_3)
+        arc_grid = lm_util.get_cwd_path(core_no).replace("cwd_", rtype)
+        arcpy.CopyRaster_management(exch_grid, arc_grid)
+        arcpy.DefineProjection_management(arc_grid, spatial_ref)
+        lm_util.delete_data(exch_grid)
+
+    # Workers take a free environment for each core
+    free_envs = queue.Queue()
+    for env in worker_envs:
+        free_envs.put(env)
+
+    def run_core(core_no):
+        env = free_envs.get()
+        try:
+            return core_cwd_back(core_no, climate_lyr, resist_lyr, core_lyr,
+                                 walk_coeff, slope_factor, env)
+        finally:
+            free_envs.put(env)
+
+    lm_util.gprint("Generating CWD and back rasters for " + no_cores +
+                   " cores with " + str(len(worker_envs)) +
+                   " GRASS process(es)")
+    executor = ThreadPoolExecutor(len(worker_envs))
+    futures = dict((executor.submit(run_core, core_no), core_no)
+                   for core_no in core_list)
+    try:
+        for position, future in enumerate(as_completed(futures)):
+            core_no = futures[future]
+            cwd_grid, back_grid = future.result()
+            lm_util.gprint("Generated CWD and back rasters for Core " +
+                           str(core_no) + " (" + str(position + 1) + "/" +
+                           no_cores + ")")
+            create_arcgrid(core_no, "cwd_", cwd_grid)  # Export CWD raster
+            # Export reclassified back raster
+            create_arcgrid(core_no, "back_", back_grid)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+
 
+def core_cwd_back(core_no, climate_lyr, resist_lyr, core_lyr, walk_coeff,
+                  slope_factor, env):
+    """Run r.walk for a core in a worker's mapset.
+
+    env -- process environment pointing GRASS at the worker's mapset
+    Returns paths of CWD and back rasters exported in exchange format.
+    """
     focal_core_rast = "focal_core_rast"
     gcwd = "gcwd"
     gback = "gback"
     gbackrc = "gbackrc"
     core_points = "corepoints"
-    no_cores = str(len(core_list))
+    core_no_txt = str(core_no)
 
     # Map from directional degree output from GRASS to Arc's 1 to 8 directions
     # format. See r.walk source code and ArcGIS's 'Understanding cost distance
     # analysis' help page.
     rc_rules = "0=0\n180=5\n225=4\n270=3\n315=2\n360=1\n45=8\n90=7\n135=6"
 
-    try:
-        for position, core_no in enumerate(core_list):
-            core_no_txt = str(core_no)
-            lm_util.gprint("Generating CWD and back rasters for Core " +
-                           core_no_txt + " (" + str(position + 1) + "/" +
-                           no_cores + ")")
-
-            # Pull out focal core for cwd analysis
-            write_grass_cmd("r.reclass", input=core_lyr,
-                            output=focal_core_rast, overwrite=True,
-                            rules="-", stdin=core_no_txt + '=' + core_no_txt)
-
-            # Converting raster core to point feature
-            run_grass_cmd("r.to.vect", flags="z", input=focal_core_rast,
-                          output=core_points, type="point")
-
-            # Running r.walk to create CWD and back raster
-            run_grass_cmd("r.walk", elevation=climate_lyr,
-                          friction=resist_lyr, output=gcwd, outdir=gback,
-                          start_points=core_points, walk_coeff=walk_coeff,
-                          slope_factor=slope_factor)
-
-            # Set source cells equal to zero to match ArcGIS back rasters
-            grass.mapcalc("gback_src_rst = "
-                          "eval(fcore = if(isnull({fcore_rst}), 255, 0), "
-                          "if(fcore == 0, 0, {gback_rst}))".format(
-                            fcore_rst=focal_core_rast, gback_rst=gback))
-
-            # Reclassify back raster directional degree output to ArcGIS format
-            write_grass_cmd("r.reclass", input="gback_src_rst", output=gbackrc,
-                            rules="-", stdin=rc_rules)
-
-            # Get spatial reference for defining ARCINFO raster projections
-            desc_data = arcpy.Describe(cc_env.prj_core_rast)
-            spatial_ref = desc_data.spatialReference
-
-            # Get cwd path (e.g. ..\datapass\cwd\cw\cwd_3)
-            cwd_path = lm_util.get_cwd_path(core_no)
-
-            def create_arcgrid(rtype, grass_grid):
-                """Export GRASS raster to ASCII and then to ARCINFO grid."""
-                ascii_grid = os.path.join(cc_env.scratch_dir,
-                                          rtype + core_no_txt + ".asc")
-                arc_grid = cwd_path.replace("cwd_", rtype)
-                run_grass_cmd("r.out.gdal", flags="c", input=grass_grid,
-                              output=ascii_grid, format="AAIGrid", nodata=15)
-                arcpy.CopyRaster_management(ascii_grid, arc_grid)
-                arcpy.DefineProjection_management(arc_grid, spatial_ref)
-                lm_util.delete_data(ascii_grid)
-
-            create_arcgrid("cwd_", gcwd)  # Export CWD raster
-            create_arcgrid("back_", gbackrc)  # Export reclassified back raster
-    except Exception:
-        raise
+    # Pull out focal core for cwd analysis
+    write_grass_cmd("r.reclass", input=core_lyr, output=focal_core_rast,
+                    overwrite=True, rules="-",
+                    stdin=core_no_txt + '=' + core_no_txt, env=env)
+
+    # Converting raster core to point feature
+    run_grass_cmd("r.to.vect", flags="z", input=focal_core_rast,
+                  output=core_points, type="point", env=env)
+
+    # Running r.walk to create CWD and back raster
+    run_grass_cmd("r.walk", elevation=climate_lyr, friction=resist_lyr,
+                  output=gcwd, outdir=gback, start_points=core_points,
+                  walk_coeff=walk_coeff, slope_factor=slope_factor,
+                  memory=WALK_MEMORY_MB, env=env)
+
+    # Set source cells equal to zero to match ArcGIS back rasters
+    run_grass_cmd("r.mapcalc",
+                  expression="gback_src_rst = "
+                  "eval(fcore = if(isnull({fcore_rst}), 255, 0), "
+                  "if(fcore == 0, 0, {gback_rst}))".format(
+                      fcore_rst=focal_core_rast, gback_rst=gback),
+                  env=env)
+
+    # Reclassify back raster directional degree output to ArcGIS format
+    write_grass_cmd("r.reclass", input="gback_src_rst", output=gbackrc,
+                    rules="-", stdin=rc_rules, env=env)
+
+    def export_grid(rtype, grass_grid):
+        """Export GRASS raster to exchange format."""
+        exch_grid = os.path.join(
+            cc_env.scratch_dir,
+            rtype + core_no_txt + EXCHANGE_EXT[cc_env.grass_exchange])
+        options = {}
+        if cc_env.grass_exchange == "GTiff":
+            options['createopt'] = "COMPRESS=DEFLATE"
+        run_grass_cmd("r.out.gdal", flags="c", input=grass_grid,
+                      output=exch_grid, format=cc_env.grass_exchange,
+                      nodata=15, env=env, **options)
+        return exch_grid
+
+    return export_grid("cwd_", gcwd), export_grid("back_", gbackrc)
 
 
 def start_grass_cmd(*args, **kwargs):
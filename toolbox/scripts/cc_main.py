@@ -17,17 +17,21 @@ Python >= 2.6.5
 
 import os
 import sys
-import csv
-import itertools
 import traceback
 
+import numpy as npy
+
 import arcinfo  # Import Advanced license. Needed before arcpy import.
 import arcpy
 
 from cc_config import cc_env
+import cc_near as cn
+import cc_rwalk as cr
 import cc_util
+import lm_grid as lg
 import lm_master
 from lm_config import tool_env as lm_env
+import lm_raster as lr
 import lm_util
 
 _SCRIPT_NAME = "cc_main.py"
@@ -123,21 +127,17 @@ def log_setup(param_values):
 
 def run_analysis():
     """Run Climate Linkage Mapper analysis."""
-    import cc_grass_cwd  # Cannot import until configured
-
     cc_copy_inputs()  # Clip inputs and create project area raster
 
     # Get zonal statistics for cores and climate
     lm_util.gprint("\nCALCULATING ZONAL STATISTICS FROM CLIMATE RASTER")
-    climate_stats = arcpy.sa.ZonalStatisticsAsTable(
-        cc_env.prj_core_fc, cc_env.core_fld, cc_env.prj_climate_rast,
-        "zstats", "DATA", "ALL")
+    climate_stats = core_climate_stats()
 
     # Create core pairings table and limit based upon climate threshold
     core_pairings = create_pair_tbl(climate_stats)
 
     # Generate link table, calculate CWD and run Linkage Mapper
-    if int(arcpy.GetCount_management(core_pairings).getOutput(0)) == 0:
+    if len(core_pairings) == 0:
         lm_util.warn("\nNo core pairs within climate threshold. "
                      "Program will end")
     else:
@@ -147,14 +147,55 @@ def run_analysis():
             lm_util.warn("\nNo core pairs within Euclidean distances. "
                          "Progam will end")
         else:
-            # Create CWD using Grass
-            cc_grass_cwd.grass_cwd(grass_cores)
+            if cc_env.use_grass:
+                # Create CWD using Grass
+                import cc_grass_cwd  # Cannot import until configured
+                cc_grass_cwd.grass_cwd(grass_cores)
+            else:
+                calc_cwds(grass_cores)
             # Run Linkage Mapper
             lm_util.gprint("\nRUNNING LINKAGE MAPPER "
                            "TO CREATE CLIMATE CORRIDORS")
             lm_master.lm_master()
 
 
+def calc_cwds(core_list):
+    """Create CWD and back rasters with the r.walk cost model of cc_rwalk.
+
+    Climate is the elevation surface and resistance the friction, using the
+    same walk coefficients and slope factor the GRASS workflow passes to
+    r.walk. The cost graph is built once and used for every core.
+    """
+    lm_util.gprint("\nCREATING COST-WEIGHTED DISTANCE RASTERS")
+    grid = lr.grid_info(cc_env.prj_climate_rast)
+    window = lg.Window(0, 0, grid.nrows, grid.ncols)
+    climate = lr.read_window(cc_env.prj_climate_rast, grid, window,
+                             npy.float64)
+    resist = lr.read_window(cc_env.prj_resist_rast, grid, window, npy.float64)
+    cores = lr.read_window(cc_env.prj_core_rast, grid, window, npy.float64)
+    walk_coeff = (1, cc_env.climate_cost, -cc_env.climate_cost,
+                  -cc_env.climate_cost)
+    walk = cr.walk_graph(climate, resist, grid.cell_size, walk_coeff,
+                         slope_factor=1)
+    del climate, resist
+
+    # Make cwd folder/s for Linkage Mapper
+    lm_util.make_raster_paths(max(core_list), lm_env.CWDBASEDIR,
+                              lm_env.CWDSUBDIR_NM)
+
+    no_cores = str(len(core_list))
+    for position, core_no in enumerate(core_list):
+        lm_util.gprint("Generating CWD and back rasters for Core " +
+                       str(core_no) + " (" + str(position + 1) + "/" +
+                       no_cores + ")")
+        cwd, back = cr.cwd_back(walk, cores == core_no)
+        # Get cwd path (e.g. ..\datapass\cwd\cw\cwd_3)
+        cwd_path = lm_util.get_cwd_path(core_no)
+        lr.save_array(cwd, grid, window, cwd_path)
+        lr.save_array(back, grid, window, cwd_path.replace("cwd_", "back_"),
+                      integer=True)
+
+
 def cc_copy_inputs():
     """Clip Climate Linkage Mapper inputs to smallest extent."""
     lm_util.gprint("\nCOPYING LAYERS AND, IF NECESSARY, REDUCING EXTENT")
@@ -191,14 +232,16 @@ def cc_copy_inputs():
     arcpy.CopyRaster_management(cc_env.climate_rast,
                                 cc_env.prj_climate_rast)
 
-    # Create core raster
+    # Create core raster, aligned with climate cells for zonal statistics
     arcpy.env.extent = arcpy.Extent(xmin, ymin, xmax, ymax)
+    arcpy.env.snapRaster = cc_env.prj_climate_rast
     lm_util.delete_data(cc_env.prj_core_rast)
     arcpy.FeatureToRaster_conversion(
         cc_env.core_fc, cc_env.core_fld,
         cc_env.prj_core_rast,
         arcpy.Describe(cc_env.climate_rast).MeanCellHeight)
     arcpy.env.extent = None
+    arcpy.env.snapRaster = None
 
     # Create array of boundary points
     array = arcpy.Array()
@@ -219,133 +262,119 @@ def cc_copy_inputs():
     arcpy.Clip_analysis(cc_env.core_fc, ext_poly, cc_env.prj_core_fc)
 
 
-def create_pair_tbl(climate_stats):
-    """Create core pair table and limit to climate threshold."""
-    cpair_tbl = pair_cores("corepairs")
-    if int(arcpy.GetCount_management(cpair_tbl).getOutput(0)) > 0:
-        limit_cores(cpair_tbl, climate_stats)
-    return cpair_tbl
+def core_climate_stats():
+    """Return ZoneStats of climate in each core of the core raster.
 
+    The core and climate rasters are read together tile by tile, so the
+    statistics come from one pass without writing a table.
 
-def pair_cores(cpair_tbl):
-    """Create table with all possible core to core combinations."""
-    srows, outputrow, irows = None, None, None
+    """
+    grid = lr.grid_info(cc_env.prj_climate_rast)
 
-    try:
-        lm_util.gprint("\nCREATING CORE PAIRINGS TABLE")
-        arcpy.CreateTable_management(cc_env.cc_gdb, cpair_tbl, "", "")
-        arcpy.AddField_management(cpair_tbl, FR_COL, "Long", "", "",
-                                  "", "", "NON_NULLABLE")
-        arcpy.AddField_management(cpair_tbl, TO_COL, "Long", "", "",
-                                  "", "", "NON_NULLABLE")
-        arcpy.DeleteField_management(cpair_tbl, "Field1")
+    def tiles():
+        for window in lg.grid_windows(grid.nrows, grid.ncols):
+            yield (lr.read_window(cc_env.prj_core_rast, grid, window,
+                                  npy.float64),
+                   lr.read_window(cc_env.prj_climate_rast, grid, window,
+                                  npy.float64))
 
-        srows = arcpy.SearchCursor(cc_env.prj_core_fc, "", "",
-                                   cc_env.core_fld, cc_env.core_fld + " A")
+    return lg.zone_stats(tiles())
 
-        cores_list = [srow.getValue(cc_env.core_fld) for srow in srows]
-        cores_product = list(itertools.combinations(cores_list, 2))
 
-        lm_util.gprint("There are " + str(len(cores_list)) + " unique "
-                       "cores and " + str(len(cores_product)) + " pairings")
+def create_pair_tbl(climate_stats):
+    """Create core pairs and limit to climate threshold.
 
-        irows = arcpy.InsertCursor(cpair_tbl)
-        for nrow in cores_product:
-            outputrow = irows.newRow()
-            outputrow.setValue(FR_COL, int(nrow[0]))
-            outputrow.setValue(TO_COL, int(nrow[1]))
-            irows.insertRow(outputrow)
+    Returns array of (from core, to core) rows, also written to
+    corepairs.csv in the scratch directory.
 
-        return cpair_tbl
+    """
+    lm_util.gprint("\nCREATING CORE PAIRINGS TABLE")
+    core_ids, umin2std = core_climate(climate_stats)
+    num_pairs = len(core_ids) * (len(core_ids) - 1) // 2
+    lm_util.gprint("There are " + str(len(core_ids)) + " unique "
+                   "cores and " + str(num_pairs) + " pairings")
 
-    except Exception:
-        raise
+    lm_util.gprint("\nLIMITING CORE PAIRS BASED UPON CLIMATE "
+                   "THRESHOLD")
+    pairs = limit_cores(core_ids, umin2std, cc_env.climate_threshold)
+    lm_util.gprint(str(num_pairs - len(pairs)) + " rows deleted")
+
+    npy.savetxt(os.path.join(cc_env.scratch_dir, "corepairs.csv"), pairs,
+                fmt="%d", delimiter=",", header=FR_COL + "," + TO_COL)
+    return pairs
+
+
+def core_climate(climate_stats):
+    """Get each core's mean minus 2 std of climate from zonal statistics.
+
+    climate_stats -- ZoneStats of climate by core
+    Returns sorted array of core ids and array of values, NaN for cores
+    without statistics.
+
+    """
+    srows = None
+    try:
+        srows = arcpy.SearchCursor(cc_env.prj_core_fc, "", "",
+                                   cc_env.core_fld)
+        core_ids = npy.unique([int(srow.getValue(cc_env.core_fld))
+                               for srow in srows])
     finally:
         if srows:
             del srows
-        if outputrow:
-            del outputrow
-        if irows:
-            del irows
 
+    umin2std = npy.full(len(core_ids), npy.nan)
+    zones = climate_stats.zones.astype(npy.int64)
+    core = npy.searchsorted(core_ids, zones)
+    found = core < len(core_ids)
+    found[found] = core_ids[core[found]] == zones[found]
+    umin2std[core[found]] = (climate_stats.mean[found] -
+                             2 * climate_stats.std[found])
+    return core_ids, umin2std
 
-def limit_cores(pair_tbl, stats_tbl):
-    """Limit core pairs based upon climate threshold."""
-    pair_vw = "dist_tbvw"
-    stats_vw = "stats_tbvw"
-    core_id = cc_env.core_fld.upper()
 
-    lm_util.gprint("\nLIMITING CORE PAIRS BASED UPON CLIMATE "
-                   "THRESHOLD")
+def limit_cores(core_ids, umin2std, threshold):
+    """Limit core pairs to those differing in climate by over threshold.
+
+    Cores are sorted by climate value. For each core, the first core more
+    than threshold above it only moves forward along the sorted cores, so
+    the pairs are found in O(n log n + pairs) without comparing every
+    pair. As with the former table join, cores without climate statistics
+    are paired with all other cores. Returns array of (from core, to core)
+    rows with from core < to core, sorted.
 
-    arcpy.MakeTableView_management(pair_tbl, pair_vw)
-    arcpy.MakeTableView_management(stats_tbl, stats_vw)
-
-    # Add basic stats to distance table
-    lm_util.gprint("Joining zonal statistics to pairings table")
-    arcpy.AddIndex_management(pair_vw, FR_COL, "fridx")
-    arcpy.AddIndex_management(pair_vw, TO_COL, "toidx")
-    arcpy.AddIndex_management(stats_vw, core_id, "coreidx")
-    add_stats(stats_vw, core_id, "fr", pair_vw, TO_COL)
-    add_stats(stats_vw, core_id, "to", pair_vw, FR_COL)
-
-    # Calculate difference of 2 std
-    lm_util.gprint("Calculating difference of 2 std")
-    diffu_2std = "diffu_2std"
-    arcpy.AddField_management(pair_vw, diffu_2std, "Float", "", "",
-                              "", "", "NULLABLE")
-    arcpy.CalculateField_management(pair_vw, diffu_2std,
-                                    "abs(!frumin2std! - !toumin2std!)",
-                                    "PYTHON_9.3")
-
-    # Filter distance table based on inputed threshold and delete rows
-    lm_util.gprint("Filtering table based on threshold")
-    diffu2std_fld = arcpy.AddFieldDelimiters(pair_vw, diffu_2std)
-    expression = diffu2std_fld + " <= " + str(cc_env.climate_threshold)
-    arcpy.SelectLayerByAttribute_management(pair_vw, "NEW_SELECTION",
-                                            expression)
-    rows_del = int(arcpy.GetCount_management(pair_vw).getOutput(0))
-    if rows_del > 0:
-        arcpy.DeleteRows_management(pair_vw)
-    lm_util.gprint(str(rows_del) + " rows deleted")
-
-
-def add_stats(stats_vw, core_id, fld_pre, table_vw, join_col):
-    """Add zonal and calculated statistics to stick table."""
-    tmp_mea = fld_pre + "_tmp_mea"
-    tmp_std = fld_pre + "_tmp_std"
-    umin2std = fld_pre + "umin2std"
-
-    # Add fields to stick table - has to be done before join
-    arcpy.AddField_management(table_vw, tmp_mea, "Float", "", "",
-                              "", "", "NULLABLE")
-    arcpy.AddField_management(table_vw, tmp_std, "Float", "", "",
-                              "", "", "NULLABLE")
-    arcpy.AddField_management(table_vw, umin2std, "Float", "", "",
-                              "", "", "NULLABLE")
-
-    # Join distance table to zonal stats table
-    arcpy.AddJoin_management(table_vw, join_col, stats_vw, core_id)
-
-    tbl_name = arcpy.Describe(table_vw).baseName
-    stats_tbl_nm = arcpy.Describe(stats_vw).baseName
-
-    # Insert values into fields
-    mean_value = "!" + stats_tbl_nm + ".MEAN" + "!"
-    std_value = "!" + stats_tbl_nm + ".STD" + "!"
-    mea_fld = "!" + tbl_name + "." + tmp_mea + "!"
-    std_fld = "!" + tbl_name + "." + tmp_std + "!"
-
-    arcpy.CalculateField_management(table_vw, tmp_mea, mean_value,
-                                    "PYTHON_9.3")
-    arcpy.CalculateField_management(table_vw, tmp_std, std_value,
-                                    "PYTHON_9.3")
-    expression = mea_fld + " - " + std_fld + " - " + std_fld
-    arcpy.CalculateField_management(table_vw, umin2std, expression,
-                                    "PYTHON_9.3")
-
-    # Remove join
-    arcpy.RemoveJoin_management(table_vw, stats_tbl_nm)
+    """
+    has_stats = ~npy.isnan(umin2std)
+    order = npy.argsort(umin2std[has_stats], kind="mergesort")
+    values = umin2std[has_stats][order]
+    ids = core_ids[has_stats][order]
+
+    # Pair each core with all cores from the first above value + threshold
+    starts = npy.searchsorted(values, values + threshold, side="right")
+    counts = len(values) - starts
+    lower = npy.repeat(npy.arange(len(values)), counts)
+    offsets = npy.arange(counts.sum()) - npy.repeat(
+        npy.cumsum(counts) - counts, counts)
+    upper = npy.repeat(starts, counts) + offsets
+    frm = [ids[lower]]
+    to = [ids[upper]]
+
+    # Cores without statistics
+    no_stats = core_ids[~has_stats]
+    if len(no_stats):
+        others = npy.tile(core_ids, len(no_stats))
+        missing = npy.repeat(no_stats, len(core_ids))
+        keep = (others != missing) & ~(npy.isin(others, no_stats) &
+                                       (others < missing))
+        frm.append(missing[keep])
+        to.append(others[keep])
+
+    frm = npy.concatenate(frm)
+    to = npy.concatenate(to)
+    pairs = npy.column_stack((npy.minimum(frm, to), npy.maximum(frm, to)))
+    if not len(pairs):
+        return pairs
+    keys = pairs[:, 0].astype(npy.int64) * (int(core_ids.max()) + 1)
+    return pairs[npy.argsort(keys + pairs[:, 1])]
 
 
 def process_pairings(pairings):
@@ -359,118 +388,78 @@ def process_pairings(pairings):
 
     if cc_env.simplify_cores:
         core_simp = simplify_corefc()
-        core_list = create_lnk_tbl(core_simp,
-                                   *pairs_from_list(pairings))
+        core_list = create_lnk_tbl(core_simp, pairings)
     else:
-        core_list = create_lnk_tbl(cc_env.prj_core_fc,
-                                   *pairs_from_list(pairings))
+        core_list = create_lnk_tbl(cc_env.prj_core_fc, pairings)
 
     return sorted(core_list)
 
 
-def pairs_from_list(pairings):
-    """Get list of core pairings and 'from cores'."""
-    frm_cores = set()
-    core_pairs = []
-    srows = arcpy.SearchCursor(pairings, "", "", FR_COL + "; " + TO_COL)
-    for srow in srows:
-        from_core = srow.getValue(FR_COL)
-        to_core = str(srow.getValue(TO_COL))
-        frm_cores.add(from_core)
-        core_pairs.append([str(from_core), to_core])
-    frm_cores = [str(x) for x in frm_cores]
-    return core_pairs, frm_cores
-
-
-def create_lnk_tbl(corefc, core_pairs, frm_cores):
-    """Create link table file and limit based on near table results."""
-    # Temporary query layers
-    fcore_vw = "fcore_vw"
-    tcore_vw = "tcore_vw"
-
-    # No output if near table in gdb need to use dbf instead
-    near_tbl = os.path.join(cc_env.scratch_dir, "neartbl.dbf")
-    jtocore_fn = cc_env.core_fld[:8] + "_1"  # dbf field length
-
-    link_file = os.path.join(lm_env.DATAPASSDIR, "linkTable_s2.csv")
+def core_boundaries(corefc):
+    """Read the boundary of each core in corefc.
 
-    link_tbl, srow, srows = None, None, None
+    Returns dict of core id: cc_near Boundary.
 
+    """
+    rings = {}
+    shape_fld = arcpy.Describe(corefc).shapeFieldName
+    srows = None
     try:
-        link_tbl = open(link_file, 'w')
-        writer = csv.writer(link_tbl, delimiter=',')
-        headings = ["# link", "coreId1", "coreId2", "cluster1", "cluster2",
-                    "linkType", "eucDist", "lcDist", "eucAdj", "cwdAdj"]
-        writer.writerow(headings)
-
-        core_list = set()
-        no_cores = str(len(frm_cores))
-        i = 1
-
-        coreid_fld = arcpy.AddFieldDelimiters(corefc, cc_env.core_fld)
-        oid_fld = arcpy.Describe(corefc).oidFieldName
-
-        for core_no, frm_core in enumerate(frm_cores):
-            # From cores
-            expression = coreid_fld + " = " + frm_core
-            arcpy.MakeFeatureLayer_management(corefc, fcore_vw, expression)
-
-            # To cores
-            to_cores_lst = [x[1] for x in core_pairs if frm_core == x[0]]
-            to_cores = ', '.join(to_cores_lst)
-            expression = coreid_fld + " in (" + to_cores + ")"
-            arcpy.MakeFeatureLayer_management(corefc, tcore_vw, expression)
-
-            lm_util.gprint("Calculating Euclidean distance/s from Core " +
-                           frm_core + " to " + str(len(to_cores_lst)) +
-                           " other cores" + " (" + str(core_no + 1) + "/" +
-                           no_cores + ")")
-
-            # Generate near table for these core pairings
-            arcpy.GenerateNearTable_analysis(
-                fcore_vw, tcore_vw, near_tbl,
-                cc_env.max_euc_dist, "NO_LOCATION", "NO_ANGLE", "ALL")
-
-            # Join near table to core table
-            arcpy.JoinField_management(near_tbl, "IN_FID", corefc,
-                                       oid_fld, cc_env.core_fld)
-            arcpy.JoinField_management(near_tbl, "NEAR_FID", corefc,
-                                       oid_fld, cc_env.core_fld)
-
-            # Limit pairings based on inputed Euclidean distances
-            srow, srows = None, None
-            euc_dist_fld = arcpy.AddFieldDelimiters(near_tbl, "NEAR_DIST")
-            expression = (euc_dist_fld + " > " + str(cc_env.min_euc_dist))
-            srows = arcpy.SearchCursor(
-                near_tbl, where_clause=expression,
-                fields=jtocore_fn + "; NEAR_DIST",
-                sort_fields=jtocore_fn + " A; NEAR_DIST A")
-
-            # Process near table and output into a link table
-            srow = next(srows)
-            if srow:
-                core_list.add(int(frm_core))
-                while srow:
-                    to_coreid = srow.getValue(jtocore_fn)
-                    dist_value = srow.getValue("NEAR_DIST")
-                    writer.writerow([i, frm_core, to_coreid, -1, -1, 1,
-                                     dist_value, -1, -1, -1])
-                    core_list.add(to_coreid)
-                    srow = next(srows)
-                    i += 1
-
-    except Exception:
-        raise
+        srows = arcpy.SearchCursor(corefc, "", "",
+                                   cc_env.core_fld + "; " + shape_fld)
+        for srow in srows:
+            core_rings = rings.setdefault(int(srow.getValue(cc_env.core_fld)),
+                                          [])
+            for part in srow.getValue(shape_fld):
+                ring = []
+                for pnt in part:
+                    if pnt is None:  # Start of an interior ring
+                        core_rings.append(ring)
+                        ring = []
+                    else:
+                        ring.append((pnt.X, pnt.Y))
+                core_rings.append(ring)
     finally:
-        lm_util.delete_data(near_tbl)
-        if link_tbl:
-            link_tbl.close()
-        if srow:
-            del srow
         if srows:
             del srows
+    return dict((core, cn.core_boundary(core_rings))
+                for core, core_rings in rings.items()
+                if any(len(ring) > 1 for ring in core_rings))
+
+
+def create_lnk_tbl(corefc, pairings):
+    """Create link table file and limit based on core distances.
+
+    Distances are the shortest between core boundaries, as from
+    GenerateNearTable, found with spatial indexes over each core's
+    vertices for the climate qualified pairs only. Pairs further apart
+    than the maximum Euclidean distance are skipped. Returns set of cores
+    in the link table.
+
+    """
+    link_file = os.path.join(lm_env.DATAPASSDIR, "linkTable_s2.csv")
 
-    return core_list
+    lm_util.gprint("Calculating Euclidean distances between " +
+                   str(len(pairings)) + " core pairs")
+    boundaries = core_boundaries(corefc)
+    max_dist = cc_env.max_euc_dist if cc_env.max_euc_dist > 0 else None
+    dists = cn.pair_distances(boundaries, pairings[:, 0], pairings[:, 1],
+                              max_dist)
+
+    # Limit pairings based on inputed Euclidean distances
+    keep = npy.isfinite(dists) & (dists > cc_env.min_euc_dist)
+    links = pairings[keep]
+    link_tbl = npy.full((len(links), 10), -1.0)
+    link_tbl[:, 0] = npy.arange(1, len(links) + 1)
+    link_tbl[:, 1:3] = links
+    link_tbl[:, 5] = 1
+    link_tbl[:, 6] = dists[keep]
+    npy.savetxt(link_file, link_tbl, delimiter=",",
+                fmt=["%d"] * 6 + ["%.15g"] + ["%d"] * 3,
+                header="link,coreId1,coreId2,cluster1,cluster2,linkType,"
+                       "eucDist,lcDist,eucAdj,cwdAdj", comments="# ")
+
+    return set(links.ravel().tolist())
 
 
 def simplify_corefc():
@@ -0,0 +1,194 @@
+"""Euclidean distances between core area boundaries.
+
+Each core's boundary is held as line segments with k-d trees over its
+vertices and segment midpoints, so the distance between two cores only
+compares vertices and segments near the closest approach rather than all
+of them. Distances match GenerateNearTable for polygons: the shortest
+distance between boundaries, or 0 where cores touch, overlap or one lies
+within the other. cc_main reads the core rings from the core feature
+class and passes them in as arrays.
+
+"""
+
+from collections import namedtuple
+
+import numpy as npy
+from scipy.spatial import cKDTree
+
+# start, end -- arrays of segment end points, one row per segment
+# vertices -- array of unique boundary vertices
+# vertex_tree, mid_tree -- k-d trees over vertices and segment midpoints
+# half_len -- half the length of the longest segment
+# extent -- (xmin, ymin, xmax, ymax)
+Boundary = namedtuple('Boundary', 'start end vertices vertex_tree mid_tree '
+                                  'half_len extent')
+
+
+def core_boundary(rings):
+    """Return Boundary of a core from its rings.
+
+    rings -- list of arrays of (x, y) vertices, one per polygon ring, each
+             closed or not
+    """
+    starts, ends = [], []
+    for ring in rings:
+        ring = npy.asarray(ring, dtype=npy.float64)
+        if len(ring) < 2:
+            continue
+        if not npy.array_equal(ring[0], ring[-1]):
+            ring = npy.vstack((ring, ring[:1]))
+        starts.append(ring[:-1])
+        ends.append(ring[1:])
+    start = npy.concatenate(starts)
+    end = npy.concatenate(ends)
+    vertices = npy.unique(start, axis=0)
+    half_len = 0.5 * npy.sqrt(((end - start) ** 2).sum(axis=1)).max()
+    return Boundary(start, end, vertices, cKDTree(vertices),
+                    cKDTree(0.5 * (start + end)), half_len,
+                    npy.concatenate((vertices.min(axis=0),
+                                     vertices.max(axis=0))))
+
+
+def extent_distance(extents1, extents2):
+    """Return distances between extents, a lower bound on core distances.
+
+    extents1, extents2 -- arrays of (xmin, ymin, xmax, ymax) rows
+    """
+    gap_x = npy.maximum(0, npy.maximum(extents1[:, 0] - extents2[:, 2],
+                                       extents2[:, 0] - extents1[:, 2]))
+    gap_y = npy.maximum(0, npy.maximum(extents1[:, 1] - extents2[:, 3],
+                                       extents2[:, 1] - extents1[:, 3]))
+    return npy.hypot(gap_x, gap_y)
+
+
+def point_segment_distance(points, start, end):
+    """Return distances from points to segments, row by row."""
+    seg = end - start
+    seg_len2 = (seg ** 2).sum(axis=1)
+    with npy.errstate(invalid='ignore', divide='ignore'):
+        frac = ((points - start) * seg).sum(axis=1) / seg_len2
+    frac = npy.clip(npy.nan_to_num(frac), 0, 1)
+    closest = start + frac[:, None] * seg
+    return npy.sqrt(((points - closest) ** 2).sum(axis=1))
+
+
+def segments_cross(start1, end1, start2, end2):
+    """Return whether segments intersect, row by row."""
+    def orient(a, b, c):
+        return npy.sign((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) -
+                        (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]))
+
+    def on_segment(a, b, c):
+        # c collinear with a, b and within their extent
+        return ((npy.minimum(a[:, 0], b[:, 0]) <= c[:, 0]) &
+                (c[:, 0] <= npy.maximum(a[:, 0], b[:, 0])) &
+                (npy.minimum(a[:, 1], b[:, 1]) <= c[:, 1]) &
+                (c[:, 1] <= npy.maximum(a[:, 1], b[:, 1])))
+
+    o1 = orient(start1, end1, start2)
+    o2 = orient(start1, end1, end2)
+    o3 = orient(start2, end2, start1)
+    o4 = orient(start2, end2, end1)
+    return (((o1 != o2) & (o3 != o4)) |
+            ((o1 == 0) & on_segment(start1, end1, start2)) |
+            ((o2 == 0) & on_segment(start1, end1, end2)) |
+            ((o3 == 0) & on_segment(start2, end2, start1)) |
+            ((o4 == 0) & on_segment(start2, end2, end1)))
+
+
+def inside(point, boundary):
+    """Return whether point lies inside boundary's rings (even-odd rule)."""
+    start, end = boundary.start, boundary.end
+    straddles = (start[:, 1] > point[1]) != (end[:, 1] > point[1])
+    start, end = start[straddles], end[straddles]
+    cross_x = start[:, 0] + ((point[1] - start[:, 1]) *
+                             (end[:, 0] - start[:, 0]) /
+                             (end[:, 1] - start[:, 1]))
+    return bool(npy.count_nonzero(cross_x > point[0]) % 2)
+
+
+def vertex_segment_distance(boundary1, boundary2, upper):
+    """Return shortest distance from boundary1 vertices to boundary2.
+
+    Only vertices and segments that could be closer than upper, the
+    shortest vertex to vertex distance, are compared.
+    """
+    vertex_dist = boundary2.vertex_tree.query(boundary1.vertices)[0]
+    # A vertex is no further than half a segment from the closest point on
+    # that segment
+    near = boundary1.vertices[vertex_dist - boundary2.half_len <= upper]
+    candidates = boundary2.mid_tree.query_ball_point(
+        near, upper + boundary2.half_len)
+    counts = npy.array([len(segs) for segs in candidates])
+    if not counts.sum():
+        return upper
+    points = npy.repeat(near, counts, axis=0)
+    segs = npy.concatenate([segs for segs in candidates if segs]).astype(
+        npy.int64)
+    return min(upper, point_segment_distance(
+        points, boundary2.start[segs], boundary2.end[segs]).min())
+
+
+def boundaries_meet(boundary1, boundary2):
+    """Return whether two cores touch, overlap or one contains the other."""
+    pairs = boundary1.mid_tree.query_ball_tree(
+        boundary2.mid_tree, boundary1.half_len + boundary2.half_len)
+    counts = npy.array([len(segs) for segs in pairs])
+    if counts.sum():
+        segs1 = npy.repeat(npy.arange(len(pairs)), counts)
+        segs2 = npy.concatenate([segs for segs in pairs if segs]).astype(
+            npy.int64)
+        if segments_cross(boundary1.start[segs1], boundary1.end[segs1],
+                          boundary2.start[segs2],
+                          boundary2.end[segs2]).any():
+            return True
+    # No crossing, so either one lies within the other or they are apart
+    return (inside(boundary2.vertices[0], boundary1) or
+            inside(boundary1.vertices[0], boundary2))
+
+
+def core_distance(boundary1, boundary2, max_dist=None):
+    """Return shortest distance between two cores' boundaries.
+
+    Returns inf if the cores are further apart than max_dist.
+    """
+    gap = extent_distance(boundary1.extent[None], boundary2.extent[None])[0]
+    if max_dist is not None and gap > max_dist:
+        return npy.inf
+    if gap == 0 and boundaries_meet(boundary1, boundary2):
+        return 0.0
+
+    upper = boundary2.vertex_tree.query(boundary1.vertices)[0].min()
+    # Closest points are within half a segment of a vertex on each side
+    if (max_dist is not None and
+            upper - boundary1.half_len - boundary2.half_len > max_dist):
+        return npy.inf
+    dist = vertex_segment_distance(boundary1, boundary2, upper)
+    dist = vertex_segment_distance(boundary2, boundary1, dist)
+    if max_dist is not None and dist > max_dist:
+        return npy.inf
+    return dist
+
+
+def pair_distances(boundaries, core1, core2, max_dist=None):
+    """Return distances between pairs of cores.
+
+    boundaries -- dict of core id: Boundary
+    core1, core2 -- arrays of core ids for each pair
+    Pairs further apart than max_dist, or with a core lacking a boundary,
+    are inf. Pairs are first screened on core extents.
+    """
+    dists = npy.full(len(core1), npy.inf)
+    has_both = npy.array([core in boundaries and other in boundaries
+                          for core, other in zip(core1, core2)], dtype=bool)
+    pairs = npy.flatnonzero(has_both)
+    if max_dist is not None and len(pairs):
+        extents1 = npy.array([boundaries[core].extent
+                              for core in core1[pairs]])
+        extents2 = npy.array([boundaries[core].extent
+                              for core in core2[pairs]])
+        pairs = pairs[extent_distance(extents1, extents2) <= max_dist]
+    for pair in pairs:
+        dists[pair] = core_distance(boundaries[core1[pair]],
+                                    boundaries[core2[pair]], max_dist)
+    return dists
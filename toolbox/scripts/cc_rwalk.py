@@ -0,0 +1,121 @@
+"""Anisotropic cost-weighted distance following GRASS r.walk.
+
+Moving between neighboring cells costs walking time from Naismith's rule
+with Langmuir's downhill corrections, plus a friction term:
+
+    a * dist + b * dh                (dh >= 0, uphill)
+    a * dist + c * dh                (slope_factor <= dh / dist < 0)
+    a * dist + d * dh                (dh / dist < slope_factor, steep)
+    + lambda * dist * (friction1 + friction2) / 2
+
+where dist is the distance moved in map units and dh the change in the
+elevation (for Climate Linkage Mapper, climate) surface. Moves are to the 8
+neighboring cells, from the sources outward, so the cost of a move depends
+on its direction. Cells with NoData in either surface are barriers.
+
+The cell graph is built once and shared by all sources, and shortest paths
+are found with SciPy's Dijkstra, so no GRASS session or file exchange is
+needed. Rasters are read and written by the caller.
+
+"""
+
+from collections import namedtuple
+
+import numpy as npy
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# r.walk default walk_coeff a, b, c, d and slope_factor
+WALK_COEFF = (0.72, 6.0, 1.9998, -1.9998)
+SLOPE_FACTOR = -0.2125
+
+# Neighbor offsets (row, col) by ArcGIS back direction code 1 to 8, i.e.
+# east, then clockwise
+BACK_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0),
+                (-1, 1))
+
+# graph -- sparse matrix of move costs between valid cells
+# cells -- flat grid index of each graph node
+# shape -- grid shape
+WalkGraph = namedtuple('WalkGraph', 'graph cells shape')
+
+
+def walk_graph(elevation, friction, cell_size, walk_coeff=WALK_COEFF,
+               slope_factor=SLOPE_FACTOR, lambda_=1.0):
+    """Return WalkGraph of move costs between neighboring cells.
+
+    elevation, friction -- 2D float arrays with NaN for NoData
+    walk_coeff -- (a, b, c, d) as for r.walk
+    Negative move costs, possible with some coefficients, are raised to 0.
+    """
+    elevation = npy.asarray(elevation, dtype=npy.float64)
+    friction = npy.asarray(friction, dtype=npy.float64)
+    a, b, c, d = walk_coeff
+    nrows, ncols = elevation.shape
+    valid = ~npy.isnan(elevation) & ~npy.isnan(friction)
+    cells = npy.flatnonzero(valid)
+    node_of_cell = npy.full(valid.size, -1, dtype=npy.int64)
+    node_of_cell[cells] = npy.arange(len(cells))
+    node_of_cell = node_of_cell.reshape(valid.shape)
+
+    starts, ends, costs = [], [], []
+    for row_off, col_off in BACK_OFFSETS:
+        # Moves from cells in from_win to the neighbor in to_win
+        from_win = (slice(max(0, -row_off), nrows - max(0, row_off)),
+                    slice(max(0, -col_off), ncols - max(0, col_off)))
+        to_win = (slice(max(0, row_off), nrows - max(0, -row_off)),
+                  slice(max(0, col_off), ncols - max(0, -col_off)))
+        both = valid[from_win] & valid[to_win]
+        dist = cell_size * (npy.sqrt(2) if row_off and col_off else 1)
+        dh = elevation[to_win][both] - elevation[from_win][both]
+        slope = dh / dist
+        coeff = npy.where(dh >= 0, b, npy.where(slope < slope_factor, d, c))
+        cost = (a * dist + coeff * dh + lambda_ * dist * 0.5 *
+                (friction[from_win][both] + friction[to_win][both]))
+        starts.append(node_of_cell[from_win][both])
+        ends.append(node_of_cell[to_win][both])
+        costs.append(npy.maximum(cost, 0))
+
+    graph = sparse.csr_matrix(
+        (npy.concatenate(costs),
+         (npy.concatenate(starts), npy.concatenate(ends))),
+        shape=(len(cells), len(cells)))
+    return WalkGraph(graph, cells, elevation.shape)
+
+
+def cwd_back(walk, sources):
+    """Return cost-weighted distance and back direction from sources.
+
+    walk -- WalkGraph
+    sources -- boolean array marking source cells, e.g. a core area
+    Returns float arrays with NaN where cells can't be reached. Back
+    directions use ArcGIS codes: 0 at sources, else 1 to 8 for the
+    neighbor to move to, east then clockwise (see BACK_OFFSETS).
+    """
+    cwd = npy.full(walk.shape, npy.nan)
+    back = npy.full(walk.shape, npy.nan)
+    node_of_cell = npy.full(cwd.size, -1, dtype=npy.int64)
+    node_of_cell[walk.cells] = npy.arange(len(walk.cells))
+    source_nodes = node_of_cell[npy.flatnonzero(sources)]
+    source_nodes = source_nodes[source_nodes >= 0]
+    if not len(source_nodes):
+        return cwd, back
+
+    dist, pred = csgraph.dijkstra(walk.graph, indices=source_nodes,
+                                  min_only=True, return_predecessors=True)[:2]
+    reached = npy.isfinite(dist)
+    cells = walk.cells[reached]
+    cwd.flat[cells] = dist[reached]
+
+    directions = npy.zeros(len(cells))
+    has_pred = pred[reached] >= 0
+    rows, cols = npy.unravel_index(cells[has_pred], walk.shape)
+    pred_rows, pred_cols = npy.unravel_index(
+        walk.cells[pred[reached][has_pred]], walk.shape)
+    # Code of each (row offset + 1, col offset + 1) to the predecessor
+    codes = npy.zeros((3, 3))
+    for code, (row_off, col_off) in enumerate(BACK_OFFSETS, 1):
+        codes[row_off + 1, col_off + 1] = code
+    directions[has_pred] = codes[pred_rows - rows + 1, pred_cols - cols + 1]
+    back.flat[cells] = directions
+    return cwd, back
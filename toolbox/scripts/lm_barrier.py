@@ -0,0 +1,297 @@
+"""Barrier improvement scores for links from cached focal minimums.
+
+Focal minimums of each core's CWD, or with a CWD threshold the CWDs
+themselves, are cached as .npy files and opened memory-mapped, so worker
+processes share them read-only through the page cache. The workers only
+need NumPy, so keep arcpy imports out of this module.
+
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from math import ceil
+
+import numpy as npy
+
+import lm_focal as lf
+import lm_grid as lg
+
+CENTERS = "centers"  # Barrier scores at window centers
+PCT = "pct"  # Scores as percent of link cost-weighted distance
+TRIM = "trim"  # Scores grown to search radius, trimmed to resistance
+
+# nrows, ncols, cell_size -- analysis grid
+# radii -- ascending search radii in map units
+# focal -- dict of core: (window, list of focal .npy files by radius)
+# resist_file -- .npy file of resistance less one, NoData filled, for trims
+# cwd_thresh -- CWD threshold, or None
+# cwd -- dict of core: (window, CWD .npy file), used instead of focal if
+#        cwd_thresh is set
+Settings = namedtuple('Settings', 'nrows ncols cell_size radii sum_barriers '
+                                  'write_pct write_trim focal resist_file '
+                                  'cwd_thresh cwd')
+
+Link = namedtuple('Link', 'core1 core2 lc_dist')
+
+
+def new_results(settings):
+    """Return empty accumulators as dict of result name: {radius: acc}."""
+    method = lg.SUM if settings.sum_barriers else lg.MAXIMUM
+    names = [CENTERS]
+    if settings.write_pct:
+        names.append(PCT)
+    if settings.sum_barriers and settings.write_trim:
+        names.append(TRIM)
+    return dict((name, dict((radius, lg.TiledAccumulator(
+        settings.nrows, settings.ncols, method)) for radius in settings.radii))
+                for name in names)
+
+
+def merge_results(results, other):
+    """Reduce results from another set of links into results."""
+    for name, accs in other.items():
+        for radius, acc in accs.items():
+            results[name][radius].merge(acc)
+
+
+def core_window(core, settings):
+    """Return window of grid covered by a core's CWD."""
+    if settings.cwd_thresh is None:
+        return settings.focal[core][0]
+    return settings.cwd[core][0]
+
+
+def link_window(link, settings):
+    """Return window where both cores have CWD data, or None."""
+    return lg.window_intersect(core_window(link.core1, settings),
+                               core_window(link.core2, settings))
+
+
+def focal_barriers(link, window, settings):
+    """Yield radius and barrier scores over window from cached focals."""
+    window1, files1 = settings.focal[link.core1]
+    window2, files2 = settings.focal[link.core2]
+    for radius, file1, file2 in zip(settings.radii, files1, files2):
+        focal1 = npy.load(file1, mmap_mode='r')[
+            lg.window_slices(window, window1)]
+        focal2 = npy.load(file2, mmap_mode='r')[
+            lg.window_slices(window, window2)]
+
+        # Potential benefit per map unit restored
+        dia = 2 * radius
+        yield radius, (link.lc_dist - focal1 - focal2 - dia) / dia
+
+
+def load_thresh_cwd(core, window, settings):
+    """Load core's CWD over window, NaN outside its data and >= threshold."""
+    core_win, cwd_file = settings.cwd[core]
+    cwd = npy.full((window.nrows, window.ncols), npy.nan, dtype=npy.float32)
+    common = lg.window_intersect(window, core_win)
+    if common is not None:
+        cwd[lg.window_slices(common, window)] = npy.load(
+            cwd_file, mmap_mode='r')[lg.window_slices(common, core_win)]
+    # Mask out areas above CWD threshold
+    with npy.errstate(invalid='ignore'):
+        cwd[~(cwd < settings.cwd_thresh)] = npy.nan
+    return cwd
+
+
+def corridor_barriers(link, window, settings):
+    """Yield radius and barrier scores over window, near the corridor.
+
+    Scores are only found for cells within the search radius of the
+    corridor, where cwd1 + cwd2 - lc_dist is within the CWD threshold. The
+    focal minimums are found at those cells only. Other cells are NaN.
+    """
+    cell_size = settings.cell_size
+    full_window = lg.Window(0, 0, settings.nrows, settings.ncols)
+    read_window = lg.window_buffer(
+        window, int(settings.radii[-1] / cell_size) + 1, full_window)
+    cwd1 = load_thresh_cwd(link.core1, read_window, settings)
+    cwd2 = load_thresh_cwd(link.core2, read_window, settings)
+    window_slices = lg.window_slices(window, read_window)
+    with npy.errstate(invalid='ignore'):
+        corridor = npy.where(
+            npy.load(settings.cwd[link.core1][1], mmap_mode='r')[
+                lg.window_slices(window, settings.cwd[link.core1][0])]
+            + npy.load(settings.cwd[link.core2][1], mmap_mode='r')[
+                lg.window_slices(window, settings.cwd[link.core2][0])]
+            - link.lc_dist <= settings.cwd_thresh, 1, npy.nan).astype(
+                npy.float32)
+
+    for radius in settings.radii:
+        barrier = npy.full((window.nrows, window.ncols), npy.nan,
+                           dtype=npy.float32)
+        rows, cols = npy.nonzero(~npy.isnan(
+            lf.circle_max(corridor, radius / cell_size)))
+        if rows.size:
+            segments = lf.annulus_segments((radius - 1) / cell_size,
+                                           radius / cell_size)
+            rows_read = rows + window_slices[0].start
+            cols_read = cols + window_slices[1].start
+            focal1 = lf.focal_reduce_at(cwd1, segments, lg.MINIMUM,
+                                        rows_read, cols_read)
+            focal2 = lf.focal_reduce_at(cwd2, segments, lg.MINIMUM,
+                                        rows_read, cols_read)
+
+            # Potential benefit per map unit restored
+            dia = 2 * radius
+            barrier[rows, cols] = (link.lc_dist - focal1 - focal2 - dia) / dia
+        yield radius, barrier
+
+
+def link_results(link, settings):
+    """Calculate barrier scores for a link at each search radius.
+
+    Yields (result name, radius, window, array).
+    """
+    window = link_window(link, settings)
+    if window is None:
+        return
+    cell_size = settings.cell_size
+    trim = settings.sum_barriers and settings.write_trim
+    if trim:
+        trim_window = lg.window_buffer(
+            window, int(settings.radii[-1] / cell_size),
+            lg.Window(0, 0, settings.nrows, settings.ncols))
+        resist = npy.load(settings.resist_file, mmap_mode='r')
+
+    if settings.cwd_thresh is None:
+        barriers = focal_barriers(link, window, settings)
+    else:
+        barriers = corridor_barriers(link, window, settings)
+    for radius, barrier in barriers:
+        if settings.sum_barriers:
+            # Need to set nulls and negative values to 0
+            with npy.errstate(invalid='ignore'):
+                barrier[~(barrier > 0)] = 0
+        yield CENTERS, radius, window, barrier
+
+        if settings.write_pct:
+            # Calculate % potential benefit per unit restored
+            yield PCT, radius, window, 100 * (barrier / link.lc_dist)
+
+        if trim:
+            # Fill out search radius, then allow each cell to only
+            # contribute its resistance value to restoration gain. Only
+            # cells with positive scores need growing out.
+            fill_window = lg.window_buffer(window, int(radius / cell_size),
+                                           trim_window)
+            fill = npy.full((fill_window.nrows, fill_window.ncols), npy.nan,
+                            dtype=npy.float32)
+            fill[lg.window_slices(window, fill_window)] = npy.where(
+                barrier > 0, barrier, npy.nan)
+            fill = lf.circle_max(fill, radius / cell_size)
+            fill[npy.isnan(fill)] = 0
+            npy.fmin(fill, resist[lg.window_slices(fill_window, lg.Window(
+                0, 0, settings.nrows, settings.ncols))], out=fill)
+            yield TRIM, radius, fill_window, fill
+
+
+def calc_barriers(links, settings):
+    """Return barrier results for links (see new_results).
+
+    Run in worker processes for each cluster of links.
+    """
+    results = new_results(settings)
+    for link in links:
+        for name, radius, window, values in link_results(link, settings):
+            results[name][radius].add(window, values)
+    return results
+
+
+def link_bytes(window, settings):
+    """Return estimated working memory for a link with window."""
+    cells = window.nrows * window.ncols
+    if settings.cwd_thresh is not None or (settings.sum_barriers and
+                                           settings.write_trim):
+        buffer = int(settings.radii[-1] / settings.cell_size)
+        cells = (window.nrows + 2 * buffer) * (window.ncols + 2 * buffer)
+    # Focal views, barrier, pct and circle fill temporaries
+    return 4 * cells * 8
+
+
+def result_bytes(window, settings):
+    """Return estimated size of results accumulated over window."""
+    names = len(new_results(settings))
+    return 4 * window.nrows * window.ncols * names * len(settings.radii)
+
+
+def morton_key(window, tile_size=lg.TILE_SIZE):
+    """Return Z-order key of the tile at window center."""
+    row = (window.row + window.nrows // 2) // tile_size
+    col = (window.col + window.ncols // 2) // tile_size
+    key = 0
+    for bit in range(16):
+        key |= ((row >> bit) & 1) << (2 * bit + 1)
+        key |= ((col >> bit) & 1) << (2 * bit)
+    return key
+
+
+def cluster_links(links, settings, num_clusters, max_bytes):
+    """Split links into spatially compact clusters.
+
+    Links are ordered along a Z-order curve by window center, then cut into
+    runs of at most len(links) / num_clusters links whose estimated memory
+    stays within max_bytes. Returns list of (links, estimated bytes).
+    """
+    windows = [(link, link_window(link, settings)) for link in links]
+    windows = sorted([item for item in windows if item[1] is not None],
+                     key=lambda item: morton_key(item[1]))
+    max_links = max(1, int(ceil(len(windows) / float(max(num_clusters, 1)))))
+
+    clusters = []
+    cluster, union, work = [], None, 0
+    for link, window in windows:
+        new_union = window if union is None else lg.window_union(union,
+                                                                 window)
+        new_work = max(work, link_bytes(window, settings))
+        if cluster and (len(cluster) >= max_links or
+                        new_work + result_bytes(new_union, settings)
+                        > max_bytes):
+            clusters.append((cluster, work + result_bytes(union, settings)))
+            cluster, union, work = [], window, link_bytes(window, settings)
+        else:
+            union, work = new_union, new_work
+        cluster.append(link)
+    if cluster:
+        clusters.append((cluster, work + result_bytes(union, settings)))
+    return clusters
+
+
+def run_parallel(links, settings, processes, max_bytes, report=None):
+    """Calculate barrier results for links in worker processes.
+
+    Clusters of links are admitted to the pool while their estimated
+    memory fits within max_bytes, so a few large links don't exhaust
+    memory while small ones keep the other workers busy. Clusters bigger
+    than max_bytes run when nothing else is running. Worker results are
+    merged as they complete. report(links done, total links) is called
+    after each cluster.
+    """
+    results = new_results(settings)
+    queue = cluster_links(links, settings, 4 * processes,
+                          max_bytes // max(processes, 1))
+    total = sum(len(cluster) for cluster, cluster_bytes in queue)
+    done = 0
+    pending = {}
+    with ProcessPoolExecutor(processes) as executor:
+        while queue or pending:
+            in_use = sum(item[1] for item in pending.values())
+            for item in list(queue):
+                if len(pending) >= processes:
+                    break
+                if pending and in_use + item[1] > max_bytes:
+                    continue
+                queue.remove(item)
+                future = executor.submit(calc_barriers, item[0], settings)
+                pending[future] = item
+                in_use += item[1]
+            finished = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for future in finished:
+                cluster = pending.pop(future)[0]
+                merge_results(results, future.result())
+                done += len(cluster)
+                if report is not None:
+                    report(done, total)
+    return results
@@ -0,0 +1,737 @@
+"""Current flow through core networks and resistance grids, in process.
+
+Circuits are solved with SciPy sparse matrices instead of calling
+Circuitscape. Link jobs are handed to worker processes as .npy files, and
+the workers import this module, so it must not import arcpy.
+
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from math import sqrt
+import time
+import tracemalloc
+
+import numpy as npy
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse import linalg as splinalg
+
+BLOCK_SIZE = 256  # Right-hand sides or edges handled per block
+CG_TOL = 1e-6  # Relative residual for conjugate gradient solves
+SOLVE_BLOCK = 16  # Right-hand sides solved together on resistance grids
+DIRECT_MAX_NODES = 2000000  # Largest system factored, larger ones use CG
+
+# current -- current through each cell, NaN where resistance is NoData
+# voltage -- voltage of each cell with the second terminal at 0 volts
+# resistance -- effective resistance between terminals, in resistance
+#               units per cell, or inf if they are not connected
+# solver_bytes -- memory held by the sparse factor, which tracemalloc
+#                 doesn't see
+RasterResult = namedtuple('RasterResult',
+                          'current voltage resistance solver_bytes')
+
+PAIRWISE = 'pairwise'
+ALL_TO_ONE = 'all-to-one'
+
+# current -- cumulative current through each cell, NaN where resistance
+#            is NoData
+# core_ids -- ids of cores, in order of resistances rows and columns
+# resistances -- effective resistances between pairs of cores
+AllPairsResult = namedtuple('AllPairsResult', 'current core_ids resistances')
+
+BYTES_PER_NODE = 2000  # Solver working memory per grid node, until fitted
+
+# Largest link network whose dense inverses (8 bytes per pair of cores in a
+# component) are saved between centrality runs
+STATE_MAX_NODES = 5000
+# Low-rank updates to a component's inverse before it is found again from
+# scratch, so rounding errors don't build up over runs
+MAX_UPDATES = 20
+
+# Link circuit saved to disk for solving in a worker process
+# res_file, core_file -- .npy files of resistance and core id arrays
+# out_file -- .npz file to save current and voltage arrays to
+# nodes -- number of grid cells with resistance data
+LinkJob = namedtuple('LinkJob', 'link_id core1 core2 res_file core_file '
+                                'out_file nodes')
+
+
+def factor_spd(matrix):
+    """Return sparse LU factor of a symmetric positive definite matrix.
+
+    Uses a symmetric fill-reducing ordering and no pivoting, so the factor
+    is the Cholesky factor up to diagonal scaling and solves are a pair of
+    sparse triangular solves.
+    """
+    return splinalg.splu(sparse.csc_matrix(matrix),
+                         permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0,
+                         options={'SymmetricMode': True})
+
+
+def laplacian(ends, conductance, num_nodes):
+    """Return weighted graph Laplacian as CSC matrix.
+
+    ends -- (edges, 2) array of node indices
+    conductance -- conductance of each edge
+    Parallel edges add. Self loops and edges without conductance are
+    ignored.
+    """
+    keep = (ends[:, 0] != ends[:, 1]) & (conductance > 0)
+    row, col = ends[keep, 0], ends[keep, 1]
+    cond = conductance[keep]
+    adjacency = sparse.coo_matrix(
+        (npy.concatenate((cond, cond)),
+         (npy.concatenate((row, col)), npy.concatenate((col, row)))),
+        shape=(num_nodes, num_nodes)).tocsc()
+    degree = npy.asarray(adjacency.sum(axis=1)).ravel()
+    return (sparse.diags(degree) - adjacency).tocsc()
+
+
+def pair_abs_sums(values):
+    """Return sum over pairs s < t of |values[s] - values[t]| for each row.
+
+    Sorting each row gives the sum as a weighted sum of the sorted values.
+    """
+    num = values.shape[1]
+    weights = 2 * npy.arange(num) - num + 1
+    return npy.sort(values, axis=1).dot(weights)
+
+
+def pcg(matrix, rhs, tol=CG_TOL, maxiter=None):
+    """Solve symmetric positive definite system by preconditioned CG.
+
+    Uses a Jacobi (diagonal) preconditioner. rhs may be a 2D array, with
+    each column solved independently in the same iterations. Raises
+    RuntimeError if the solve doesn't converge in maxiter iterations.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    inv_diag = 1.0 / matrix.diagonal()
+    vector = rhs.ndim == 1
+    rhs = rhs.reshape(len(rhs), -1)
+    if maxiter is None:
+        maxiter = 10 * len(rhs) + 100
+    inv_diag = inv_diag[:, npy.newaxis]
+    solution = npy.zeros(rhs.shape)
+    resid = rhs.astype(npy.float64)
+    target = tol * npy.sqrt((rhs * rhs).sum(axis=0))
+    precond = inv_diag * resid
+    direction = precond.copy()
+    rho = (resid * precond).sum(axis=0)
+    for dummy in range(maxiter):
+        active = npy.sqrt((resid * resid).sum(axis=0)) > target
+        if not active.any():
+            break
+        product = matrix.dot(direction)
+        curvature = (direction * product).sum(axis=0)
+        alpha = npy.where(active, rho / npy.where(active, curvature, 1), 0)
+        solution += alpha * direction
+        resid -= alpha * product
+        precond = inv_diag * resid
+        new_rho = (resid * precond).sum(axis=0)
+        beta = npy.where(active, new_rho / npy.where(active, rho, 1), 0)
+        direction = precond + beta * direction
+        rho = new_rho
+    else:
+        raise RuntimeError('Conjugate gradient solve did not converge in '
+                           + str(maxiter) + ' iterations')
+    return solution[:, 0] if vector else solution
+
+
+def spd_solver(matrix, tol=CG_TOL):
+    """Return solver for a symmetric positive definite system.
+
+    Systems of up to DIRECT_MAX_NODES unknowns are factored once (see
+    factor_spd), so each right-hand side costs a pair of triangular solves.
+    Larger systems are solved with pcg. Returns function of right-hand
+    sides returning solutions, and bytes held by the factor.
+    """
+    if matrix.shape[0] <= DIRECT_MAX_NODES:
+        factor = factor_spd(matrix)
+        # Values and row indices
+        return factor.solve, 12 * factor.nnz
+    matrix = sparse.csr_matrix(matrix)
+    return (lambda rhs: pcg(matrix, rhs, tol)), 0
+
+
+def grid_edges(resistance, four_neighbors=False, avg_resistances=True):
+    """Return cell neighbor pairs and conductances of a resistance grid.
+
+    Follows Circuitscape's raster connection scheme: cells are joined to
+    their 8 (or 4) neighbors with NoData (NaN) cells left out, and each
+    connection gets the inverse of the average of the two resistances, or
+    the average of the two conductances, divided by the distance between
+    cell centers in cells. Returns (cell1, cell2, conductance), with cells
+    as flat indices.
+    """
+    nrows, ncols = resistance.shape
+    valid = ~npy.isnan(resistance)
+    offsets = [(0, 1, 1.0), (1, 0, 1.0)]
+    if not four_neighbors:
+        offsets += [(1, 1, sqrt(2)), (1, -1, sqrt(2))]
+    cells = npy.arange(nrows * ncols).reshape(nrows, ncols)
+    cell1, cell2, cond = [], [], []
+    for row_off, col_off, dist in offsets:
+        col_start, col_end = max(0, -col_off), ncols - max(0, col_off)
+        from_slice = (slice(0, nrows - row_off), slice(col_start, col_end))
+        to_slice = (slice(row_off, nrows),
+                    slice(col_start + col_off, col_end + col_off))
+        joined = valid[from_slice] & valid[to_slice]
+        res1 = resistance[from_slice][joined]
+        res2 = resistance[to_slice][joined]
+        if avg_resistances:
+            cond.append(1.0 / (dist * (res1 + res2) / 2.0))
+        else:
+            cond.append((1.0 / res1 + 1.0 / res2) / (2.0 * dist))
+        cell1.append(cells[from_slice][joined])
+        cell2.append(cells[to_slice][joined])
+    return (npy.concatenate(cell1), npy.concatenate(cell2),
+            npy.concatenate(cond))
+
+
+def grid_circuit(resistance, terminals, four_neighbors=False,
+                 avg_resistances=True):
+    """Return circuit of a resistance grid with terminals short-circuited.
+
+    terminals -- integer array giving terminal number 0 to n - 1 for cells
+        of each terminal, e.g. a core, and -1 elsewhere. All valid cells of
+        a terminal are merged into node number terminal, like Circuitscape
+        focal regions. Other valid cells are numbered from n.
+    Returns (node of each cell, flat cell numbers of connections as from
+    grid_edges, connection conductances, (connections, 2) array of node
+    numbers, Laplacian).
+    """
+    valid = (~npy.isnan(resistance)).ravel()
+    terminals = npy.where(valid, terminals.ravel(), -1)
+    num_terminals = int(terminals.max()) + 1 if terminals.size else 0
+    others = valid & (terminals < 0)
+    node_of_cell = npy.where(terminals >= 0, terminals, -1)
+    node_of_cell[others] = num_terminals + npy.arange(others.sum())
+    cell1, cell2, cond = grid_edges(resistance, four_neighbors,
+                                    avg_resistances)
+    ends = npy.column_stack((node_of_cell[cell1], node_of_cell[cell2]))
+    full = laplacian(ends, cond, num_terminals + others.sum())
+    return node_of_cell, (cell1, cell2), cond, ends, full
+
+
+def cell_currents(branch, cells, shape):
+    """Return current through each cell, half that on its connections."""
+    size = shape[0] * shape[1]
+    return ((npy.bincount(cells[0], branch, size) +
+             npy.bincount(cells[1], branch, size)) / 2.0).reshape(shape)
+
+
+def raster_pair_current(resistance, terminal1, terminal2, four_neighbors=False,
+                        avg_resistances=True, tol=CG_TOL):
+    """Pass 1 A between two terminals on a resistance grid.
+
+    resistance -- 2D array of cell resistances, NaN for NoData
+    terminal1, terminal2 -- boolean arrays marking cells of each terminal,
+        e.g. a pair of cores. Cells of a terminal are short-circuited into
+        one node, like Circuitscape focal regions.
+    Terminal 2 is grounded and the other cells solved for (see
+    spd_solver). As with Circuitscape's set_focal_node_currents_to_
+    zero option, current in terminal cells is 0. Returns RasterResult.
+    """
+    resistance = npy.asarray(resistance, dtype=npy.float64)
+    valid = ~npy.isnan(resistance)
+    terminal1 = terminal1 & valid
+    terminal2 = terminal2 & valid & ~terminal1
+    current = npy.where(valid, 0, npy.nan).astype(npy.float32)
+    voltage = current.copy()
+    if not terminal1.any() or not terminal2.any():
+        return RasterResult(current, voltage, npy.inf, 0)
+
+    # Node 0 is terminal 1, node 1 is terminal 2
+    terminals = npy.where(terminal1, 0, npy.where(terminal2, 1, -1))
+    node_of_cell, cells, cond, ends, full = grid_circuit(
+        resistance, terminals, four_neighbors, avg_resistances)
+
+    # Solve only the component joining the terminals
+    labels = csgraph.connected_components(full, directed=False)[1]
+    if labels[0] != labels[1]:
+        return RasterResult(current, voltage, npy.inf, 0)
+    solve_nodes = npy.flatnonzero((labels == labels[0]) &
+                                  (npy.arange(len(labels)) != 1))
+    rhs = npy.zeros(len(solve_nodes))
+    rhs[0] = 1
+    node_voltage = npy.zeros(len(labels))
+    solve, solver_bytes = spd_solver(full[solve_nodes, :][:, solve_nodes],
+                                     tol)
+    node_voltage[solve_nodes] = solve(rhs)
+    del solve
+
+    voltage[valid] = node_voltage[node_of_cell[valid.ravel()]]
+    branch = npy.abs(cond * (node_voltage[ends[:, 0]] -
+                             node_voltage[ends[:, 1]]))
+    current[valid] = cell_currents(branch, cells, valid.shape)[valid]
+    current[terminal1 | terminal2] = 0
+    return RasterResult(current, voltage, node_voltage[0], solver_bytes)
+
+
+def raster_all_pairs(resistance, cores, scenario=PAIRWISE,
+                     four_neighbors=False, avg_resistances=True,
+                     tol=CG_TOL):
+    """Return cumulative current among all cores on a resistance grid.
+
+    resistance -- 2D array of cell resistances, NaN for NoData
+    cores -- array of core ids, with NaN or values <= 0 outside cores
+    scenario -- PAIRWISE passes 1 A between each pair of cores. ALL_TO_ONE
+        grounds each core in turn with 1 A entering at every other core.
+    Each core's cells are short-circuited into one node for every solve, so
+    the grid circuit of each connected component is the same for all
+    pairs. It is factored once (see spd_solver) and voltages for a unit
+    source at each core solved in batches, and currents summed over pairs
+    come from those voltages without solving each pair. Only cores in the
+    same component are paired. Current in core cells is 0.
+    Returns AllPairsResult, with resistances -1 for pairs of cores not
+    connected and NaN for all-to-one.
+    """
+    resistance = npy.asarray(resistance, dtype=npy.float64)
+    valid = ~npy.isnan(resistance)
+    with npy.errstate(invalid='ignore'):
+        in_core = valid & (cores > 0)
+    core_ids = npy.unique(cores[in_core])
+    terminals = npy.full(resistance.shape, -1, dtype=npy.int64)
+    terminals[in_core] = npy.searchsorted(core_ids, cores[in_core])
+    node_of_cell, cells, cond, ends, full = grid_circuit(
+        resistance, terminals, four_neighbors, avg_resistances)
+    num_cores = len(core_ids)
+    resistances = npy.full((num_cores, num_cores), -1.0)
+    npy.fill_diagonal(resistances, 0)
+    branch = npy.zeros(len(cond))
+
+    labels = csgraph.connected_components(full, directed=False)[1]
+    for comp in npy.unique(labels[:num_cores]):
+        comp_cores = npy.flatnonzero(labels[:num_cores] == comp)
+        if len(comp_cores) < 2:
+            continue
+        # Voltages for 1 A entering at each core, the last core grounded
+        nodes = npy.flatnonzero(labels == comp)
+        solve_nodes = nodes[nodes != comp_cores[-1]]
+        local = npy.full(len(labels), -1, dtype=npy.int64)
+        local[nodes] = npy.arange(len(nodes))
+        solve = spd_solver(full[solve_nodes, :][:, solve_nodes], tol)[0]
+        volts = npy.zeros((len(nodes), len(comp_cores)))
+        for start in range(0, len(comp_cores) - 1, SOLVE_BLOCK):
+            end = min(start + SOLVE_BLOCK, len(comp_cores) - 1)
+            rhs = npy.zeros((len(solve_nodes), end - start))
+            rhs[npy.searchsorted(solve_nodes, comp_cores[start:end]),
+                npy.arange(end - start)] = 1
+            volts[local[solve_nodes], start:end] = solve(rhs)
+        del solve
+
+        if scenario == PAIRWISE:
+            core_volts = volts[local[comp_cores]]
+            diag = npy.diag(core_volts)
+            resistances[npy.ix_(comp_cores, comp_cores)] = (
+                diag[:, npy.newaxis] + diag[npy.newaxis, :] -
+                core_volts - core_volts.T)
+
+        # Sum current on connections over all pairs, a block at a time
+        edges = npy.flatnonzero((labels[ends[:, 0]] == comp) &
+                                (ends[:, 0] != ends[:, 1]))
+        block_size = max(BLOCK_SIZE, 2 ** 20 // len(comp_cores))
+        num = len(comp_cores)
+        for start in range(0, len(edges), block_size):
+            block = edges[start:start + block_size]
+            drops = (volts[local[ends[block, 0]]] -
+                     volts[local[ends[block, 1]]])
+            if scenario == PAIRWISE:
+                branch[block] = cond[block] * pair_abs_sums(drops)
+            else:
+                # Ground at core g: sum of drops for all cores less num
+                # times drop for core g
+                total = drops.sum(axis=1)[:, npy.newaxis]
+                branch[block] = cond[block] * npy.abs(
+                    total - num * drops).sum(axis=1)
+
+    current = npy.where(valid, 0, npy.nan).astype(npy.float32)
+    current[valid] = cell_currents(branch, cells, valid.shape)[valid]
+    current[in_core] = 0
+    if scenario != PAIRWISE:
+        resistances[:] = npy.nan
+    return AllPairsResult(current, core_ids, resistances)
+
+
+def solve_link_job(job):
+    """Solve a link circuit between its cores, saving currents to out_file.
+
+    Returns (link id, effective resistance, seconds taken, bytes held by
+    the sparse factor).
+    """
+    start_time = time.time()
+    resistance = npy.load(job.res_file)
+    cores = npy.load(job.core_file)
+    result = raster_pair_current(resistance, cores == job.core1,
+                                 cores == job.core2)
+    del resistance, cores
+    npy.savez(job.out_file, current=result.current, voltage=result.voltage)
+    return (job.link_id, result.resistance, time.time() - start_time,
+            result.solver_bytes)
+
+
+def calibrate_link_job(job):
+    """Solve a link circuit in this process, measuring peak memory.
+
+    Returns result of solve_link_job and peak bytes allocated per node.
+    NumPy reports its allocations to tracemalloc, so the peak covers the
+    arrays and sparse matrices of the solve. The sparse factor is added.
+    """
+    tracemalloc.start()
+    try:
+        result = solve_link_job(job)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, (peak + result[3]) / float(max(job.nodes, 1))
+
+
+def run_link_jobs(jobs, processes, max_bytes, report=None):
+    """Solve link circuits in worker processes, yielding results.
+
+    Memory for each job is estimated as its node count times bytes per
+    node, fitted by first solving a median-sized job in this process.
+    Jobs are admitted to the pool while their estimates fit within
+    max_bytes, largest first. Jobs estimated to need more than max_bytes
+    are solved one at a time in this process once the pool is done.
+    Yields (job, result of solve_link_job) in completion order, and calls
+    report(message) for scheduling messages.
+    """
+    if not jobs:
+        return
+    jobs = sorted(jobs, key=lambda job: job.nodes, reverse=True)
+    calib_job = jobs.pop(len(jobs) // 2)
+    result, bytes_per_node = calibrate_link_job(calib_job)
+    bytes_per_node = max(bytes_per_node, 0.25 * BYTES_PER_NODE)
+    if report is not None:
+        report('Solver working memory is about ' +
+               str(int(bytes_per_node)) + ' bytes per node.')
+    yield calib_job, result
+
+    queue = [job for job in jobs if job.nodes * bytes_per_node <= max_bytes]
+    large = [job for job in jobs if job.nodes * bytes_per_node > max_bytes]
+    if large and report is not None:
+        report(str(len(large)) + ' links are too large to solve in '
+               'parallel and will be solved one at a time.')
+    pending = {}
+    if queue:
+        with ProcessPoolExecutor(processes) as executor:
+            while queue or pending:
+                in_use = sum(job.nodes * bytes_per_node
+                             for job in pending.values())
+                for job in list(queue):
+                    if len(pending) >= processes:
+                        break
+                    if pending and (in_use + job.nodes * bytes_per_node >
+                                    max_bytes):
+                        continue
+                    queue.remove(job)
+                    pending[executor.submit(solve_link_job, job)] = job
+                    in_use += job.nodes * bytes_per_node
+                finished = wait(pending, return_when=FIRST_COMPLETED)[0]
+                for future in finished:
+                    job = pending.pop(future)
+                    yield job, future.result()
+    for job in large:
+        yield job, solve_link_job(job)
+
+
+class NetworkCircuit(object):
+    """Resistor network on cores, with links as resistors.
+
+    Each connected component is grounded at its last node and its reduced
+    Laplacian is factored once. The inverse of the reduced Laplacian then
+    holds node voltages for every unit source in the component, so
+    currents for all core pairs follow without further solves.
+
+    When a few links change, the inverses are updated with the
+    Sherman-Morrison-Woodbury formula instead of refactoring, and only
+    currents in the components touched are found again. After MAX_UPDATES
+    updates a component's inverse is found again from scratch.
+    """
+
+    def __init__(self, core1, core2, resistance):
+        """Init network from link end cores and link resistances.
+
+        For link networks resistance is the cost-weighted distance of each
+        link, so conductance is 1 / cwdist. Use inf for no link.
+        """
+        core1 = npy.asarray(core1, dtype=npy.float64)
+        core2 = npy.asarray(core2, dtype=npy.float64)
+        self.nodes = npy.unique(npy.concatenate((core1, core2)))
+        self.ends = npy.column_stack((npy.searchsorted(self.nodes, core1),
+                                      npy.searchsorted(self.nodes, core2)))
+        self.conductance = 1.0 / npy.asarray(resistance, dtype=npy.float64)
+        self.find_components()
+        self.inverses = [self.reduced_inverse(members)
+                         for members in self.components]
+        self.updates = npy.zeros(len(self.components), dtype=npy.int64)
+        self.branch = None
+
+    def laplacian(self):
+        """Return the Laplacian of the whole network."""
+        return laplacian(self.ends, self.conductance, len(self.nodes))
+
+    def find_components(self):
+        """Label connected components. Returns True if they changed."""
+        old_labels = getattr(self, 'labels', None)
+        num_comps, labels = csgraph.connected_components(self.laplacian(),
+                                                         directed=False)
+        self.labels = labels
+        self.components = [npy.flatnonzero(labels == comp)
+                           for comp in range(num_comps)]
+        # Position of each node within its component
+        self.local = npy.zeros(len(self.nodes), dtype=npy.int64)
+        for members in self.components:
+            self.local[members] = npy.arange(len(members))
+        return old_labels is None or not npy.array_equal(old_labels, labels)
+
+    def reduced_inverse(self, members):
+        """Return voltages for unit sources at each node of a component.
+
+        Column s holds voltages with 1 A entering at node s and leaving at
+        the ground (last) node, whose row and column are zero.
+        """
+        num = len(members)
+        inverse = npy.zeros((num, num))
+        if num < 2:
+            return inverse
+        reduced = self.laplacian()[members[:-1], :][:, members[:-1]]
+        factor = factor_spd(reduced)
+        for start in range(0, num - 1, BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, num - 1)
+            rhs = npy.zeros((num - 1, end - start))
+            rhs[npy.arange(start, end), npy.arange(end - start)] = 1
+            inverse[:-1, start:end] = factor.solve(rhs)
+        return inverse
+
+    def edge_voltage_rows(self, edges):
+        """Return component and voltage differences across edges.
+
+        Yields (component, edge indices, rows), where rows[i, s] is the
+        voltage drop along edge i for a unit source at node s.
+        """
+        comps = self.labels[self.ends[edges, 0]]
+        for comp in npy.unique(comps):
+            in_comp = edges[comps == comp]
+            inverse = self.inverses[comp]
+            for start in range(0, len(in_comp), BLOCK_SIZE):
+                block = in_comp[start:start + BLOCK_SIZE]
+                rows = (inverse[self.local[self.ends[block, 0]]] -
+                        inverse[self.local[self.ends[block, 1]]])
+                yield comp, block, rows
+
+    def calc_branch_currents(self, edges):
+        """Find currents summed over core pairs for edges."""
+        self.branch[edges] = 0
+        edges = edges[(self.ends[edges, 0] != self.ends[edges, 1]) &
+                      (self.conductance[edges] > 0)]
+        for dummy, block, rows in self.edge_voltage_rows(edges):
+            self.branch[block] = (self.conductance[block] *
+                                  pair_abs_sums(rows))
+
+    def branch_currents(self):
+        """Return current through each link summed over all core pairs.
+
+        Each pair of cores in the same component has 1 A passed between
+        them, as in Circuitscape's network mode with all cores as focal
+        nodes. Pairs in different components carry no current.
+        """
+        if self.branch is None:
+            self.branch = npy.zeros(len(self.ends))
+            self.calc_branch_currents(npy.arange(len(self.ends)))
+        return self.branch.copy()
+
+    def node_currents(self, branch=None):
+        """Return current through each core summed over all core pairs.
+
+        Current through a node for one pair is half the current on its
+        links plus half the 1 A entering or leaving it as a pair end.
+        branch -- result of branch_currents, found if not given
+        """
+        if branch is None:
+            branch = self.branch_currents()
+        num_nodes = len(self.nodes)
+        incident = (npy.bincount(self.ends[:, 0], branch, num_nodes) +
+                    npy.bincount(self.ends[:, 1], branch, num_nodes))
+        comp_sizes = npy.array([len(members)
+                                for members in self.components])
+        return (incident + comp_sizes[self.labels] - 1) / 2.0
+
+    def effective_resistance(self, node1, node2):
+        """Return effective resistance between node indices, or inf."""
+        comp = self.labels[node1]
+        if self.labels[node2] != comp:
+            return npy.inf
+        inverse = self.inverses[comp]
+        loc1, loc2 = self.local[node1], self.local[node2]
+        return (inverse[loc1, loc1] + inverse[loc2, loc2] -
+                inverse[loc1, loc2] - inverse[loc2, loc1])
+
+    def woodbury_update(self, comp, edges, delta):
+        """Update a component's inverse for conductance changes on edges.
+
+        With U holding a column e_a - e_b for each edge and C the diagonal
+        of changes, (L + U C U')^-1 =
+            X - X U (C^-1 + U' X U)^-1 U' X, with X = L^-1.
+        """
+        inverse = self.inverses[comp]
+        loc1 = self.local[self.ends[edges, 0]]
+        loc2 = self.local[self.ends[edges, 1]]
+        x_u = inverse[:, loc1] - inverse[:, loc2]
+        capacitance = npy.diag(1.0 / delta) + (x_u[loc1] - x_u[loc2])
+        inverse -= x_u.dot(npy.linalg.solve(capacitance, x_u.T))
+
+    def change_links(self, edges, resistance):
+        """Change resistances of links, inf to remove them.
+
+        Inverses of components touched are updated in place, unless the
+        change splits or joins components, in which case all components are
+        factored again. A component updated MAX_UPDATES times is factored
+        again too. Returns the change in (node currents, branch currents).
+        """
+        edges = npy.asarray(edges, dtype=npy.int64)
+        old_branch = self.branch_currents()
+        old_node = self.node_currents(old_branch)
+        new_cond = 1.0 / npy.asarray(resistance, dtype=npy.float64)
+        delta = new_cond - self.conductance[edges]
+        self.conductance[edges] = new_cond
+
+        if self.find_components():
+            self.inverses = [self.reduced_inverse(members)
+                             for members in self.components]
+            self.updates = npy.zeros(len(self.components), dtype=npy.int64)
+            self.branch = None
+        else:
+            keep = (delta != 0) & (self.ends[edges, 0] != self.ends[edges, 1])
+            edges, delta = edges[keep], delta[keep]
+            comps = self.labels[self.ends[edges, 0]]
+            for comp in npy.unique(comps):
+                if self.updates[comp] >= MAX_UPDATES:
+                    self.inverses[comp] = self.reduced_inverse(
+                        self.components[comp])
+                    self.updates[comp] = 0
+                else:
+                    self.woodbury_update(comp, edges[comps == comp],
+                                         delta[comps == comp])
+                    self.updates[comp] += 1
+            touched = npy.flatnonzero(npy.isin(self.labels[self.ends[:, 0]],
+                                              comps))
+            self.calc_branch_currents(touched)
+        branch = self.branch_currents()
+        return self.node_currents(branch) - old_node, branch - old_branch
+
+    def add_links(self, core1, core2, resistance):
+        """Add links between cores already in the network.
+
+        Returns indices of the new links and the change in (node currents,
+        branch currents), with branch currents for the new links last.
+        """
+        core1 = npy.asarray(core1, dtype=npy.float64)
+        core2 = npy.asarray(core2, dtype=npy.float64)
+        new_ends = npy.column_stack((npy.searchsorted(self.nodes, core1),
+                                     npy.searchsorted(self.nodes, core2)))
+        if (new_ends >= len(self.nodes)).any() or not npy.array_equal(
+                self.nodes[new_ends], npy.column_stack((core1, core2))):
+            raise ValueError('Links can only be added between cores in '
+                             'the network')
+        self.branch_currents()
+        edges = npy.arange(len(self.ends), len(self.ends) + len(new_ends))
+        self.ends = npy.concatenate((self.ends, new_ends))
+        self.conductance = npy.concatenate((self.conductance,
+                                            npy.zeros(len(new_ends))))
+        self.branch = npy.concatenate((self.branch, npy.zeros(len(edges))))
+        node_delta, branch_delta = self.change_links(edges, resistance)
+        return edges, node_delta, branch_delta
+
+    def link_edges(self, core1, core2):
+        """Return edge index of each link given by its end cores, or -1.
+
+        Edges are matched regardless of direction.
+        """
+        lookup = {}
+        for edge, (end1, end2) in enumerate(self.nodes[self.ends].tolist()):
+            lookup[(min(end1, end2), max(end1, end2))] = edge
+        return npy.array([lookup.get((min(end1, end2), max(end1, end2)), -1)
+                          for end1, end2 in zip(core1, core2)],
+                         dtype=npy.int64)
+
+    def update_links(self, core1, core2, resistance, max_changes=None):
+        """Make network links match a new list of links.
+
+        Links not in the new list are removed, and new links and changed
+        resistances applied as low-rank updates. Returns edge index of each
+        new link and the change in (node currents, branch currents) the
+        update made, or None if there are more than max_changes changes or
+        links join new cores, when building a new network is faster.
+        max_changes defaults to a quarter of the number of cores, beyond
+        which updates gain little over refactoring.
+        """
+        if max_changes is None:
+            max_changes = max(1, len(self.nodes) // 4)
+        resistance = npy.asarray(resistance, dtype=npy.float64)
+        edges = self.link_edges(core1, core2)
+        if len(npy.unique(edges[edges >= 0])) < (edges >= 0).sum():
+            return None
+        dropped = npy.ones(len(self.ends), dtype=bool)
+        dropped[edges[edges >= 0]] = False
+        dropped &= self.conductance > 0
+        changed = edges >= 0
+        changed[changed] = (1.0 / resistance[changed] !=
+                            self.conductance[edges[changed]])
+        added = edges < 0
+        if dropped.sum() + changed.sum() + added.sum() > max_changes:
+            return None
+        node_delta = npy.zeros(len(self.nodes))
+        branch_delta = npy.zeros(len(self.ends))
+        if added.any():
+            try:
+                edges[added], node_delta, branch_delta = self.add_links(
+                    npy.asarray(core1)[added], npy.asarray(core2)[added],
+                    resistance[added])
+            except ValueError:
+                return None
+        change = npy.concatenate((npy.flatnonzero(dropped),
+                                  edges[changed]))
+        if len(change):
+            deltas = self.change_links(change, npy.concatenate((
+                npy.full(dropped.sum(), npy.inf), resistance[changed])))
+            node_delta = node_delta + deltas[0]
+            branch_delta = branch_delta + deltas[1]
+        return edges, node_delta, branch_delta
+
+    def save(self, filename):
+        """Save network, inverses and currents to an npz file."""
+        arrays = {"nodes": self.nodes, "ends": self.ends,
+                  "conductance": self.conductance,
+                  "branch": self.branch_currents(), "updates": self.updates}
+        for comp, inverse in enumerate(self.inverses):
+            arrays["inv_{}".format(comp)] = inverse
+        npy.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Return network saved with save."""
+        network = cls.__new__(cls)
+        with npy.load(filename, allow_pickle=False) as npz:
+            network.nodes = npz["nodes"]
+            network.ends = npz["ends"]
+            network.conductance = npz["conductance"]
+            network.branch = npz["branch"]
+            network.updates = npz["updates"]
+            network.find_components()
+            network.inverses = [npz["inv_{}".format(comp)]
+                                for comp in range(len(network.components))]
+        return network
+
+
+def network_centrality(core1, core2, cwdist):
+    """Return current flow centrality of a link network.
+
+    Returns (core ids, core currents, link currents), with link currents in
+    the order of the input links.
+    """
+    network = NetworkCircuit(core1, core2, cwdist)
+    branch = network.branch_currents()
+    return network.nodes, network.node_currents(branch), branch
@@ -6,7 +6,7 @@ Assigns input parameters from ToolBox to variables, and sets constants.
 
 """
 
-from os import path
+from os import cpu_count, path
 import imp
 import json
 
@@ -78,6 +78,10 @@ def config_global(config, arg):
     config.LCCBASEDIR = path.join(config.DATAPASSDIR, "nlcc")
     config.LCCBASEDIR_OLD = path.join(proj_dir, "nlcc")
     config.LCCNLCDIR_NM = "nlc"
+    config.NLCCFILE = path.join(config.LCCBASEDIR, "nlcc_sparse.npz")
+    config.LCCSTATEFILE = path.join(config.DATAPASSDIR, "lcc_state.npz")
+    config.CENTRALITYSTATEFILE = path.join(config.DATAPASSDIR,
+                                           "centrality_state.npz")
     config.LCCMOSAICDIR = path.join(config.LCCBASEDIR, "mosaic")
     config.MOSAICGDB = path.join(config.LCCMOSAICDIR, "mosaic.gdb")
     config.FOCALSUBDIR1_NM = "focalr"
@@ -281,6 +285,9 @@ def config_barrier(config, arg):
     # Save individual barrier grids for each core area pair
     config.SAVEBARRIERRASTERS = False
 
+    # Worker processes for calculating barriers (1 to run in tool process)
+    config.BARRIER_PROCESSES = max(1, (cpu_count() or 1) - 1)
+
     config.STEP1 = False
 
 
@@ -399,6 +406,22 @@ def config_lp(config, arg):
 def config_circuitscape(config, arg):
     """Configure global variables for Circuitscape."""
     config.CSPATH = arg[-1]  # Path to Circuitscape
+    # Solve centrality and link pinch point circuits in process rather than
+    # calling Circuitscape
+    config.CIRCUIT_IN_PROCESS = True
+    # Otherwise run each step's Circuitscape jobs in one Python session
+    # that imports Circuitscape and works through a batch manifest, rather
+    # than launching Circuitscape for each job. The session runs with
+    # CS_PYTHON, the Python 2.7 executable Circuitscape 4 is installed in,
+    # which must be set for batch runs.
+    config.CIRCUIT_BATCH = False
+    config.CS_PYTHON = None
+    # Worker processes for solving link circuits (1 to run in tool process)
+    config.CIRCUIT_PROCESSES = max(1, (cpu_count() or 1) - 1)
+    # Circuitscape processes run at once, and seconds before one is
+    # stopped (None for no limit)
+    config.CS_PROCESSES = 1
+    config.CS_TIMEOUT = None
     config.COREFC = arg[2]
     config.COREFN = arg[3]
 
@@ -0,0 +1,71 @@
+"""Circuitscape session working through a batch manifest of jobs.
+
+Run as
+
+    python lm_cs_batch.py manifest
+
+with the Python 2.7 that Circuitscape 4 is installed in (cfg.CS_PYTHON),
+e.g. one where "pip install Circuitscape==4.0.5" has been run. Each line of
+the manifest is a JSON job holding a name, a Circuitscape .ini file and
+the output_file option in it (see lm_cs_process.write_manifest). One
+process imports Circuitscape and calls its compute entry point for each
+job's .ini in turn, so interpreter and Circuitscape startup is paid once
+rather than per job. Circuitscape writes its result files as usual, and
+one result record per job is written to stdout as it is done (see
+lm_cs_process.stream_manifest).
+
+This runs under Circuitscape's Python rather than the tool's, so it only
+uses the standard library and must stay Python 2.7 compatible.
+
+"""
+
+import json
+import sys
+import time
+import traceback
+
+# Start of the stdout lines holding result records, as in lm_cs_process
+RECORD_PREFIX = 'RESULT\t'
+
+
+def circuitscape_compute():
+    """Return function running Circuitscape on one .ini file."""
+    try:
+        from circuitscape import Compute
+    except ImportError:
+        from circuitscape.compute import Compute
+    return lambda config_file: Compute(config_file, 'Screen').compute()
+
+
+def solve_job(compute, job):
+    """Run Circuitscape on a manifest job. Returns its result record."""
+    start_time = time.time()
+    record = {'name': job['name'], 'error': None}
+    try:
+        compute(job['config_file'])
+    except Exception:
+        record['error'] = traceback.format_exc()
+    record['seconds'] = time.time() - start_time
+    return record
+
+
+def main(manifest):
+    """Run Circuitscape on each job in manifest, writing a record for each."""
+    try:
+        compute = circuitscape_compute()
+    except ImportError:
+        sys.stdout.write('Circuitscape Python package not found by ' +
+                         sys.executable + '\n')
+        sys.exit(1)
+    with open(manifest) as jobs:
+        for line in jobs:
+            if not line.strip():
+                continue
+            record = solve_job(compute, json.loads(line))
+            sys.stdout.flush()
+            sys.stdout.write(RECORD_PREFIX + json.dumps(record) + '\n')
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
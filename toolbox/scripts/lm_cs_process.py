@@ -0,0 +1,302 @@
+"""Run Circuitscape processes asynchronously and read their results.
+
+Circuitscape is started with asyncio subprocesses, without a shell, and up
+to a set number of processes run at once. Output is read line by line as
+it is written, each job can have a timeout, and processes are killed if
+the run is cancelled or interrupted. Result files named from a job's
+output_file option are read into typed results.
+
+Jobs can also be written to a batch manifest and run one after another
+in a single long-lived Circuitscape session (lm_cs_batch), which streams
+back a result record per job. Only NumPy is needed besides the standard
+library, as steps 7 and 8 use this from the tool's own process.
+
+"""
+
+import asyncio
+import json
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from os import path
+
+import numpy as npy
+
+# name -- label for messages, e.g. link id
+# config_file -- Circuitscape .ini file
+# output_file -- output_file option in the .ini, which result file names
+#                are built from
+# timeout -- seconds before the process is killed, or None for no limit
+CSJob = namedtuple('CSJob', 'name config_file output_file timeout')
+
+# job -- CSJob run
+# returncode -- process exit code, or None if killed
+# seconds -- wall clock time taken
+# output -- list of lines written to stdout and stderr
+# timed_out -- whether the process was killed for exceeding the timeout
+# failed -- whether a Python traceback was written
+# mem_error -- whether the failure was for lack of memory
+CSRun = namedtuple('CSRun', 'job returncode seconds output timed_out '
+                            'failed mem_error')
+
+# run -- CSRun the results came from
+# current -- cumulative current map array (memory-mapped), or None
+# branch_currents -- array of rows (node 1, node 2, current), or None
+# node_currents -- array of rows (node, current), or None
+# resistances -- array of rows (node 1, node 2, effective resistance), or
+#                None
+# timings -- list of (step, seconds) reported by Circuitscape
+CSResult = namedtuple('CSResult', 'run current branch_currents node_currents '
+                                  'resistances timings')
+
+# Start of lines from the batch session holding a JSON result record
+# (kept the same in lm_cs_batch, which can't import this module)
+RECORD_PREFIX = 'RESULT\t'
+
+# Reported times, as hours:minutes:seconds or seconds
+_HMS = re.compile(r'(\d+):(\d{2}):(\d{2}(?:\.\d*)?)')
+_SECONDS = re.compile(r'(\d+(?:\.\d*)?)\s*sec')
+
+
+def result_file(output_file, suffix):
+    """Return path of a result file written for output_file.
+
+    Circuitscape replaces the extension of output_file with suffix, e.g.
+    '_cum_curmap.npy'.
+    """
+    return path.splitext(output_file)[0] + suffix
+
+
+def parse_timings(lines):
+    """Return list of (step, seconds) from Circuitscape timing messages."""
+    timings = []
+    for line in lines:
+        match = _HMS.search(line)
+        if match:
+            seconds = (3600 * int(match.group(1)) + 60 * int(match.group(2))
+                       + float(match.group(3)))
+        else:
+            match = _SECONDS.search(line)
+            if not match:
+                continue
+            seconds = float(match.group(1))
+        step = line[:match.start()].strip(' -:\t')
+        timings.append((step, seconds))
+    return timings
+
+
+def load_table(filename, columns):
+    """Return rows of a Circuitscape text result, or None if not written."""
+    if not path.isfile(filename):
+        return None
+    try:
+        table = npy.loadtxt(filename, dtype=npy.float64, comments='#')
+    except ValueError:
+        table = npy.loadtxt(filename, dtype=npy.float64, comments='#',
+                            delimiter=',')
+    return table.reshape(-1, columns)
+
+
+def load_resistances(output_file):
+    """Return rows of (node 1, node 2, resistance), or None.
+
+    Reads the three column resistances file if written, else the matrix
+    with node ids down the first column and across the first row.
+    """
+    table = load_table(result_file(output_file, '_resistances_3columns.out'),
+                       3)
+    if table is not None:
+        return table
+    filename = result_file(output_file, '_resistances.out')
+    if not path.isfile(filename):
+        return None
+    matrix = npy.atleast_2d(npy.loadtxt(filename, dtype=npy.float64))
+    ids = matrix[0, 1:]
+    rows, cols = npy.triu_indices(len(ids), 1)
+    return npy.column_stack((ids[rows], ids[cols],
+                             matrix[1:, 1:][rows, cols]))
+
+
+def read_result(run):
+    """Return CSResult holding the result files written by a run."""
+    output_file = run.job.output_file
+    current = None
+    current_file = result_file(output_file, '_cum_curmap.npy')
+    if path.isfile(current_file):
+        current = npy.load(current_file, mmap_mode='r')
+    return CSResult(
+        run, current,
+        load_table(result_file(output_file, '_branch_currents_cum.txt'), 3),
+        load_table(result_file(output_file, '_node_currents_cum.txt'), 2),
+        load_resistances(output_file), parse_timings(run.output))
+
+
+def kill(proc):
+    """Kill a process if it is still running."""
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_job(cspath, job, semaphore, report, procs):
+    """Run Circuitscape on a job once a slot is free. Returns CSRun.
+
+    procs -- set of running processes, which the process is kept in
+    """
+    async with semaphore:
+        start_time = time.time()
+        proc = await asyncio.create_subprocess_exec(
+            cspath, job.config_file, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+        procs.add(proc)
+        lines = []
+
+        async def read_output():
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').rstrip('\r\n')
+                lines.append(line)
+                if report is not None:
+                    report(job, line)
+            await proc.wait()
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(read_output(), job.timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            kill(proc)
+            await proc.wait()
+        except BaseException:
+            # Cancelled or interrupted
+            kill(proc)
+            await proc.wait()
+            raise
+        finally:
+            procs.discard(proc)
+
+        failed = any('Traceback' in line for line in lines)
+        mem_error = failed and any('memory' in line.lower()
+                                   for line in lines)
+        return CSRun(job, None if timed_out else proc.returncode,
+                     time.time() - start_time, lines, timed_out, failed,
+                     mem_error)
+
+
+async def run_all(cspath, jobs, processes, report, procs):
+    """Run jobs with up to processes at once. Returns CSRuns in job order."""
+    semaphore = asyncio.Semaphore(max(1, processes))
+    tasks = [asyncio.ensure_future(run_job(cspath, job, semaphore, report,
+                                           procs))
+             for job in jobs]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def reap(procs):
+    """Kill processes and wait for them to exit."""
+    for proc in procs:
+        kill(proc)
+    for proc in procs:
+        await proc.wait()
+
+
+def new_event_loop():
+    """Return an event loop able to run subprocesses on this platform."""
+    if sys.platform == 'win32':
+        return asyncio.ProactorEventLoop()
+    return asyncio.new_event_loop()
+
+
+def run_jobs(cspath, jobs, processes=1, report=None):
+    """Run Circuitscape on jobs, up to processes at once.
+
+    cspath -- Circuitscape executable, run without a shell
+    jobs -- list of CSJob
+    report -- function called with (job, line) for each line of output
+    Returns list of CSRun in job order. If interrupted, e.g. when the tool
+    is cancelled, running processes are killed before the exception is
+    raised.
+    """
+    loop = new_event_loop()
+    # Child process watcher attaches to the main thread's current loop
+    asyncio.set_event_loop(loop)
+    procs = set()
+    task = asyncio.ensure_future(run_all(cspath, jobs, processes, report,
+                                         procs), loop=loop)
+    try:
+        return loop.run_until_complete(task)
+    except BaseException:
+        # An interrupt can land in any job's coroutine, and the loop raises
+        # it again when next run, so processes are killed here first rather
+        # than left to cancelled jobs
+        for proc in list(procs):
+            kill(proc)
+        task.cancel()
+        for _ in range(len(jobs) + 1):
+            try:
+                loop.run_until_complete(reap(list(procs)))
+                loop.run_until_complete(asyncio.wait([task]))
+                break
+            except BaseException:
+                continue
+        if task.done() and not task.cancelled():
+            task.exception()  # Raised below, so retrieved
+        raise
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def write_manifest(filename, jobs):
+    """Write a batch manifest of CSJobs (timeouts are not used)."""
+    with open(filename, 'w') as manifest:
+        for job in jobs:
+            manifest.write(json.dumps({'name': job.name,
+                                       'config_file': job.config_file,
+                                       'output_file': job.output_file})
+                           + '\n')
+
+
+def stream_manifest(python, manifest, report=None):
+    """Run a batch manifest in one Circuitscape session, yielding records.
+
+    python -- Python 2.7 executable with Circuitscape 4 installed to run
+              lm_cs_batch with, without a shell
+    report -- function called with each line of output that isn't a
+              result record
+    Yields a dict for each job as it is done, holding its name, seconds
+    taken and error (traceback text, or None). Results are read from the
+    files Circuitscape writes, as for jobs run with run_jobs. The session
+    is killed if the caller stops early or is interrupted.
+    """
+    script = path.join(path.dirname(path.abspath(__file__)), 'lm_cs_batch.py')
+    proc = subprocess.Popen([python, script, manifest],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    try:
+        for line in proc.stdout:
+            line = line.rstrip('\r\n')
+            if line.startswith(RECORD_PREFIX):
+                yield json.loads(line[len(RECORD_PREFIX):])
+            elif report is not None:
+                report(line)
+        proc.wait()
+        if proc.returncode:
+            raise RuntimeError('Circuitscape session exited with code ' +
+                               str(proc.returncode))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
@@ -0,0 +1,224 @@
+"""Focal minimum and maximum over circle and annulus neighborhoods.
+
+Neighborhoods follow Spatial Analyst FocalStatistics: a cell is in the
+neighborhood if its center lies within the outer radius and beyond the
+inner radius of the processing cell center, with radii in cell units.
+Statistics use the "DATA" option, so NoData (NaN) and cells off the edge
+of the array are ignored.
+
+Each neighborhood is split into horizontal chords. Running minima or
+maxima along rows are found for each chord length with the van Herk/Gil-
+Werman algorithm, so cost per cell depends on the number of chords rather
+than the number of cells in the neighborhood.
+
+"""
+
+from functools import lru_cache
+from math import floor, sqrt
+
+import numpy as npy
+
+from lm_grid import MINIMUM, MAXIMUM
+
+_EPS = 1e-9  # Tolerance on squared distances, for radii on cell centers
+
+
+def _half_width(radius, row_offset):
+    """Return largest column offset within radius at row_offset, or -1."""
+    dist_sq = radius * radius - row_offset * row_offset
+    if dist_sq < -_EPS:
+        return -1
+    width = int(floor(sqrt(max(dist_sq, 0))))
+    # Correct for rounding in sqrt
+    while (width + 1) ** 2 <= dist_sq + _EPS:
+        width += 1
+    while width >= 0 and width * width > dist_sq + _EPS:
+        width -= 1
+    return width
+
+
+@lru_cache(maxsize=None)
+def annulus_segments(inner, outer):
+    """Return chords of an annulus as (row offset, col offset, length).
+
+    Cells are included where inner < distance <= outer. Use a negative
+    inner radius for a full circle.
+    """
+    extent = int(floor(outer + _EPS))
+    segments = []
+    for row_off in range(-extent, extent + 1):
+        outer_width = _half_width(outer, row_off)
+        if outer_width < 0:
+            continue
+        inner_width = _half_width(inner, row_off) if inner >= 0 else -1
+        if inner_width < 0:
+            segments.append((row_off, -outer_width, 2 * outer_width + 1))
+        elif inner_width < outer_width:
+            length = outer_width - inner_width
+            segments.append((row_off, -outer_width, length))
+            segments.append((row_off, inner_width + 1, length))
+    return tuple(segments)
+
+
+def circle_segments(radius):
+    """Return chords of a circle as (row offset, col offset, length)."""
+    return annulus_segments(-1.0, float(radius))
+
+
+def running_reduce(array, length, method):
+    """Return min or max over each run of length cells along rows.
+
+    Uses the van Herk/Gil-Werman algorithm. Element [i, j] of the result
+    covers array[i, j:j + length], and the result has
+    array.shape[1] - length + 1 columns. NaN is ignored.
+    """
+    func = npy.fmin if method == MINIMUM else npy.fmax
+    nrows, ncols = array.shape
+    if length == 1:
+        return array.copy()
+    if length == 2:
+        return func(array[:, :-1], array[:, 1:])
+    nblocks = -(-ncols // length)
+    padded = npy.full((nrows, nblocks * length), npy.nan, dtype=array.dtype)
+    padded[:, :ncols] = array
+    blocks = padded.reshape(nrows, nblocks, length)
+    prefix = func.accumulate(blocks, axis=2).reshape(nrows, -1)
+    suffix = func.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(
+        nrows, -1)
+    nout = ncols - length + 1
+    return func(suffix[:, :nout], prefix[:, length - 1:length - 1 + nout])
+
+
+def focal_reduce(array, segments, method):
+    """Return focal min or max of array over neighborhood chords.
+
+    array -- 2D float array with NaN for NoData
+    segments -- chords as from annulus_segments
+    method -- lm_grid MINIMUM or MAXIMUM
+    Cells with no data in their neighborhood are NaN.
+    """
+    return focal_reduce_multi(array, [segments], method)[0]
+
+
+def focal_reduce_multi(array, segment_lists, method):
+    """Return list of focal min or max of array, one per neighborhood.
+
+    Runs along rows are found once for each chord length and shared by
+    all neighborhoods, e.g. the annuli of a set of search radii.
+    """
+    if method not in (MINIMUM, MAXIMUM):
+        raise ValueError('Unknown focal method ' + str(method))
+    func = npy.fmin if method == MINIMUM else npy.fmax
+    array = npy.asarray(array, dtype=npy.float32)
+    nrows, ncols = array.shape
+    outs = [npy.full((nrows, ncols), npy.nan, dtype=npy.float32)
+            for segments in segment_lists]
+    extent = max([max(abs(seg[0]), abs(seg[1]), abs(seg[1] + seg[2] - 1))
+                  for segments in segment_lists for seg in segments] + [0])
+    padded = npy.full((nrows + 2 * extent, ncols + 2 * extent), npy.nan,
+                      dtype=npy.float32)
+    padded[extent:extent + nrows, extent:extent + ncols] = array
+
+    by_length = {}
+    for out, segments in zip(outs, segment_lists):
+        for row_off, col_off, length in segments:
+            by_length.setdefault(length, []).append((out, row_off, col_off))
+    with npy.errstate(invalid='ignore'):
+        for length, chords in by_length.items():
+            runs = running_reduce(padded, length, method)
+            for out, row_off, col_off in chords:
+                row = extent + row_off
+                col = extent + col_off
+                func(out, runs[row:row + nrows, col:col + ncols], out=out)
+    return outs
+
+
+def focal_reduce_at(array, segments, method, rows, cols):
+    """Return focal min or max of array at cells (rows, cols) only.
+
+    Returns 1D array of values for the cells, for neighborhoods evaluated
+    over a sparse set of cells (see focal_reduce).
+    """
+    if method not in (MINIMUM, MAXIMUM):
+        raise ValueError('Unknown focal method ' + str(method))
+    func = npy.fmin if method == MINIMUM else npy.fmax
+    array = npy.asarray(array, dtype=npy.float32)
+    nrows, ncols = array.shape
+    out = npy.full(len(rows), npy.nan, dtype=npy.float32)
+    if not segments or not len(rows):
+        return out
+    extent = max(max(abs(seg[0]), abs(seg[1]), abs(seg[1] + seg[2] - 1))
+                 for seg in segments)
+    padded = npy.full((nrows + 2 * extent, ncols + 2 * extent), npy.nan,
+                      dtype=npy.float32)
+    padded[extent:extent + nrows, extent:extent + ncols] = array
+
+    by_length = {}
+    for row_off, col_off, length in segments:
+        by_length.setdefault(length, []).append((row_off, col_off))
+    with npy.errstate(invalid='ignore'):
+        for length, offsets in by_length.items():
+            if length == 1:
+                runs = padded
+            else:
+                runs = running_reduce(padded, length, method)
+            for row_off, col_off in offsets:
+                func(out, runs[rows + extent + row_off,
+                               cols + extent + col_off], out=out)
+    return out
+
+
+def annulus_min(array, inner, outer):
+    """Return focal minimum over annulus with radii in cells."""
+    return focal_reduce(array, annulus_segments(float(inner), float(outer)),
+                        MINIMUM)
+
+
+def circle_max(array, radius):
+    """Return focal maximum over circle with radius in cells.
+
+    Grows out the marked (non-NaN) cells of a sparse array. The array is
+    cropped to the marked cells plus the radius, and running maxima along
+    rows are only found for rows holding marked cells. Each is then spread
+    to the rows within the circle's chord at that row offset. Cells
+    without a marked cell within the radius are NaN.
+    """
+    array = npy.asarray(array, dtype=npy.float32)
+    nrows, ncols = array.shape
+    out = npy.full((nrows, ncols), npy.nan, dtype=npy.float32)
+    marked = ~npy.isnan(array)
+    marked_rows = npy.flatnonzero(marked.any(axis=1))
+    if marked_rows.size == 0:
+        return out
+    marked_cols = npy.flatnonzero(marked.any(axis=0))
+    segments = circle_segments(radius)
+    extent = segments[-1][0]
+
+    # Crop to marked cells plus radius
+    row_start = max(marked_rows[0] - extent, 0)
+    row_end = min(marked_rows[-1] + extent + 1, nrows)
+    col_start = max(marked_cols[0] - extent, 0)
+    col_end = min(marked_cols[-1] + extent + 1, ncols)
+    crop_ncols = col_end - col_start
+    rows = npy.full((marked_rows.size, crop_ncols + 2 * extent), npy.nan,
+                    dtype=npy.float32)
+    rows[:, extent:extent + crop_ncols] = array[marked_rows,
+                                                col_start:col_end]
+    crop = out[row_start:row_end, col_start:col_end]
+    marked_rows = marked_rows - row_start
+
+    by_length = {}
+    for row_off, col_off, length in segments:
+        by_length.setdefault(length, []).append((row_off, col_off))
+    with npy.errstate(invalid='ignore'):
+        for length, offsets in by_length.items():
+            runs = running_reduce(rows, length, MAXIMUM)
+            for row_off, col_off in offsets:
+                # Marked row r reaches output row r - row_off
+                targets = marked_rows - row_off
+                valid = (targets >= 0) & (targets < crop.shape[0])
+                col = extent + col_off
+                crop[targets[valid]] = npy.fmax(
+                    crop[targets[valid]],
+                    runs[valid, col:col + crop_ncols])
+    return out
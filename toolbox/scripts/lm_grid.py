@@ -0,0 +1,282 @@
+"""Windows and accumulators on the analysis grid.
+
+A window is a block of rows and columns of the resistance raster grid.
+Accumulators hold their tiles as NumPy arrays; reading and writing rasters
+is left to lm_raster.
+
+"""
+
+from collections import namedtuple
+
+import numpy as npy
+
+MINIMUM = "MINIMUM"
+MAXIMUM = "MAXIMUM"
+SUM = "SUM"
+
+TILE_SIZE = 1024  # Rows and columns per accumulator tile
+
+Window = namedtuple('Window', 'row col nrows ncols')
+
+# zones -- sorted array of zone ids
+# count -- array of cells with data in each zone
+# mean, std -- arrays of each zone's mean and (population) standard deviation
+ZoneStats = namedtuple('ZoneStats', 'zones count mean std')
+
+
+def window_intersect(win1, win2):
+    """Return the window common to two windows, or None if disjoint."""
+    row = max(win1.row, win2.row)
+    col = max(win1.col, win2.col)
+    row_end = min(win1.row + win1.nrows, win2.row + win2.nrows)
+    col_end = min(win1.col + win1.ncols, win2.col + win2.ncols)
+    if row_end <= row or col_end <= col:
+        return None
+    return Window(row, col, row_end - row, col_end - col)
+
+
+def window_union(win1, win2):
+    """Return the smallest window containing both windows."""
+    row = min(win1.row, win2.row)
+    col = min(win1.col, win2.col)
+    row_end = max(win1.row + win1.nrows, win2.row + win2.nrows)
+    col_end = max(win1.col + win1.ncols, win2.col + win2.ncols)
+    return Window(row, col, row_end - row, col_end - col)
+
+
+def window_buffer(win, cells, outer):
+    """Return window grown by cells on each side, clipped to outer."""
+    grown = Window(win.row - cells, win.col - cells, win.nrows + 2 * cells,
+                   win.ncols + 2 * cells)
+    return window_intersect(grown, outer)
+
+
+def window_slices(win, outer):
+    """Return slices selecting window win from an array covering outer."""
+    row = win.row - outer.row
+    col = win.col - outer.col
+    return (slice(row, row + win.nrows), slice(col, col + win.ncols))
+
+
+def grid_windows(nrows, ncols, tile_size=TILE_SIZE):
+    """Yield windows tiling a grid of nrows by ncols, row by row."""
+    for row in range(0, nrows, tile_size):
+        for col in range(0, ncols, tile_size):
+            yield Window(row, col, min(tile_size, nrows - row),
+                         min(tile_size, ncols - col))
+
+
+def zone_stats(tiles):
+    """Return ZoneStats of values by zone in one pass over tiles.
+
+    tiles -- iterable of (zones, values) arrays covering the same cells,
+             with NaN for NoData
+    Each tile's count, sum and sum of squared deviations per zone are found
+    with bincount, then merged into the running totals (Chan et al.), which
+    keeps the variance accurate for large values.
+    """
+    zones = npy.empty(0)
+    count = npy.empty(0)
+    mean = npy.empty(0)
+    sq_dev = npy.empty(0)
+    for tile_zones, tile_values in tiles:
+        has_data = ~npy.isnan(tile_zones) & ~npy.isnan(tile_values)
+        tile_ids, inverse = npy.unique(tile_zones[has_data],
+                                       return_inverse=True)
+        if not len(tile_ids):
+            continue
+        values = tile_values[has_data].astype(npy.float64)
+        tile_count = npy.bincount(inverse).astype(npy.float64)
+        tile_mean = npy.bincount(inverse, values) / tile_count
+        tile_sq_dev = npy.bincount(inverse,
+                                   (values - tile_mean[inverse]) ** 2)
+
+        all_zones = npy.union1d(zones, tile_ids)
+        if len(all_zones) > len(zones):
+            # Make room for zones first seen in this tile
+            old = npy.searchsorted(all_zones, zones)
+            grown = [npy.zeros(len(all_zones)) for _ in range(3)]
+            for new_arr, old_arr in zip(grown, (count, mean, sq_dev)):
+                new_arr[old] = old_arr
+            count, mean, sq_dev = grown
+            zones = all_zones
+        idx = npy.searchsorted(zones, tile_ids)
+        total = count[idx] + tile_count
+        delta = tile_mean - mean[idx]
+        sq_dev[idx] += (tile_sq_dev +
+                        delta ** 2 * count[idx] * tile_count / total)
+        mean[idx] += delta * tile_count / total
+        count[idx] = total
+    with npy.errstate(invalid='ignore'):
+        std = npy.sqrt(sq_dev / count)
+    return ZoneStats(zones, count, mean, std)
+
+
+def reduce_into(target, values, method):
+    """Reduce values into target in place, treating NaN as NoData."""
+    if method == MINIMUM:
+        npy.fmin(target, values, out=target)
+    elif method == MAXIMUM:
+        npy.fmax(target, values, out=target)
+    elif method == SUM:
+        has_val = ~npy.isnan(values)
+        npy.copyto(target, 0, where=has_val & npy.isnan(target))
+        npy.add(target, values, out=target, where=has_val)
+    else:
+        raise ValueError('Unknown reduction method ' + str(method))
+
+
+class TiledAccumulator(object):
+    """Cell-wise running reduction of windows into the analysis grid.
+
+    Tiles are float32 and only allocated once a window touches them, so
+    memory follows the area covered by links rather than the full extent.
+
+    With track set (MINIMUM and MAXIMUM only), each tile also records the
+    id of the link supplying each cell value and the ids of all links with
+    data in the tile, so tiles can be rebuilt when links change.
+    """
+
+    def __init__(self, nrows, ncols, method, tile_size=TILE_SIZE,
+                 track=False):
+        """Init accumulator for a grid of nrows by ncols cells."""
+        self.nrows = nrows
+        self.ncols = ncols
+        self.method = method
+        self.tile_size = tile_size
+        self.tiles = {}
+        self.owners = {} if track else None
+        self.footprints = {} if track else None
+
+    def tile_window(self, key):
+        """Return the grid window covered by tile key (tile row, tile col)."""
+        row = key[0] * self.tile_size
+        col = key[1] * self.tile_size
+        return Window(row, col, min(self.tile_size, self.nrows - row),
+                      min(self.tile_size, self.ncols - col))
+
+    def tile_keys(self, win):
+        """Return keys of all tiles overlapped by window win."""
+        size = self.tile_size
+        return [(trow, tcol)
+                for trow in range(win.row // size,
+                                  (win.row + win.nrows - 1) // size + 1)
+                for tcol in range(win.col // size,
+                                  (win.col + win.ncols - 1) // size + 1)]
+
+    def get_tile(self, key):
+        """Return tile array for key, allocating it if needed."""
+        tile = self.tiles.get(key)
+        if tile is None:
+            twin = self.tile_window(key)
+            tile = npy.full((twin.nrows, twin.ncols), npy.nan,
+                            dtype=npy.float32)
+            self.tiles[key] = tile
+            if self.owners is not None:
+                self.owners[key] = npy.full(tile.shape, -1, dtype=npy.int32)
+                self.footprints[key] = set()
+        return tile
+
+    def add(self, win, values, link=None):
+        """Reduce array values covering window win into the accumulator.
+
+        link is the id recorded for the values if tracking is on.
+        """
+        for key in self.tile_keys(win):
+            twin = self.tile_window(key)
+            common = window_intersect(win, twin)
+            if common is None:
+                continue
+            target = self.get_tile(key)[window_slices(common, twin)]
+            in_values = values[window_slices(common, win)]
+            if self.owners is None:
+                reduce_into(target, in_values, self.method)
+                continue
+            has_val = ~npy.isnan(in_values)
+            if not has_val.any():
+                continue
+            with npy.errstate(invalid='ignore'):
+                if self.method == MINIMUM:
+                    wins = in_values < target
+                else:
+                    wins = in_values > target
+            wins |= has_val & npy.isnan(target)
+            target[wins] = in_values[wins]
+            self.owners[key][window_slices(common, twin)][wins] = link
+            self.footprints[key].add(link)
+
+    def winners(self, key):
+        """Return set of link ids supplying at least one value in tile."""
+        owner = npy.unique(self.owners[key])
+        return set(owner[owner >= 0].tolist())
+
+    def clear_tile(self, key):
+        """Reset tile to empty, keeping its link footprint."""
+        self.tiles[key][:] = npy.nan
+        self.owners[key][:] = -1
+
+    def remap_links(self, lookup):
+        """Renumber tracked link ids, where lookup[old id] is the new id.
+
+        Links mapped to -1 are dropped from footprints and owners.
+        """
+        lookup = npy.append(npy.asarray(lookup, dtype=npy.int32), -1)
+        for key, owner in self.owners.items():
+            # Index -1 (no owner) picks the trailing -1 of lookup
+            self.owners[key] = lookup[owner]
+            self.footprints[key] = set(
+                int(lookup[link]) for link in self.footprints[key]
+                if lookup[link] >= 0)
+
+    def merge(self, other):
+        """Reduce another accumulator on the same grid into this one."""
+        for key, tile in other.tiles.items():
+            reduce_into(self.get_tile(key), tile, self.method)
+
+    def read(self, win):
+        """Return a float32 copy of window win, NaN where nothing was added."""
+        out = npy.full((win.nrows, win.ncols), npy.nan, dtype=npy.float32)
+        for key in self.tile_keys(win):
+            tile = self.tiles.get(key)
+            if tile is None:
+                continue
+            twin = self.tile_window(key)
+            common = window_intersect(win, twin)
+            out[window_slices(common, win)] = tile[
+                window_slices(common, twin)]
+        return out
+
+    def to_array(self):
+        """Return the full grid as a float32 array, NaN where empty."""
+        return self.read(Window(0, 0, self.nrows, self.ncols))
+
+    def nanmin(self):
+        """Return minimum value accumulated, or None if empty."""
+        mins = [npy.nanmin(tile) for tile in self.tiles.values()
+                if not npy.isnan(tile).all()]
+        return min(mins) if mins else None
+
+    def state(self, prefix):
+        """Return dict of arrays holding tiles, for saving with npy.savez."""
+        arrays = {}
+        for key, tile in self.tiles.items():
+            name = "{}_{}_{}".format(prefix, key[0], key[1])
+            arrays[name + "_t"] = tile
+            if self.owners is not None:
+                arrays[name + "_o"] = self.owners[key]
+                arrays[name + "_f"] = npy.array(
+                    sorted(self.footprints[key]), dtype=npy.int32)
+        return arrays
+
+    def load_state(self, npz, prefix):
+        """Load tiles saved by state from an npz file object."""
+        for name in npz.files:
+            parts = name.split("_")
+            if parts[0] != prefix or parts[-1] != "t":
+                continue
+            key = (int(parts[1]), int(parts[2]))
+            base = name[:-2]
+            self.tiles[key] = npz[name]
+            if self.owners is not None:
+                self.owners[key] = npz[base + "_o"]
+                self.footprints[key] = set(npz[base + "_f"].tolist())
@@ -0,0 +1,123 @@
+"""Sparse storage of normalized least-cost corridors (NLCCs) for each link.
+
+Only cells at or below the CWD threshold are kept. Each link is stored as
+its window on the analysis grid, the flat indices of kept cells within the
+window and their values. All links go into one NumPy .npz container that is
+written link by link, so the full set never has to be held in memory.
+
+"""
+
+import zipfile
+
+import numpy as npy
+
+from lm_grid import Window
+
+GRID_KEY = "grid"  # xmin, ymax, cell size, rows and columns of grid
+SR_KEY = "spatial_ref"  # Spatial reference string of grid
+THRESH_KEY = "cwd_thresh"
+
+
+def link_key(core1, core2):
+    """Return container key for the link between two cores."""
+    core1, core2 = sorted([int(core1), int(core2)])
+    return "{}_{}".format(core1, core2)
+
+
+class NlccWriter(object):
+    """Write NLCCs for links to a sparse container file."""
+
+    def __init__(self, filename, grid, spatial_ref, cwd_thresh):
+        """Open container and write grid geometry and threshold.
+
+        grid -- object with xmin, ymax, cell_size, nrows and ncols
+        spatial_ref -- spatial reference string of the grid
+        """
+        self.cwd_thresh = float(cwd_thresh)
+        self.zip_file = zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED,
+                                        allowZip64=True)
+        self.write(GRID_KEY, npy.array([grid.xmin, grid.ymax,
+                                        grid.cell_size, grid.nrows,
+                                        grid.ncols], dtype=npy.float64))
+        self.write(SR_KEY, npy.array(spatial_ref))
+        self.write(THRESH_KEY, npy.array(self.cwd_thresh))
+
+    def write(self, name, array):
+        """Write array to container as name.npy."""
+        with self.zip_file.open(name + ".npy", 'w',
+                                force_zip64=True) as npy_file:
+            npy.lib.format.write_array(npy_file, npy.asanyarray(array),
+                                       allow_pickle=False)
+
+    def add(self, core1, core2, win, nlcc):
+        """Add NLCC array for window win, keeping cells <= threshold.
+
+        Returns number of cells kept.
+        """
+        with npy.errstate(invalid='ignore'):
+            keep = (nlcc <= self.cwd_thresh).ravel()
+        index = npy.flatnonzero(keep)
+        index = index.astype(npy.uint32 if index.size == 0 or
+                             index[-1] < 2 ** 32 else npy.int64)
+        self.add_sparse(core1, core2, win, index,
+                        nlcc.ravel()[keep].astype(npy.float32))
+        return index.size
+
+    def add_sparse(self, core1, core2, win, index, values):
+        """Add link as window, flat cell indices and values (see sparse)."""
+        key = link_key(core1, core2)
+        self.write(key + "_win", npy.array(win, dtype=npy.int64))
+        self.write(key + "_idx", index)
+        self.write(key + "_val", values)
+
+    def close(self):
+        """Close container."""
+        self.zip_file.close()
+
+
+class NlccReader(object):
+    """Read NLCCs for links from a sparse container file."""
+
+    def __init__(self, filename):
+        """Open container."""
+        self.npz = npy.load(filename, allow_pickle=False)
+        xmin, ymax, cell_size, nrows, ncols = self.npz[GRID_KEY]
+        self.xmin = xmin
+        self.ymax = ymax
+        self.cell_size = cell_size
+        self.nrows = int(nrows)
+        self.ncols = int(ncols)
+        self.spatial_ref = str(self.npz[SR_KEY])
+        self.cwd_thresh = float(self.npz[THRESH_KEY])
+
+    def has_link(self, core1, core2):
+        """Return True if container holds link between the two cores."""
+        return link_key(core1, core2) + "_win" in self.npz.files
+
+    def links(self):
+        """Return list of (core1, core2) pairs held in container."""
+        return [tuple(int(core) for core in name[:-4].split("_"))
+                for name in self.npz.files if name.endswith("_win")]
+
+    def sparse(self, core1, core2):
+        """Return window, flat indices and values of cells for link."""
+        key = link_key(core1, core2)
+        return (Window(*[int(val) for val in self.npz[key + "_win"]]),
+                self.npz[key + "_idx"], self.npz[key + "_val"])
+
+    def dense(self, core1, core2, cutoff=None):
+        """Return window and float32 array of link NLCC, NaN elsewhere.
+
+        If cutoff is given, cells with values above it are also NaN.
+        """
+        win, index, values = self.sparse(core1, core2)
+        if cutoff is not None:
+            keep = values <= cutoff
+            index, values = index[keep], values[keep]
+        array = npy.full(win.nrows * win.ncols, npy.nan, dtype=npy.float32)
+        array[index] = values
+        return win, array.reshape(win.nrows, win.ncols)
+
+    def close(self):
+        """Close container."""
+        self.npz.close()
@@ -0,0 +1,98 @@
+"""Read and write rasters as NumPy arrays aligned to the analysis grid.
+
+The analysis grid is that of the resistance raster. Arrays are read and
+written by window (see lm_grid), with NoData held as NaN.
+
+"""
+
+from collections import namedtuple
+
+import numpy as npy
+import arcpy
+
+from lm_grid import Window
+
+FLOAT_NODATA = -3.4028235e38
+INT_NODATA = -2147483647
+
+Grid = namedtuple('Grid', 'xmin ymax cell_size nrows ncols spatial_ref')
+
+
+def grid_info(raster):
+    """Return grid geometry of raster."""
+    desc = arcpy.Describe(raster)
+    cell_size = float(desc.meanCellHeight)
+    extent = desc.extent
+    return Grid(extent.XMin, extent.YMax, cell_size,
+                int(round((extent.YMax - extent.YMin) / cell_size)),
+                int(round((extent.XMax - extent.XMin) / cell_size)),
+                desc.spatialReference)
+
+
+def raster_window(raster, grid):
+    """Return window of grid covered by raster extent, snapped to grid."""
+    extent = arcpy.Describe(raster).extent
+    row = int(round((grid.ymax - extent.YMax) / grid.cell_size))
+    col = int(round((extent.XMin - grid.xmin) / grid.cell_size))
+    row_end = int(round((grid.ymax - extent.YMin) / grid.cell_size))
+    col_end = int(round((extent.XMax - grid.xmin) / grid.cell_size))
+    row, col = max(row, 0), max(col, 0)
+    row_end, col_end = min(row_end, grid.nrows), min(col_end, grid.ncols)
+    return Window(row, col, row_end - row, col_end - col)
+
+
+def lower_left(grid, win):
+    """Return lower left corner point of window win."""
+    return arcpy.Point(grid.xmin + win.col * grid.cell_size,
+                       grid.ymax - (win.row + win.nrows) * grid.cell_size)
+
+
+def read_window(raster, grid, win, dtype=npy.float32):
+    """Read window win of raster into a float array with NaN for NoData."""
+    if arcpy.Raster(raster).isInteger:
+        array = arcpy.RasterToNumPyArray(raster, lower_left(grid, win),
+                                         win.ncols, win.nrows, INT_NODATA)
+        nodata = array == INT_NODATA
+        array = array.astype(dtype)
+        array[nodata] = npy.nan
+    else:
+        array = arcpy.RasterToNumPyArray(raster, lower_left(grid, win),
+                                         win.ncols, win.nrows, npy.nan)
+        array = array.astype(dtype, copy=False)
+    return array
+
+
+def array_to_raster(array, grid, win, integer=False):
+    """Return Raster object from array covering window win.
+
+    NaN cells become NoData. If integer is True values are truncated to
+    32 bit integers, as with the Spatial Analyst Int tool.
+    """
+    nodata = npy.isnan(array)
+    if integer:
+        out_array = npy.trunc(npy.where(nodata, 0, array)).astype(npy.int32)
+        out_array[nodata] = INT_NODATA
+        nodata_value = INT_NODATA
+    else:
+        out_array = npy.where(nodata, FLOAT_NODATA, array).astype(
+            npy.float32)
+        nodata_value = FLOAT_NODATA
+    return arcpy.NumPyArrayToRaster(out_array, lower_left(grid, win),
+                                    grid.cell_size, grid.cell_size,
+                                    nodata_value)
+
+
+def save_array(array, grid, win, out_raster, integer=False):
+    """Save array covering window win to out_raster (see array_to_raster)."""
+    out_ras = array_to_raster(array, grid, win, integer)
+    out_ras.save(out_raster)
+    arcpy.DefineProjection_management(out_raster, grid.spatial_ref)
+    del out_ras
+
+
+def grid_from_nlcc(reader):
+    """Return grid geometry stored in a sparse NLCC container reader."""
+    spatial_ref = arcpy.SpatialReference()
+    spatial_ref.loadFromString(reader.spatial_ref)
+    return Grid(reader.xmin, reader.ymax, reader.cell_size, reader.nrows,
+                reader.ncols, spatial_ref)
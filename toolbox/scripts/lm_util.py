@@ -4,7 +4,7 @@
 
 import os
 import sys
-import subprocess
+import multiprocessing
 from datetime import datetime as dt
 import time
 import traceback
@@ -27,6 +27,7 @@ import numpy as npy
 import arcpy
 
 from lm_config import tool_env as cfg
+import lm_cs_process as lcp
 try:
     test = cfg.releaseNum
 except Exception:
@@ -120,6 +121,14 @@ def get_links_from_core_pairs(linktable, firstCore, secondCore):
         exit_with_python_error(_SCRIPT_NAME)
 
 
+def core_pair_keys(cores1, cores2, maxcore):
+    """Packs each unordered pair of core IDs into one integer key"""
+    cores1 = npy.asarray(cores1).astype(npy.int64)
+    cores2 = npy.asarray(cores2).astype(npy.int64)
+    return (npy.minimum(cores1, cores2) * (int(maxcore) + 1) +
+            npy.maximum(cores1, cores2))
+
+
 def drop_links(linktable, maxeud, mineud, maxcwd, mincwd,
                DISABLE_LEAST_COST_NO_VAL):
     """Inactivates links that fail to meet min or max length criteria"""
@@ -1923,45 +1932,71 @@ def move_map(oldMap, newMap):
     return
 
 
-@Retry(10)
-def call_circuitscape(cspath, outConfigFile):
-    """Call Circuitscape."""
-    mem_flag = False
-    fail_flag = False
+def show_cs_line(job, line, failed):
+    """Print a line of Circuitscape output worth showing.
+
+    failed -- list of jobs that have written a traceback, added to here
+    """
+    if 'Traceback' in line:
+        gprint("\nCircuitscape failed.")
+        failed.append(job)
+    if ('Processing' not in line and 'laplacian' not in line
+            and 'node_map' not in line
+            and (('--' in line) or ('sec' in line) or (job in failed))):
+        gprint("      " + line)
+
+
+def run_circuitscape_jobs(cspath, jobs):
+    """Run Circuitscape on lm_cs_process CSJobs, several at once.
+
+    Returns list of CSResult in job order.
+    """
     gprint('     Calling Circuitscape:')
-    proc = subprocess.Popen([cspath, outConfigFile],
-                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                            shell=True)
-    while proc.poll() is None:
-        output = proc.stdout.readline().decode()
-
-        if 'Traceback' in output:
-            gprint("\nCircuitscape failed.")
-            fail_flag = True
-            if 'memory' in output:
-                mem_flag = True
-        if ('Processing' not in output and 'laplacian' not in output
-                and 'node_map' not in output
-                and (('--' in output) or ('sec' in output)
-                     or (fail_flag is True))):
-            gprint("      " + output.replace("\r\n", ""))
-
-    # Catch any output lost if process closes too quickly
-    output = proc.communicate()[0].decode()
-    for line in output.split('\r\n'):
-        if 'Traceback' in line:
-            gprint("\nCircuitscape failed.")
-            if 'valid sources' in output.lower():
-                gprint('Corridors may be too narrow. Try upping your CWD '
-                       'cutoff distance.')
-            if 'memory' in line:
-                mem_flag = True
-        if ('Processing' not in line and 'laplacian' not in line
-                and 'node_map' not in line
-                and (('--' in line) or ('sec' in line)
-                     or (fail_flag is True))):
-            gprint("      " + str(line))
-    return mem_flag
+    failed = []
+    runs = lcp.run_jobs(cspath, jobs, cfg.CS_PROCESSES,
+                        lambda job, line: show_cs_line(job, line, failed))
+    for run in runs:
+        if run.timed_out:
+            warn('Circuitscape was stopped after ' + str(run.job.timeout) +
+                 ' seconds on ' + run.job.name + '.')
+        elif run.failed and any('valid sources' in line.lower()
+                                for line in run.output):
+            gprint('Corridors may be too narrow. Try upping your CWD '
+                   'cutoff distance.')
+    return [lcp.read_result(run) for run in runs]
+
+
+def solve_circuit_batch(jobs, manifestFile):
+    """Run Circuitscape on jobs in one session working through a manifest.
+
+    jobs -- list of lm_cs_process CSJob, each with its .ini file written
+    Circuitscape 4 is imported once by cfg.CS_PYTHON and writes its result
+    files as usual. Yields result records as each job is done (see
+    lm_cs_process.stream_manifest).
+    """
+    if not cfg.CS_PYTHON:
+        raise_error('Batch Circuitscape runs need CS_PYTHON set to the '
+                    'Python 2.7 Circuitscape 4 is installed in.')
+    lcp.write_manifest(manifestFile, jobs)
+    gprint('     Running ' + str(len(jobs)) + ' Circuitscape jobs in one '
+           'session:')
+    for record in lcp.stream_manifest(cfg.CS_PYTHON, manifestFile,
+                                      lambda line: gprint("      " + line)):
+        if record['error'] is not None:
+            gprint("\nCircuitscape failed on " + record['name'] + ":")
+            gprint(record['error'])
+        yield record
+
+
+@Retry(10)
+def call_circuitscape(cspath, outConfigFile, outputFile=''):
+    """Call Circuitscape on one config file.
+
+    Returns whether it failed for lack of memory.
+    """
+    job = lcp.CSJob(os.path.basename(outConfigFile), outConfigFile,
+                    outputFile, cfg.CS_TIMEOUT)
+    return run_circuitscape_jobs(cspath, [job])[0].run.mem_error
 
 
 def rename_fields(FC):
@@ -2358,9 +2393,92 @@ class MEMORYSTATUSEX(ctypes.Structure):
         self.dwLength = 2*4 + 7*8     # size = 2 ints, 7 longs
         return super(MEMORYSTATUSEX, self).__init__()
 
+def read_meminfo():
+    """Return total and available memory in bytes from /proc/meminfo."""
+    info = {}
+    with open('/proc/meminfo') as meminfo:
+        for line in meminfo:
+            parts = line.split()
+            if len(parts) >= 2:
+                info[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    total = info['MemTotal']
+    if 'MemAvailable' in info:
+        return total, info['MemAvailable']
+    # Kernels before 3.14
+    return total, (info.get('MemFree', 0) + info.get('Buffers', 0) +
+                   info.get('Cached', 0))
+
+
+def read_cgroup_mem():
+    """Return cgroup v2 memory limit and usage in bytes, or None.
+
+    Returns None if the process's cgroup has no memory limit.
+    """
+    cgroupDir = '/sys/fs/cgroup'
+    try:
+        with open('/proc/self/cgroup') as cgroups:
+            for line in cgroups:
+                if line.startswith('0::'):
+                    cgroupDir = (cgroupDir +
+                                 line.strip()[3:].rstrip('/'))
+        with open(os.path.join(cgroupDir, 'memory.max')) as limitFile:
+            limit = limitFile.read().strip()
+        if limit == 'max':
+            return None
+        with open(os.path.join(cgroupDir, 'memory.current')) as usageFile:
+            usage = int(usageFile.read().strip())
+        return int(limit), usage
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def get_mem_bytes():
+    """Return total and available physical memory in bytes.
+
+    Uses GlobalMemoryStatusEx on Windows, and /proc/meminfo capped by any
+    cgroup v2 memory limit on Linux.
+    """
+    if sys.platform == 'win32':
+        stat = MEMORYSTATUSEX()
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
+        return stat.ullTotalPhys, stat.ullAvailPhys
+    try:
+        total, avail = read_meminfo()
+    except (IOError, OSError, KeyError, ValueError):
+        pageSize = os.sysconf('SC_PAGE_SIZE')
+        total = os.sysconf('SC_PHYS_PAGES') * pageSize
+        try:
+            avail = os.sysconf('SC_AVPHYS_PAGES') * pageSize
+        except (ValueError, OSError):
+            avail = total
+    cgroupMem = read_cgroup_mem()
+    if cgroupMem is not None:
+        limit, usage = cgroupMem
+        total = min(total, limit)
+        avail = max(0, min(avail, limit - usage))
+    return total, avail
+
+
 def get_mem():
-    stat = MEMORYSTATUSEX()
-    ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
-    totMem = float(int(10 * float(stat.ullTotalPhys)/1073741824))/10
-    availMem = float(int(10 * float(stat.ullAvailPhys)/1073741824))/10
+    """Return total and available physical memory in GB."""
+    totBytes, availBytes = get_mem_bytes()
+    totMem = float(int(10 * float(totBytes)/1073741824))/10
+    availMem = float(int(10 * float(availBytes)/1073741824))/10
     return totMem, availMem
+
+
+def worker_python():
+    """Return Python executable for worker processes.
+
+    Under ArcGIS Pro sys.executable is ArcGISPro.exe, so the python.exe of
+    its environment is used instead.
+    """
+    python_exe = os.path.join(sys.exec_prefix, 'python.exe')
+    if os.path.exists(python_exe):
+        return python_exe
+    return sys.executable
+
+
+def set_worker_executable():
+    """Have worker processes run python rather than ArcGIS Pro."""
+    multiprocessing.set_executable(worker_python())
@@ -8,10 +8,14 @@ import glob
 import traceback
 from collections import namedtuple
 
+import numpy as npy
+
 import arcpy
 
 from lm_config import tool_env as lm_env
 import lm_util
+import lm_nlcc
+import lm_raster
 
 
 _SCRIPT_NAME = "lp_main.py"
@@ -21,6 +25,8 @@ NM_MAX = "MAX_VALUE"  # Maximum value normalization
 
 CoordPoint = namedtuple('Point', 'x y')
 
+OID_KEY = "OID@"  # Key of ObjectIDs in tables read by read_fields
+
 
 class AppError(Exception):
     """Custom error class."""
@@ -75,7 +81,11 @@ def blended_priority(rast_list, lcp_ncsp):
     overall_bp = arcpy.sa.CellStatistics(
         [rast[1] for rast in blend_rast],
         statistics_type="MAXIMUM", ignore_nodata="DATA")
-    overall_bp.save(os.path.join(lm_env.OUTPUTGDB, "blended_priority"))
+    bp_rast = os.path.join(lm_env.OUTPUTGDB, "blended_priority")
+    overall_bp.save(bp_rast)
+    # Corridors are built from arrays, which carry no spatial reference
+    arcpy.DefineProjection_management(
+        bp_rast, arcpy.Describe(lm_env.RESRAST_IN).spatialReference)
 
 
 def inv_norm(rast_list):
@@ -95,36 +105,71 @@ def clip_nlcc_to_threashold(lcp_list):
     """Clip NLCC_A_B rasters to CWD threshold.
 
     Clip the normalized least cost corridors using the specified CWD
-    Threshold.
+    Threshold. Corridors are read from the sparse NLCC container written by
+    Linkage Pathways, or from the NLCC grids in the nlc folders for projects
+    run before the container was added.
     """
     lm_util.gprint("-Clipping NLCC rasters to CWD threshold")
 
-    prev_workspace = arcpy.env.workspace
-    nlcc_top_list = []
-
-    for dirpath, _, filenames in arcpy.da.Walk(
-            lm_env.LCCBASEDIR, topdown=True, datatype="RasterDataset"):
-        arcpy.env.workspace = dirpath
-        for filename in filenames:
-            if lm_env.LCCNLCDIR_NM in dirpath and filename in lcp_list:
-                rast = arcpy.sa.ExtractByAttributes(
-                    filename,
-                    "VALUE <= {}".format(lm_env.CWDTHRESH))
-
-                # Raster names cannot begin with a number in a GDB
-                nfilename = '_'.join(["nlc", filename])
-
-                nlcc_top_list.append([nfilename, rast])
+    if os.path.isfile(lm_env.NLCCFILE):
+        nlcc_top_list = clip_nlcc_container(lcp_list)
+    else:
+        nlcc_top_list = clip_nlcc_grids(lcp_list)
 
     if not nlcc_top_list:
         raise AppError("No normalized least cost corridor rasters found")
 
-    arcpy.env.workspace = prev_workspace
     save_interm_rast(nlcc_top_list, "bp_step1")
 
     return nlcc_top_list
 
 
+def clip_nlcc_container(lcp_list):
+    """Clip NLCCs in the sparse NLCC container to CWD threshold."""
+    nlcc_top_list = []
+    nlcc_reader = lm_nlcc.NlccReader(lm_env.NLCCFILE)
+    try:
+        grid = lm_raster.grid_from_nlcc(nlcc_reader)
+        for lcp_name in lcp_list:
+            core1, core2 = lcp_name.split("_")
+            if not nlcc_reader.has_link(core1, core2):
+                continue
+            win, nlcc = nlcc_reader.dense(core1, core2, lm_env.CWDTHRESH)
+            rast = lm_raster.array_to_raster(nlcc, grid, win)
+
+            # Raster names cannot begin with a number in a GDB
+            nfilename = '_'.join(["nlc", lcp_name])
+
+            nlcc_top_list.append([nfilename, rast])
+    finally:
+        nlcc_reader.close()
+    return nlcc_top_list
+
+
+def clip_nlcc_grids(lcp_list):
+    """Clip NLCC grids in the nlc folders to CWD threshold."""
+    prev_workspace = arcpy.env.workspace
+    nlcc_top_list = []
+
+    try:
+        for dirpath, _, filenames in arcpy.da.Walk(
+                lm_env.LCCBASEDIR, topdown=True, datatype="RasterDataset"):
+            arcpy.env.workspace = dirpath
+            for filename in filenames:
+                if lm_env.LCCNLCDIR_NM in dirpath and filename in lcp_list:
+                    rast = arcpy.sa.ExtractByAttributes(
+                        filename,
+                        "VALUE <= {}".format(lm_env.CWDTHRESH))
+
+                    # Raster names cannot begin with a number in a GDB
+                    nfilename = '_'.join(["nlc", filename])
+
+                    nlcc_top_list.append([nfilename, rast])
+    finally:
+        arcpy.env.workspace = prev_workspace
+    return nlcc_top_list
+
+
 def lcp_csp_for_bp(lcp_lines):
     """Get list of LCPs and their normalized CSP values for BP raster creation.
 
@@ -176,76 +221,172 @@ def check_add_field(feature_class, field_name, data_type):
     return exists
 
 
-def clim_priority_combine(lcp_lines):
+def read_fields(table, fields):
+    """Read fields from every row of table in one cursor pass.
+
+    Returns dict of field name: float array (NaN for nulls), with row
+    ObjectIDs under OID_KEY so values can be written back by write_fields.
+    """
+    oid_field = arcpy.Describe(table).OIDFieldName
+    columns = dict((field, []) for field in fields)
+    oids = []
+    rows = arcpy.SearchCursor(table, fields="; ".join([oid_field] + fields))
+    for row in rows:
+        oids.append(row.getValue(oid_field))
+        for field in fields:
+            columns[field].append(row.getValue(field))
+    del rows
+
+    values = dict((field, npy.array([npy.nan if val is None else val
+                                     for val in column], dtype=npy.float64))
+                  for field, column in columns.items())
+    values[OID_KEY] = npy.array(oids, dtype=npy.int64)
+    return values
+
+
+def write_fields(table, values):
+    """Write arrays of field values to table in one cursor pass.
+
+    values -- dict of field name: array, with ObjectIDs under OID_KEY (see
+              read_fields). NaN is written as null.
+    """
+    oid_field = arcpy.Describe(table).OIDFieldName
+    fields = [field for field in values if field != OID_KEY]
+    row_of_oid = dict((oid, row_no)
+                      for row_no, oid in enumerate(values[OID_KEY].tolist()))
+    rows = arcpy.UpdateCursor(table, fields="; ".join([oid_field] + fields))
+    for row in rows:
+        row_no = row_of_oid.get(row.getValue(oid_field))
+        if row_no is None:
+            continue
+        for field in fields:
+            value = values[field][row_no].item()
+            if isinstance(value, float) and value != value:
+                value = None
+            row.setValue(field, value)
+        rows.updateRow(row)
+    del rows
+
+
+def core_values(cores, field, core_ids):
+    """Return field values of core_ids from cores read by read_fields."""
+    table_ids = cores[lm_env.COREFN]
+    order = npy.argsort(table_ids, kind="mergesort")
+    pos = npy.minimum(npy.searchsorted(table_ids[order], core_ids),
+                      len(order) - 1)
+    missing = table_ids[order][pos] != core_ids
+    if missing.any():
+        raise AppError("ERROR: Core " + str(int(core_ids[missing][0])) +
+                       " not found in Cores feature class")
+    return cores[field][order][pos]
+
+
+def pair_values(pairs, field, from_cores, to_cores):
+    """Return field values of core pairs, in either order, from pairs table.
+
+    pairs -- core pairs table read by read_fields
+    """
+    def pair_keys(cores1, cores2, base):
+        return (npy.minimum(cores1, cores2) * base +
+                npy.maximum(cores1, cores2))
+
+    table_from = pairs[lm_env.FROMCOREFIELD]
+    table_to = pairs[lm_env.TOCOREFIELD]
+    base = max(npy.max(table_from), npy.max(table_to),
+               npy.max(from_cores), npy.max(to_cores)) + 1
+    table_keys = pair_keys(table_from, table_to, base)
+    keys = pair_keys(from_cores, to_cores, base)
+    order = npy.argsort(table_keys, kind="mergesort")
+    pos = npy.minimum(npy.searchsorted(table_keys[order], keys),
+                      len(order) - 1)
+    missing = table_keys[order][pos] != keys
+    if missing.any():
+        raise AppError("ERROR: Core pair " +
+                       str(int(from_cores[missing][0])) + "-" +
+                       str(int(to_cores[missing][0])) +
+                       " not found in core pairs table")
+    return pairs[field][order][pos]
+
+
+def normalize_values(values, normalization_method=NM_MAX, invert=False):
+    """Normalize array of values.
+
+    Normalize values using score range or max score method, with optional
+    inversion. NaN values are ignored and stay NaN, unless no value is
+    above 0, when all values are 0.
+    """
+    min_val = npy.nanmin(values)
+    max_val = npy.nanmax(values)
+    if not max_val > 0:
+        return npy.zeros(len(values))
+    if normalization_method == NM_SCORE:
+        if invert:
+            return (max_val - values) / (max_val - min_val)
+        return (values - min_val) / (max_val - min_val)
+    else:  # Max score normalization
+        if invert:
+            return (max_val + min_val - values) / max_val
+        return values / max_val
+
+
+def clim_priority_combine(clim_values):
     """Combine climate priority (A & L) values.
 
     Combine climate priority values A & L in a weighted sum to yield Core
     Areas Climate Linkage Priority Value (O).
     """
-    check_add_field(lcp_lines, "Clim_Lnk_Priority", "float")
-    lnk_rows = arcpy.UpdateCursor(
-        lcp_lines,
-        fields="Clim_Lnk_Priority; NCLPv_Analog; NCLPv_Prefer")
-    for lnk_row in lnk_rows:
-        lnk_row.setValue(
-            "Clim_Lnk_Priority",
-            (lnk_row.getValue("NCLPv_Analog") * lm_env.CANALOG_WEIGHT) +
-            (lnk_row.getValue("NCLPv_Prefer") * lm_env.CPREF_WEIGHT))
-        lnk_rows.updateRow(lnk_row)
-    del lnk_rows
-
-
-def normalize_field(in_table, in_field, out_field,
-                    normalization_method=NM_MAX, invert=False):
-    """Normalize values in in_field into out_field.
-
-    Normalize values in in_field into out_field using score range or max
-    score method, with optional inversion.
-    """
-    check_add_field(in_table, out_field, "DOUBLE")
-    min_val, max_val = value_range(in_table, in_field)
+    clim_values["Clim_Lnk_Priority"] = (
+        (clim_values["NCLPv_Analog"] * lm_env.CANALOG_WEIGHT) +
+        (clim_values["NCLPv_Prefer"] * lm_env.CPREF_WEIGHT))
 
-    if max_val > 0:
-        try:
-            if normalization_method == NM_SCORE:
-                if invert:
-                    arcpy.CalculateField_management(
-                        in_table, out_field,
-                        "(" + str(max_val) + " - !" + in_field + "!) / " +
-                        str(max_val - min_val), "PYTHON_9.3")
-                else:
-                    arcpy.CalculateField_management(
-                        in_table, out_field,
-                        "(!" + in_field + "! - " + str(min_val) + ") / " +
-                        str(max_val - min_val), "PYTHON_9.3")
-            else:  # Max score normalization
-                if invert:
-                    arcpy.CalculateField_management(
-                        in_table, out_field,
-                        "(" + str(max_val + min_val) + " - !" +
-                        in_field + "!) / " + str(max_val), "PYTHON_9.3")
-                else:
-                    arcpy.CalculateField_management(
-                        in_table, out_field,
-                        "!" + in_field + "! / " + str(max_val), "PYTHON_9.3")
-        except arcpy.ExecuteError:
+
+def normalized_fields(values, fields):
+    """Return normalized values of fields.
+
+    values -- table read by read_fields
+    fields -- list of (in_field, out_field, normalization_method, invert)
+    Returns dict of out_field: normalized array, with ObjectIDs under
+    OID_KEY, ready for write_fields.
+    """
+    norm_values = {OID_KEY: values[OID_KEY]}
+    for in_field, out_field, normalization_method, invert in fields:
+        in_values = values[in_field]
+        if npy.isnan(in_values).any() and npy.nanmax(in_values) > 0:
             lm_util.gprint(
                 "ERROR! MOST LIKELY CAUSE: One or more core areas are smaller "
                 "than a pixel in the Resistance layer and/or Raster Analysis "
                 "Cell Size environment setting. Try enlarging small core "
                 "areas, resampling the Resistance layer or adjusting the Cell"
                 "Size environment setting.")
-            raise
-    else:
-        arcpy.CalculateField_management(in_table, out_field, "0", "PYTHON_9.3")
+            raise AppError("ERROR: Null values in field " + in_field)
+        norm_values[out_field] = normalize_values(
+            in_values, normalization_method, invert)
+    return norm_values
+
+
+def normalize_fields(in_table, fields):
+    """Normalize values of in_fields into out_fields.
+
+    Normalize using score range or max score method, with optional
+    inversion, reading all in_fields in one pass and writing all out_fields
+    in one pass.
+    fields -- list of (in_field, out_field, normalization_method, invert)
+    """
+    in_fields = []
+    for field in fields:
+        if field[0] not in in_fields:
+            in_fields.append(field[0])
+        check_add_field(in_table, field[1], "DOUBLE")
+    write_fields(in_table,
+                 normalized_fields(read_fields(in_table, in_fields), fields))
 
 
-def clim_priority_val_normal(lcp_lines):
+def clim_priority_val_normal(clim_values):
     """Normalize climate priority values (A & L) for each core pair."""
-    normalize_field(lcp_lines, "CLPv_Analog", "NCLPv_Analog",
-                    lm_env.CANALOGNORMETH)
-    normalize_field(lcp_lines, "CLPv_Prefer", "NCLPv_Prefer",
-                    lm_env.CPREFERNORMETH)
+    clim_values["NCLPv_Analog"] = normalize_values(
+        clim_values["CLPv_Analog"], lm_env.CANALOGNORMETH)
+    clim_values["NCLPv_Prefer"] = normalize_values(
+        clim_values["CLPv_Prefer"], lm_env.CPREFERNORMETH)
 
 
 def sline_y_value(x_coord, slope_val, intercept_val):
@@ -274,42 +415,39 @@ def slope(point1, point2):
 
 
 def clim_lnk_value(xlnk, min_pnt, target_pnt, max_pnt):
-    """Calculate climate linkage value using equation of straight line."""
-    if target_pnt.y is None:
-        line_slope = slope(min_pnt, max_pnt)
-        line_intercept = intercept(max_pnt, line_slope)
-    elif xlnk < target_pnt.y:
-        line_slope = slope(min_pnt, target_pnt)
-        line_intercept = intercept(target_pnt, line_slope)
-    elif xlnk > target_pnt.y:
-        line_slope = slope(target_pnt, max_pnt)
-        line_intercept = intercept(max_pnt, line_slope)
-    else:
-        line_slope = line_intercept = 1
-    return sline_y_value(xlnk, line_slope, line_intercept)
-
-
-def value_range(layer, field):
-    """Get value range of field in layer."""
-    min_value = arcpy.SearchCursor(
-        layer, fields=field, sort_fields=field + " A").next().getValue(field)
-    max_value = arcpy.SearchCursor(
-        layer, fields=field, sort_fields=field + " D").next().getValue(field)
-    return min_value, max_value
-
+    """Calculate climate linkage values using equation of straight line.
 
-def clim_priority_values(lcp_lines):
-    """Save climate priority values for each core pair to LCP layer.
-
-    Save Climate Analog Linkage Priority Value (A) and
-    Climate Preference Linkage Priority Value (L) for each core pair
-    to LCP Layer.
+    xlnk -- array of link climate ratios
     """
-    check_add_field(lcp_lines, "CLPv_Analog", "float")
-    check_add_field(lcp_lines, "CLPv_Prefer", "float")
-
-    canalog_r_min, canalog_r_max = value_range(lcp_lines, "CAnalog_Ratio")
-    cprefer_r_min, cprefer_r_max = value_range(lcp_lines, "CPrefer_Ratio")
+    with npy.errstate(divide='ignore', invalid='ignore'):
+        if target_pnt.y is None:
+            line_slope = slope(min_pnt, max_pnt)
+            return sline_y_value(xlnk, line_slope,
+                                 intercept(max_pnt, line_slope))
+        below_slope = slope(min_pnt, target_pnt)
+        above_slope = slope(target_pnt, max_pnt)
+        return npy.where(
+            xlnk < target_pnt.y,
+            sline_y_value(xlnk, below_slope,
+                          intercept(target_pnt, below_slope)),
+            npy.where(xlnk > target_pnt.y,
+                      sline_y_value(xlnk, above_slope,
+                                    intercept(max_pnt, above_slope)),
+                      sline_y_value(xlnk, 1, 1)))
+
+
+def clim_priority_values(clim_values):
+    """Calculate climate priority values for each core pair.
+
+    Calculate Climate Analog Linkage Priority Value (A) and
+    Climate Preference Linkage Priority Value (L) for each core pair.
+    """
+    canalog_ratio = clim_values["CAnalog_Ratio"]
+    cprefer_ratio = clim_values["CPrefer_Ratio"]
+    canalog_r_min = npy.nanmin(canalog_ratio)
+    canalog_r_max = npy.nanmax(canalog_ratio)
+    cprefer_r_min = npy.nanmin(cprefer_ratio)
+    cprefer_r_max = npy.nanmax(cprefer_ratio)
 
     if lm_env.CANALOG_MINRMAX > canalog_r_max:
         canalog_r_max = lm_env.CANALOG_MINRMAX
@@ -323,67 +461,39 @@ def clim_priority_values(lcp_lines):
     cprefer_target_pnt = CoordPoint(1, 1)
     cprefer_max_pnt = CoordPoint(cprefer_r_max, lm_env.CPREF_MAX)
 
-    lnk_rows = arcpy.UpdateCursor(
-        lcp_lines,
-        fields="CAnalog_Ratio; CPrefer_Ratio; CLPv_Analog; CLPv_Prefer")
-    for lnk_row in lnk_rows:
-        lnk_row.setValue(
-            "CLPv_Analog",
-            clim_lnk_value(
-                lnk_row.getValue("CAnalog_Ratio"),
-                canalog_min_pnt, canalog_target_pnt, canalog_max_pnt))
-
-        lnk_row.setValue(
-            "CLPv_Prefer",
-            clim_lnk_value(
-                lnk_row.getValue("CPrefer_Ratio"),
-                cprefer_min_pnt, cprefer_target_pnt, cprefer_max_pnt))
-        lnk_rows.updateRow(lnk_row)
-    del lnk_rows
-
-
-def clim_env_read(core_lyr, core, field):
-    """Read core climate envelope."""
-    rows = arcpy.SearchCursor(
-        core_lyr, fields=field,
-        where_clause=lm_env.COREFN + " = " + str(core))
-    return rows.next().getValue(field)
-
-
-def clim_ratios(lcp_lines, core_lyr):
-    """Calculate and save climate ratios to LCP layer.
-
-    Calculate and save climate ratios to LCP layer and include start core and
-    destination.
-    """
-    check_add_field(lcp_lines, "Core_Start", "integer")
-    check_add_field(lcp_lines, "Core_End", "integer")
-    check_add_field(lcp_lines, "CAnalog_Ratio", "float")
-    check_add_field(lcp_lines, "CPrefer_Ratio", "float")
+    clim_values["CLPv_Analog"] = clim_lnk_value(
+        canalog_ratio, canalog_min_pnt, canalog_target_pnt, canalog_max_pnt)
+    clim_values["CLPv_Prefer"] = clim_lnk_value(
+        cprefer_ratio, cprefer_min_pnt, cprefer_target_pnt, cprefer_max_pnt)
 
-    lnk_rows = arcpy.UpdateCursor(
-        lcp_lines,
-        fields=("From_Core; To_Core; Core_Start; Core_End; CAnalog_Ratio;"
-                "CPrefer_Ratio"))
-    for lnk_row in lnk_rows:
-        core_start = lnk_row.getValue("From_Core")
-        core_dest = lnk_row.getValue("To_Core")
-        clim_start = clim_env_read(core_lyr, core_start, "cclim_env")
-        clim_dest = clim_env_read(core_lyr, core_dest, "cclim_env")
 
-        if clim_start <= clim_dest and not lm_env.HIGHERCE_COOLER:
-            core_start, core_dest = core_dest, core_start
-            clim_start, clim_dest = clim_dest, clim_start
+def clim_ratios(links, cores):
+    """Calculate climate ratios and start and destination cores.
 
-        if lm_env.FCERAST_IN:
-            clim_dest = clim_env_read(core_lyr, core_dest, "fclim_env")
+    links -- LCP table read by read_fields
+    cores -- core table read by read_fields
+    Returns dict of field name: array of values for each link.
+    """
+    core_start = links["From_Core"]
+    core_dest = links["To_Core"]
+    clim_start = core_values(cores, "cclim_env", core_start)
+    clim_dest = core_values(cores, "cclim_env", core_dest)
+
+    if not lm_env.HIGHERCE_COOLER:
+        swap = clim_start <= clim_dest
+        core_start, core_dest = (npy.where(swap, core_dest, core_start),
+                                 npy.where(swap, core_start, core_dest))
+        clim_start, clim_dest = (npy.where(swap, clim_dest, clim_start),
+                                 npy.where(swap, clim_start, clim_dest))
+
+    if lm_env.FCERAST_IN:
+        clim_dest = core_values(cores, "fclim_env", core_dest)
 
-        lnk_row.setValue("Core_Start", core_start)
-        lnk_row.setValue("Core_End", core_dest)
-        lnk_row.setValue("CAnalog_Ratio", clim_dest/clim_start)
-        lnk_row.setValue("CPrefer_Ratio", clim_dest/lm_env.CPREF_VALUE)
-        lnk_rows.updateRow(lnk_row)
-    del lnk_rows
+    with npy.errstate(divide='ignore', invalid='ignore'):
+        return {"Core_Start": core_start.astype(npy.int64),
+                "Core_End": core_dest.astype(npy.int64),
+                "CAnalog_Ratio": clim_dest / clim_start,
+                "CPrefer_Ratio": clim_dest / lm_env.CPREF_VALUE}
 
 
 def core_mean(in_rast, core_lyr, in_var):
@@ -411,22 +521,31 @@ def clim_envelope(core_lyr):
         core_mean(lm_env.FCERAST_IN, core_lyr, "fclim_env")
 
 
-def clim_linkage_priority(lcp_lines, core_lyr):
-    """Calculate Core Areas Climate Linkage Priority Value."""
+def clim_linkage_priority(links, core_lyr):
+    """Calculate Core Areas Climate Linkage Priority Value.
+
+    Returns dict of field name: array of climate values for each link.
+    """
     lm_util.gprint("-Calculating Core Areas Climate Linkage Priority Value")
     clim_envelope(core_lyr)
-    clim_ratios(lcp_lines, core_lyr)
-    clim_priority_values(lcp_lines)
-    clim_priority_val_normal(lcp_lines)
-    clim_priority_combine(lcp_lines)
+    clim_fields = ["cclim_env"]
+    if lm_env.FCERAST_IN:
+        clim_fields.append("fclim_env")
+    cores = read_fields(core_lyr, [lm_env.COREFN] + clim_fields)
+
+    clim_values = clim_ratios(links, cores)
+    clim_priority_values(clim_values)
+    clim_priority_val_normal(clim_values)
+    clim_priority_combine(clim_values)
+    return clim_values
 
 
 def eciv():
     """Normalize Expert Corridor Importance Value (ECIV) for each corridor."""
     lm_util.gprint("-Normalizing Expert Corridor Importance Value (ECIV) "
                    "for each corridor")
-    normalize_field(lm_env.COREPAIRSTABLE_IN, lm_env.ECIVFIELD, "neciv",
-                    NM_SCORE)
+    normalize_fields(lm_env.COREPAIRSTABLE_IN,
+                     [(lm_env.ECIVFIELD, "neciv", NM_SCORE, False)])
 
 
 def chk_csp_wts():
@@ -458,7 +577,12 @@ def chk_csp_wts():
 
 
 def calc_csp(lcp_lines, core_lyr):
-    """Calculate Corridor Specific Priority (CSP) for each linkage."""
+    """Calculate Corridor Specific Priority (CSP) for each linkage.
+
+    Core and LCP attributes are read once, CSP and its climate components
+    are calculated for all links together and then written back to the LCP
+    layer in one pass.
+    """
     lm_util.gprint("Calculating Corridor Specific Priority (CSP) for each "
                    "linkage:")
     chk_csp_wts()
@@ -467,81 +591,59 @@ def calc_csp(lcp_lines, core_lyr):
     if lm_env.COREPAIRSTABLE_IN:
         eciv()
 
+    links = read_fields(lcp_lines,
+                        ["From_Core", "To_Core", "Rel_Close", "Rel_Perm"])
+    values = {OID_KEY: links[OID_KEY]}
+    field_types = {}
+
     # Calc climate envelope and analog ratio
     if lm_env.CCERAST_IN:
-        clim_linkage_priority(lcp_lines, core_lyr)
-        lnk_fields = ("From_Core; To_Core; Rel_Close; Rel_Perm; "
-                      "clim_lnk_priority; CSP")
-    else:
-        lnk_fields = "From_Core; To_Core; Rel_Close; Rel_Perm; CSP"
+        values.update(clim_linkage_priority(links, core_lyr))
+        field_types.update((field, "float") for field in (
+            "CAnalog_Ratio", "CPrefer_Ratio", "CLPv_Analog", "CLPv_Prefer",
+            "NCLPv_Analog", "NCLPv_Prefer", "Clim_Lnk_Priority"))
+        field_types.update((field, "integer")
+                           for field in ("Core_Start", "Core_End"))
 
     lm_util.gprint("-Calculating CSP")
-    check_add_field(lcp_lines, "CSP", "float")
-
-    lnk_rows = arcpy.UpdateCursor(
-        lcp_lines,
-        fields=lnk_fields)
-
-    for lnk_row in lnk_rows:
-        from_core = lnk_row.getValue("From_Core")
-        to_core = lnk_row.getValue("To_Core")
-
-        # Get and avg CAVs for the core pair
-        x_cav = arcpy.SearchCursor(
-            core_lyr,
-            where_clause="{} = {}".format(lm_env.COREFN, from_core),
-            fields="norm_cav").next().getValue("norm_cav")
-        y_cav = arcpy.SearchCursor(
-            core_lyr,
-            where_clause="{} = {}".format(lm_env.COREFN, to_core),
-            fields="norm_cav").next().getValue("norm_cav")
-
-        avg_cav = (x_cav + y_cav) / 2
-
-        # Calc weighted sum
-        csp = (
-            (lm_env.CLOSEWEIGHT * lnk_row.getValue("Rel_Close")) +
-            (lm_env.PERMWEIGHT * lnk_row.getValue("Rel_Perm")) +
-            (lm_env.CAVWEIGHT * avg_cav))
-
-        # Get ECIV for the core pair
-        if lm_env.COREPAIRSTABLE_IN and lm_env.ECIVFIELD:
-            neciv = arcpy.SearchCursor(
-                lm_env.COREPAIRSTABLE_IN,
-                where_clause="({0}={2} AND {1}={3}) "
-                "OR ({1}={2} AND {0}={3})".format(
-                    lm_env.FROMCOREFIELD, lm_env.TOCOREFIELD,
-                    from_core, to_core),
-                fields="neciv").next().getValue("neciv")
-            csp += lm_env.ECIVWEIGHT * neciv
-
-        # Increment weighted sum with Climate Gradient
-        if lm_env.CCERAST_IN:
-            csp += (lnk_row.getValue("Clim_Lnk_Priority") *
-                    lm_env.CEDWEIGHT)
-        lnk_row.setValue("CSP", csp)
-        lnk_rows.updateRow(lnk_row)
-    del lnk_rows
+    cores = read_fields(core_lyr, [lm_env.COREFN, "norm_cav"])
+
+    # Avg CAVs for the core pair
+    avg_cav = (core_values(cores, "norm_cav", links["From_Core"]) +
+               core_values(cores, "norm_cav", links["To_Core"])) / 2
+
+    # Calc weighted sum
+    csp = ((lm_env.CLOSEWEIGHT * links["Rel_Close"]) +
+           (lm_env.PERMWEIGHT * links["Rel_Perm"]) +
+           (lm_env.CAVWEIGHT * avg_cav))
+
+    # Add ECIV for the core pair
+    if lm_env.COREPAIRSTABLE_IN and lm_env.ECIVFIELD:
+        pairs = read_fields(lm_env.COREPAIRSTABLE_IN,
+                            [lm_env.FROMCOREFIELD, lm_env.TOCOREFIELD,
+                             "neciv"])
+        csp += lm_env.ECIVWEIGHT * pair_values(
+            pairs, "neciv", links["From_Core"], links["To_Core"])
+
+    # Increment weighted sum with Climate Gradient
+    if lm_env.CCERAST_IN:
+        csp += values["Clim_Lnk_Priority"] * lm_env.CEDWEIGHT
+    values["CSP"] = csp
+    field_types["CSP"] = "float"
 
     # Normalize CSP values
-    cps_norm_fld = "CSP_Norm"
-    normalize_field(lcp_lines, "CSP", cps_norm_fld)
+    values["CSP_Norm"] = normalize_values(csp)
+    field_types["CSP_Norm"] = "DOUBLE"
 
     # If user requests, flag low quality corridors not to use
     if lm_env.CPSNORM_CUTOFF:
-        csp_trim_fld = "CSP_Norm_Trim"
-        expression = "set_bool(!{}!, {})".format(cps_norm_fld,
-                                                 lm_env.CPSNORM_CUTOFF)
-        codeblock = (
-            """def set_bool(cps_norm, cps_cutoff):
-                   if cps_norm <= cps_cutoff:
-                       return 0
-                   else:
-                       return 1""")
+        values["CSP_Norm_Trim"] = npy.where(
+            values["CSP_Norm"] <= lm_env.CPSNORM_CUTOFF, 0, 1)
+        field_types["CSP_Norm_Trim"] = "SHORT"
 
-        check_add_field(lcp_lines, csp_trim_fld, "SHORT")
-        arcpy.CalculateField_management(lcp_lines, csp_trim_fld, expression,
-                                        "PYTHON_9.3", codeblock)
+    for field, field_type in field_types.items():
+        check_add_field(lcp_lines, field, field_type)
+    write_fields(lcp_lines, values)
 
 
 def chk_cav_wts():
@@ -603,16 +705,6 @@ def calc_cav(core_lyr):
                 core_lyr, lm_env.CORENAME + ".CF_Central",
                 "!" + lm_env.PREFIX + "_Cores.CF_Central!", "PYTHON_9.3")
             arcpy.RemoveJoin_management(core_lyr)
-        # Ensure cores have at least one non-0 value for CFC (could have been
-        # copied above or set earlier)
-        max_val = value_range(lm_env.COREFC, "CF_Central")[1]
-        if max_val is None or max_val == 0:
-            raise AppError(
-                "ERROR: A Current Flow Centrality Weight (CFCWEIGHT) was "
-                "provided but no Current Flow Centrality (CF_Central) "
-                "values are available. Please run Centrality Mapper on "
-                "this project, then run Linkage Priority.")
-
     check_add_field(lm_env.COREFC, "ncfc", "DOUBLE")
 
     # Calc mean resistance
@@ -626,14 +718,14 @@ def calc_cav(core_lyr):
     arcpy.CalculateField_management(core_lyr, "ap_ratio",
                                     "!area! / !perimeter!", "PYTHON_9.3")
 
-    # Normalize CAV inputs
-    normalize_field(core_lyr, "mean_res", "norm_res", lm_env.RESNORMETH,
-                    True)
-    normalize_field(core_lyr, "area", "norm_size", lm_env.SIZENORMETH)
-    normalize_field(core_lyr, "ap_ratio", "norm_ratio", lm_env.APNORMETH)
-    normalize_field(core_lyr, "ecav", "necav", lm_env.ECAVNORMETH)
-    normalize_field(core_lyr, "CF_Central", "ncfc", lm_env.CFCNORMETH)
-
+    # CAV inputs, normalized and weighted
+    cav_fields = [("mean_res", "norm_res", lm_env.RESNORMETH, True),
+                  ("area", "norm_size", lm_env.SIZENORMETH, False),
+                  ("ap_ratio", "norm_ratio", lm_env.APNORMETH, False),
+                  ("ecav", "necav", lm_env.ECAVNORMETH, False),
+                  ("CF_Central", "ncfc", lm_env.CFCNORMETH, False)]
+    cav_weights = [lm_env.RESWEIGHT, lm_env.SIZEWEIGHT, lm_env.APWEIGHT,
+                   lm_env.ECAVWEIGHT, lm_env.CFCWEIGHT]
     # Calc OCAV
     if lm_env.OCAVRAST_IN:
         # Get max and min
@@ -649,41 +741,38 @@ def calc_cav(core_lyr):
                        / (max_ocav - min_ocav))
         # Calc aerial mean ocav for each core
         core_mean(ocav_raster, core_lyr, "ocav")
-        normalize_field(core_lyr, "ocav", "nocav", NM_SCORE)
-
-        # Calc CAV
-        arcpy.CalculateField_management(
-            core_lyr, "cav",
-            "(!norm_res! * " + str(lm_env.RESWEIGHT) + ") + (!norm_size! * " +
-            str(lm_env.SIZEWEIGHT) + ") + (!norm_ratio! * " +
-            str(lm_env.APWEIGHT) + ") + (!necav! * " + str(lm_env.ECAVWEIGHT)
-            + ") + (!ncfc! * " + str(lm_env.CFCWEIGHT) + ") + (!nocav! * " +
-            str(lm_env.OCAVWEIGHT) + ")", "PYTHON_9.3")
-
-    else:
-        # Calc CAV
-        arcpy.CalculateField_management(
-            core_lyr, "cav", "(!norm_res! * " + str(lm_env.RESWEIGHT) +
-            ") + (!norm_size! * " + str(lm_env.SIZEWEIGHT) +
-            ") + (!norm_ratio! * " + str(lm_env.APWEIGHT) +
-            ") + (!necav! * " + str(lm_env.ECAVWEIGHT) + ") + (!ncfc! * " +
-            str(lm_env.CFCWEIGHT) + ")", "PYTHON_9.3")
-
-    normalize_field(core_lyr, "cav", "norm_cav", NM_SCORE)
+        cav_fields.append(("ocav", "nocav", NM_SCORE, False))
+        cav_weights.append(lm_env.OCAVWEIGHT)
 
+    cores = read_fields(core_lyr, [field[0] for field in cav_fields])
+    if lm_env.CFCWEIGHT > 0:
+        # Ensure cores have at least one non-0 value for CFC (could have been
+        # copied above or set earlier)
+        if not npy.nanmax(cores["CF_Central"]) > 0:
+            raise AppError(
+                "ERROR: A Current Flow Centrality Weight (CFCWEIGHT) was "
+                "provided but no Current Flow Centrality (CF_Central) "
+                "values are available. Please run Centrality Mapper on "
+                "this project, then run Linkage Priority.")
 
-def calc_closeness(lcp_lines):
-    """Calculate relative closeness for each Least Cost Path."""
-    lm_util.gprint("Calculating relative closeness for each LCP line")
-    normalize_field(lcp_lines, "LCP_Length", "Rel_Close",
-                    lm_env.RELCLOSENORMETH, True)
+    # Normalize CAV inputs, calc CAV and normalize it
+    cav_values = normalized_fields(cores, cav_fields)
+    cav = sum(cav_values[field[1]] * weight
+              for field, weight in zip(cav_fields, cav_weights))
+    cav_values["cav"] = cav
+    cav_values["norm_cav"] = normalize_values(cav, NM_SCORE)
+    write_fields(core_lyr, cav_values)
 
 
-def calc_permeability(lcp_lines):
-    """Calculate raw and relative permeability for each Least Cost Path."""
-    lm_util.gprint("Calculating permeability for each LCP line")
-    normalize_field(lcp_lines, "cwd_to_Path_Length_Ratio", "Rel_Perm",
-                    lm_env.RELPERMNORMETH, True)
+def calc_closeness_permeability(lcp_lines):
+    """Calculate relative closeness and permeability for each LCP."""
+    lm_util.gprint("Calculating relative closeness and permeability for each "
+                   "LCP line")
+    normalize_fields(
+        lcp_lines,
+        [("LCP_Length", "Rel_Close", lm_env.RELCLOSENORMETH, True),
+         ("cwd_to_Path_Length_Ratio", "Rel_Perm", lm_env.RELPERMNORMETH,
+          True)])
 
 
 def add_output_path(in_str):
@@ -743,8 +832,7 @@ def run_analysis():
     chk_lnk_tbls()
     create_run_gdbs()
 
-    calc_permeability(lcp_lines)
-    calc_closeness(lcp_lines)
+    calc_closeness_permeability(lcp_lines)
     calc_cav(core_lyr)
 
     # Calculate Corridor Specific Value and Blended Priority raster
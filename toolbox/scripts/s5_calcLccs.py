@@ -8,19 +8,29 @@ pairs specified in linkTable and cwd layers
 """
 
 import json
+import os
 from os import path
 import time
+import zipfile
 
 import numpy as npy
 import arcpy
 
 from lm_config import tool_env as cfg
 import lm_util as lu
+import lm_grid as lg
+import lm_raster as lr
+import lm_nlcc as lnlcc
+from lm_retry_decorator import Retry
 
 _SCRIPT_NAME = "s5_calcLccs.py"
 
 gprint = lu.gprint
 
+# Corridor values are stored offset from the true values in the mosaic and
+# shifted back on conversion to integer
+LCC_OFFSET = 10000
+
 
 def save_parameters():
     """Save parameters required for other tools."""
@@ -36,16 +46,7 @@ def STEP5_calc_lccs():
 
     """
     try:
-
-        normalize = True
-        calc_lccs(normalize)
-
-        #Code to allow extra iteration to mosaic NON-normalized LCCs
-        if cfg.CALCNONNORMLCCS:
-            normalize = False
-            lu.dashline(1)
-            gprint('\n**EXTRA STEP 5 RUN to mosaic NON-normalized corridors**')
-            calc_lccs(normalize)
+        calc_lccs()
 
     # Return any PYTHON or system specific errors
     except Exception:
@@ -54,18 +55,153 @@ def STEP5_calc_lccs():
         lu.exit_with_python_error(_SCRIPT_NAME)
 
 
-def calc_lccs(normalize):
+@Retry(10)
+def read_cwd_pair(cwdRaster1, cwdRaster2, grid, window):
+    """Read the sum of two cwd rasters over window."""
+    return (lr.read_window(cwdRaster1, grid, window, npy.float64)
+            + lr.read_window(cwdRaster2, grid, window, npy.float64))
+
+
+def cwd_stamp(cwdRaster):
+    """Return latest modification time of a cwd raster and its files."""
+    stamps = [path.getmtime(cwdRaster)]
+    if path.isdir(cwdRaster):
+        stamps.extend(path.getmtime(path.join(cwdRaster, fname))
+                      for fname in os.listdir(cwdRaster))
+    return max(stamps)
+
+
+def new_lcc_mosaic(grid):
+    """Return empty running minimum of corridor values across links.
+
+    Each cell records the link supplying its value, so the mosaic can be
+    updated when links change (see load_lcc_state).
+    """
+    return lg.TiledAccumulator(grid.nrows, grid.ncols, lg.MINIMUM,
+                               track=True)
+
+
+def grid_state(grid):
+    """Return grid geometry and tiling saved with corridor mosaics."""
+    return npy.array([grid.xmin, grid.ymax, grid.cell_size, grid.nrows,
+                      grid.ncols, lg.TILE_SIZE], dtype=npy.float64)
+
+
+def load_lcc_state(grid):
+    """Load corridor mosaics saved by the last run of step 5.
+
+    Returns list of (core pair, (cwdist, cwd stamp 1, cwd stamp 2), window)
+    for links mosaicked, indexed by link id, and the normalized and
+    non-normalized mosaics. Returns None if there is nothing to reuse.
+    """
+    if cfg.STEP3 or not path.exists(cfg.LCCSTATEFILE):
+        return None
     try:
-        if normalize:
-            mosaicBaseName = "_corridors"
-            writeTruncRaster = cfg.WRITETRUNCRASTER
-            outputGDB = cfg.OUTPUTGDB
-            SAVENORMLCCS = cfg.SAVENORMLCCS
-        else:
-            mosaicBaseName = "_NON_NORMALIZED_corridors"
-            SAVENORMLCCS = False
-            outputGDB = cfg.EXTRAGDB
-            writeTruncRaster = False
+        return read_lcc_state(grid)
+    except (IOError, KeyError, ValueError, zipfile.BadZipFile):
+        # Left unreadable, e.g. by an interrupted run
+        return None
+
+
+def read_lcc_state(grid):
+    """Read corridor mosaics saved by step 5 (see load_lcc_state)."""
+    if cfg.SAVENORMLCCS:
+        if not path.exists(cfg.NLCCFILE):
+            return None
+        reader = lnlcc.NlccReader(cfg.NLCCFILE)
+        cwdThresh = reader.cwd_thresh
+        reader.close()
+        if cwdThresh != float(cfg.CWDTHRESH):
+            return None
+    with npy.load(cfg.LCCSTATEFILE, allow_pickle=False) as npz:
+        if not npy.array_equal(npz["grid"], grid_state(grid)):
+            return None
+        if cfg.CALCNONNORMLCCS and not npz["nonnorm"]:
+            return None
+        normMosaic = new_lcc_mosaic(grid)
+        normMosaic.load_state(npz, "n")
+        nonNormMosaic = None
+        if cfg.CALCNONNORMLCCS:
+            nonNormMosaic = new_lcc_mosaic(grid)
+            nonNormMosaic.load_state(npz, "x")
+        links = [((int(row[0]), int(row[1])), tuple(row[2:5]),
+                  lg.Window(*[int(val) for val in row[5:]]))
+                 for row in npz["links"].tolist()]
+    return links, normMosaic, nonNormMosaic
+
+
+def save_lcc_state(grid, pairs, records, windows, normMosaic,
+                   nonNormMosaic):
+    """Save corridor mosaics and the links in them for the next run."""
+    links = npy.zeros((len(pairs), 9), dtype=npy.float64)
+    for linkId, pair in enumerate(pairs):
+        links[linkId] = pair + records[pair] + tuple(windows[pair])
+    arrays = {"grid": grid_state(grid), "links": links,
+              "nonnorm": npy.array(nonNormMosaic is not None)}
+    arrays.update(normMosaic.state("n"))
+    if nonNormMosaic is not None:
+        arrays.update(nonNormMosaic.state("x"))
+    tmpFile = path.join(cfg.DATAPASSDIR, "lcc_state_tmp.npz")
+    npy.savez(tmpFile, **arrays)
+    os.replace(tmpFile, cfg.LCCSTATEFILE)
+
+
+def add_corridor(normMosaic, nonNormMosaic, grid, pair, cwDist, window,
+                 linkId):
+    """Add corridor for a core pair over window to the mosaics.
+
+    Returns normalized corridor values, offset by LCC_OFFSET.
+    """
+    cwdSum = read_cwd_pair(lu.get_cwd_path(pair[0]),
+                           lu.get_cwd_path(pair[1]), grid, window)
+    if nonNormMosaic is not None:
+        nonNormMosaic.add(window, cwdSum, linkId)
+
+    # Normalized lcc rasters are created by adding cwd rasters and
+    # subtracting the least cost distance between them.
+    cwdSum -= cwDist - LCC_OFFSET
+    normMosaic.add(window, cwdSum, linkId)
+    return cwdSum
+
+
+def write_corridors(mosaic, grid, outputGDB, mosaicBaseName,
+                    writeTruncRaster):
+    """Write integer corridor raster, and optionally truncated version."""
+    if not arcpy.Exists(outputGDB):
+        arcpy.CreateFileGDB_management(cfg.OUTPUTDIR,
+                                       path.basename(outputGDB))
+    fullWindow = lg.Window(0, 0, grid.nrows, grid.ncols)
+    corridors = mosaic.to_array()
+    corridors -= LCC_OFFSET - 0.5
+    corridors = npy.trunc(corridors)
+
+    intRaster = path.join(outputGDB, cfg.PREFIX + mosaicBaseName)
+    lr.save_array(corridors, grid, fullWindow, intRaster, integer=True)
+
+    truncRaster = None
+    if writeTruncRaster:
+        # Set anything beyond cfg.CWDTHRESH to NODATA.
+        truncRaster = path.join(outputGDB, cfg.PREFIX + mosaicBaseName +
+                                '_truncated_at_' +
+                                lu.cwd_cutoff_str(cfg.CWDTHRESH))
+        corridors[corridors > cfg.CWDTHRESH] = npy.nan
+        lr.save_array(corridors, grid, fullWindow, truncRaster,
+                      integer=True)
+    del corridors
+    return intRaster, truncRaster
+
+
+def calc_lccs():
+    """Calculate and mosaic corridors in a single pass over link CWDs.
+
+    Normalized corridors and, if CALCNONNORMLCCS is set, non-normalized
+    corridors are accumulated from the same read of each CWD pair. Mosaics
+    are kept between runs, so only links added, removed or changed since
+    the last run of step 5 are processed.
+
+    """
+    try:
+        SAVENORMLCCS = cfg.SAVENORMLCCS
 
         lu.dashline(1)
         gprint('Running script ' + _SCRIPT_NAME)
@@ -91,6 +227,7 @@ def calc_lccs(normalize):
         arcpy.env.cellSize = arcpy.Describe(cfg.RESRAST).MeanCellHeight
         arcpy.env.snapRaster = cfg.RESRAST
         arcpy.env.mask = cfg.RESRAST
+        grid = lr.grid_info(cfg.RESRAST)
 
         linkTable = lu.load_link_table(linkTableFile)
         numLinks = linkTable.shape[0]
@@ -114,258 +251,192 @@ def calc_lccs(normalize):
         arcpy.env.pyramid = "NONE"
         arcpy.env.rasterStatistics = "NONE"
 
-        # set up directories for normalized lcc and mosaic grids
-        dirCount = 0
-        gprint("Creating output folder: " + cfg.LCCBASEDIR)
-        lu.delete_dir(cfg.LCCBASEDIR)
-        arcpy.CreateFolder_management(path.dirname(cfg.LCCBASEDIR),
-                                       path.basename(cfg.LCCBASEDIR))
-        arcpy.CreateFolder_management(cfg.LCCBASEDIR, cfg.LCCNLCDIR_NM)
-        clccdir = path.join(cfg.LCCBASEDIR, cfg.LCCNLCDIR_NM)
-        gprint("")
-        if normalize:
-            gprint('Normalized least-cost corridors will be written '
-                          'to ' + clccdir + '\n')
-        PREFIX = cfg.PREFIX
-
-        # Add CWD layers for core area pairs to produce NORMALIZED LCC layers
-        numGridsWritten = 0
+        # Active links, one per core pair
         coreList = linkTable[:,cfg.LTB_CORE1:cfg.LTB_CORE2+1]
         coreList = npy.sort(coreList)
-
-        x = 0
-        linkCount = 0
-        endIndex = numLinks
-        while x < endIndex:
+        linkRows = {}
+        for x in range(numLinks):
             if (linkTable[x, cfg.LTB_LINKTYPE] < 1): # If not a valid link
-                x = x + 1
                 continue
-
-            linkCount = linkCount + 1
-            start_time = time.clock()
-
-            linkId = str(int(linkTable[x, cfg.LTB_LINKID]))
-
-            # source and target cores
-            corex=int(coreList[x,0])
-            corey=int(coreList[x,1])
-
-            # Get cwd rasters for source and target cores
-            cwdRaster1 = lu.get_cwd_path(corex)
-            cwdRaster2 = lu.get_cwd_path(corey)
-
-            if not arcpy.Exists(cwdRaster1):
-                msg =('\nError: cannot find cwd raster:\n' + cwdRaster1)
-            if not arcpy.Exists(cwdRaster2):
-                msg =('\nError: cannot find cwd raster:\n' + cwdRaster2)
+            pair = (int(coreList[x,0]), int(coreList[x,1]))
+            if pair not in linkRows: # don't want to mosaic links twice
+                linkRows[pair] = x
+
+        cwdStamps = {}
+        for core in set(core for pair in linkRows for core in pair):
+            cwdRaster = lu.get_cwd_path(core)
+            if not arcpy.Exists(cwdRaster):
+                msg =('\nError: cannot find cwd raster:\n' + cwdRaster)
                 lu.raise_error(msg)
-
-
-            lccNormRaster = path.join(clccdir, str(corex) + "_" +
-                                      str(corey))# + ".tif")
-            arcpy.env.extent = "MINOF"
-
-            link = lu.get_links_from_core_pairs(linkTable, corex, corey)
-
-            offset = 10000
-
-            # Normalized lcc rasters are created by adding cwd rasters and
-            # subtracting the least cost distance between them.
-            lcDist = (float(linkTable[link,cfg.LTB_CWDIST]) - offset)
-
-            if normalize:
-                statement = ('outras = arcpy.sa.Raster(cwdRaster1) '
-                             '+ arcpy.sa.Raster(cwdRaster2) - lcDist; '
-                             'outras.save(lccNormRaster)')
+            cwdStamps[core] = cwd_stamp(cwdRaster)
+
+        # Link ids used to track corridor tiles are positions in pairs
+        pairs = sorted(linkRows)
+        linkIds = dict((pair, linkId) for linkId, pair in enumerate(pairs))
+        records = dict((pair, (float(linkTable[linkRows[pair],
+                                               cfg.LTB_CWDIST]),
+                               cwdStamps[pair[0]], cwdStamps[pair[1]]))
+                       for pair in pairs)
+
+        # Reuse mosaics from last run of step 5 where links are unchanged.
+        # The saved state is removed until this run's mosaics are saved, so
+        # a run that fails part way leaves nothing to reuse.
+        state = load_lcc_state(grid)
+        lu.delete_file(cfg.LCCSTATEFILE)
+        if state is None:
+            prevLinks = []
+            normMosaic = new_lcc_mosaic(grid)
+            nonNormMosaic = None
+            if cfg.CALCNONNORMLCCS:
+                nonNormMosaic = new_lcc_mosaic(grid)
+        else:
+            prevLinks, normMosaic, nonNormMosaic = state
+        mosaics = [mosaic for mosaic in (normMosaic, nonNormMosaic)
+                   if mosaic is not None]
+
+        windows = {}
+        lookup = []
+        staleIds = set()
+        for prevId, (pair, record, window) in enumerate(prevLinks):
+            if records.get(pair) == record:
+                lookup.append(linkIds[pair])
+                windows[pair] = window
             else:
-                statement = ('outras = arcpy.sa.Raster(cwdRaster1) '
-                             '+ arcpy.sa.Raster(cwdRaster2); '
-                             'outras.save(lccNormRaster)')
-
-            count = 0
-            while True:
-                try:
-                    exec(statement)
-                except Exception:
-                    count,tryAgain = lu.retry_arc_error(count,statement)
-                    if not tryAgain:
-                        exec(statement)
-                else: break
-
-            if normalize:
-                try:
-                    minObject = arcpy.GetRasterProperties_management(lccNormRaster, "MINIMUM")
-                    rasterMin = float(str(minObject.getOutput(0)))
-                except Exception:
-                    lu.warn('\n------------------------------------------------')
-                    lu.warn('WARNING: Raster minimum check failed in step 5. \n'
-                        'This may mean the output rasters are corrupted. Please \n'
-                        'be sure to check for valid rasters in '+ outputGDB)
-                    rasterMin = 0
+                # Removed, or cwdist or cwd rasters changed
+                lookup.append(-1)
+                staleIds.add(prevId)
+        updatePairs = [pair for pair in pairs if pair not in windows]
+
+        # Tiles where a stale link supplied any corridor values are rebuilt
+        # from the links remaining
+        staleTiles = set()
+        for mosaic in mosaics:
+            for key in mosaic.tiles:
+                if mosaic.winners(key) & staleIds:
+                    staleTiles.add(key)
+            mosaic.remap_links(lookup)
+
+        if state is not None:
+            gprint('Corridors for ' + str(len(pairs) - len(updatePairs)) +
+                   ' unchanged links kept from last run. Updating ' +
+                   str(len(updatePairs)) + ' links and rebuilding ' +
+                   str(len(staleTiles)) + ' tiles for ' +
+                   str(len(staleIds)) + ' removed or changed links.\n')
+
+        # set up directory for normalized lcc container
+        prevNlccFile = path.join(cfg.DATAPASSDIR, "nlcc_sparse_prev.npz")
+        if SAVENORMLCCS and state is not None:
+            os.replace(cfg.NLCCFILE, prevNlccFile)
+        gprint("Creating output folder: " + cfg.LCCBASEDIR)
+        lu.delete_dir(cfg.LCCBASEDIR)
+        arcpy.CreateFolder_management(path.dirname(cfg.LCCBASEDIR),
+                                       path.basename(cfg.LCCBASEDIR))
+        gprint("")
+        nlccWriter = None
+        # The container is written under a temporary name and renamed once
+        # closed, so readers never see a partly written one
+        nlccTmpFile = path.join(cfg.LCCBASEDIR, "nlcc_sparse_tmp.npz")
+        if SAVENORMLCCS:
+            # Only cells within the CWD threshold are kept for each link
+            gprint('Normalized least-cost corridors (cells within CWD '
+                   'threshold) will be written to ' + cfg.NLCCFILE + '\n')
+            nlccWriter = lnlcc.NlccWriter(
+                nlccTmpFile, grid, grid.spatial_ref.exportToString(),
+                cfg.CWDTHRESH)
+        try:
+            if nlccWriter is not None and state is not None:
+                prevReader = lnlcc.NlccReader(prevNlccFile)
+                for pair in pairs:
+                    if pair in windows:
+                        nlccWriter.add_sparse(pair[0], pair[1],
+                                              *prevReader.sparse(*pair)[1:])
+                prevReader.close()
+                os.remove(prevNlccFile)
+            if cfg.CALCNONNORMLCCS:
+                gprint('NON-normalized corridors will be mosaicked in the '
+                       'same pass.\n')
+            PREFIX = cfg.PREFIX
+
+            for key in sorted(staleTiles):
+                tileWindow = normMosaic.tile_window(key)
+                contributors = set()
+                for mosaic in mosaics:
+                    if key in mosaic.tiles:
+                        contributors |= mosaic.footprints[key]
+                        mosaic.clear_tile(key)
+                for linkId in sorted(contributors):
+                    pair = pairs[linkId]
+                    window = lg.window_intersect(windows[pair], tileWindow)
+                    add_corridor(normMosaic, nonNormMosaic, grid, pair,
+                                 records[pair][0], window, linkId)
+
+            # Add CWD layers for core area pairs to produce NORMALIZED LCC
+            # layers
+            linkCount = 0
+            for pair in updatePairs:
+                x = linkRows[pair]
+                linkCount = linkCount + 1
+                start_time = time.clock()
+
+                linkId = str(int(linkTable[x, cfg.LTB_LINKID]))
+
+                # source and target cores
+                corex, corey = pair
+
+                # Corridors only exist where both cwd rasters have data
+                window = lg.window_intersect(
+                    lr.raster_window(lu.get_cwd_path(corex), grid),
+                    lr.raster_window(lu.get_cwd_path(corey), grid))
+                if window is None:
+                    msg = ('\nError: cwd rasters for core areas ' +
+                           str(corex) + ' and ' + str(corey) +
+                           ' do not overlap.')
+                    lu.raise_error(msg)
+                windows[pair] = window
+
+                lccNorm = add_corridor(normMosaic, nonNormMosaic, grid, pair,
+                                       records[pair][0], window, linkIds[pair])
+
+                if nlccWriter is not None:
+                    nlccWriter.add(corex, corey, window, lccNorm - LCC_OFFSET)
+
+                rasterMin = npy.nanmin(lccNorm)
                 tolerance = (float(arcpy.env.cellSize) * -10)
                 if rasterMin < tolerance:
                     lu.dashline(1)
                     msg = ('WARNING: Minimum value of a corridor #' + str(x+1)
                            + ' is much less than zero ('+str(rasterMin)+').'
-                           '\nThis could mean that BOUNDING CIRCLE BUFFER DISTANCES '
-                           'were too small and a corridor passed outside of a '
-                           'bounding circle, or that a corridor passed outside of the '
-                           'resistance map. \n')
+                           '\nThis could mean that BOUNDING CIRCLE BUFFER '
+                           'DISTANCES were too small and a corridor passed '
+                           'outside of a bounding circle, or that a corridor '
+                           'passed outside of the resistance map. \n')
                     lu.warn(msg)
+                del lccNorm
+
+                endTime = time.clock()
+                processTime = round((endTime - start_time), 2)
+
+                gprint("Normalized and mosaicked corridor for link ID #" +
+                        str(linkId) + " connecting core areas " + str(corex) +
+                        " and " + str(corey)+ " in " +
+                        str(processTime) + " seconds. " +
+                        str(int(linkCount)) + " out of " +
+                        str(len(updatePairs)) + " links have been "
+                        "processed.")
+        finally:
+            if nlccWriter is not None:
+                nlccWriter.close()
+        if nlccWriter is not None:
+            os.replace(nlccTmpFile, cfg.NLCCFILE)
+
+        save_lcc_state(grid, pairs, records, windows, normMosaic,
+                       nonNormMosaic)
 
-            arcpy.env.extent = cfg.RESRAST
-
-            mosaicDir = path.join(cfg.LCCBASEDIR,'mos'+str(x+1))
-            lu.create_dir(mosaicDir)
-            mosFN = 'mos'#.tif' change and move
-            mosaicRaster = path.join(mosaicDir,mosFN)
-
-            if numGridsWritten == 0 and dirCount == 0:
-                #If this is the first grid then copy rather than mosaic
-                arcpy.CopyRaster_management(lccNormRaster, mosaicRaster)
-            else:
-                statement = (
-                    'arcpy.MosaicToNewRaster_management('
-                    'input_rasters=";".join([lccNormRaster, '
-                    'lastMosaicRaster]), output_location=mosaicDir, '
-                    'raster_dataset_name_with_extension=mosFN, '
-                    'pixel_type="32_BIT_FLOAT", cellsize=arcpy.env.cellSize, '
-                    'number_of_bands="1", mosaic_method="MINIMUM")')
-
-                count = 0
-                while True:
-                    try:
-                        lu.write_log('Executing mosaic for link #'+str(linkId))
-                        exec(statement)
-                        lu.write_log('Done with mosaic.')
-                    except Exception:
-                        count,tryAgain = lu.retry_arc_error(count,statement)
-                        lu.delete_data(mosaicRaster)
-                        lu.delete_dir(mosaicDir)
-                        # Try a new directory
-                        mosaicDir = path.join(cfg.LCCBASEDIR,'mos'+str(x+1)+ '_' + str(count))
-                        lu.create_dir(mosaicDir)
-                        mosaicRaster = path.join(mosaicDir,mosFN)
-                        if not tryAgain:
-                            exec(statement)
-                    else: break
-            endTime = time.clock()
-            processTime = round((endTime - start_time), 2)
-
-            if normalize == True:
-                printText = "Normalized and mosaicked "
-            else:
-                printText = "Mosaicked NON-normalized "
-            gprint(printText + "corridor for link ID #" + str(linkId) +
-                    " connecting core areas " + str(corex) +
-                    " and " + str(corey)+ " in " +
-                    str(processTime) + " seconds. " + str(int(linkCount)) +
-                    " out of " + str(int(numCorridorLinks)) + " links have been "
-                    "processed.")
-
-            # temporarily disable links in linktable - don't want to mosaic
-            # them twice
-            for y in range (x+1,numLinks):
-                corex1 = int(coreList[y,0])
-                corey1 = int(coreList[y,1])
-                if corex1 == corex and corey1 == corey:
-                    linkTable[y,cfg.LTB_LINKTYPE] = (
-                        linkTable[y,cfg.LTB_LINKTYPE] + 1000)
-                elif corex1==corey and corey1==corex:
-                    linkTable[y,cfg.LTB_LINKTYPE] = (
-                            linkTable[y,cfg.LTB_LINKTYPE] + 1000)
-
-            numGridsWritten = numGridsWritten + 1
-            if not SAVENORMLCCS:
-                lu.delete_data(lccNormRaster)
-                lu.delete_dir(clccdir)
-                lu.create_dir(clccdir)
-            else:
-                if numGridsWritten == 100:
-                    # We only write up to 100 grids to any one folder
-                    # because otherwise Arc slows to a crawl
-                    dirCount = dirCount + 1
-                    numGridsWritten = 0
-                    clccdir = path.join(cfg.LCCBASEDIR,
-                                        cfg.LCCNLCDIR_NM + str(dirCount))
-                    gprint("Creating output folder: " + clccdir)
-                    arcpy.CreateFolder_management(cfg.LCCBASEDIR,
-                                               path.basename(clccdir))
-
-            if numGridsWritten > 1 or dirCount > 0:
-                lu.delete_data(lastMosaicRaster)
-                lu.delete_dir(path.dirname(lastMosaicRaster))
-
-            lastMosaicRaster = mosaicRaster
-            x = x + 1
-
-        #rows that were temporarily disabled
-        rows = npy.where(linkTable[:,cfg.LTB_LINKTYPE]>1000)
-        linkTable[rows,cfg.LTB_LINKTYPE] = (
-            linkTable[rows,cfg.LTB_LINKTYPE] - 1000)
-        # ---------------------------------------------------------------------
-
-        # Create output geodatabase
-        if not arcpy.Exists(outputGDB):
-            arcpy.CreateFileGDB_management(cfg.OUTPUTDIR, path.basename(outputGDB))
-
-        arcpy.env.workspace = outputGDB
-
-        arcpy.env.pyramid = "NONE"
-        arcpy.env.rasterStatistics = "NONE"
-
-        # ---------------------------------------------------------------------
-        # convert mosaic raster to integer
-        intRaster = path.join(outputGDB,PREFIX + mosaicBaseName)
-        statement = ('outras = arcpy.sa.Int(arcpy.sa.Raster(mosaicRaster) '
-                     '- offset + 0.5); '
-                     'outras.save(intRaster)')
-        count = 0
-        while True:
-            try:
-                exec(statement)
-            except Exception:
-                count,tryAgain = lu.retry_arc_error(count,statement)
-                if not tryAgain: exec(statement)
-            else: break
-        # ---------------------------------------------------------------------
-
-
-        if writeTruncRaster:
-            # -----------------------------------------------------------------
-            # Set anything beyond cfg.CWDTHRESH to NODATA.
-            truncRaster = (outputGDB + '\\' + PREFIX + mosaicBaseName +
-                           '_truncated_at_' + lu.cwd_cutoff_str(cfg.CWDTHRESH))
-
-            statement = ('outRas = arcpy.sa.Raster(intRaster)'
-                         '* (arcpy.sa.Con(arcpy.sa.Raster(intRaster) '
-                         '<= cfg.CWDTHRESH, 1)); '
-                         'outRas.save(truncRaster)')
-
-            count = 0
-            while True:
-                try:
-                    exec(statement)
-                except Exception:
-                    count,tryAgain = lu.retry_arc_error(count,statement)
-                    if not tryAgain: exec(statement)
-                else: break
         # ---------------------------------------------------------------------
         # Check for unreasonably low minimum NLCC values
-        try:
-            mosaicGrid = path.join(cfg.LCCBASEDIR,'mos')
-            # Copy to grid to test
-            arcpy.CopyRaster_management(mosaicRaster, mosaicGrid)
-            minObject = arcpy.GetRasterProperties_management(mosaicGrid, "MINIMUM")
-            rasterMin = float(str(minObject.getOutput(0)))
-        except Exception:
-            lu.warn('\n------------------------------------------------')
-            lu.warn('WARNING: Raster minimum check failed in step 5. \n'
-                'This may mean the output rasters are corrupted. Please \n'
-                'be sure to check for valid rasters in '+ outputGDB)
-            rasterMin = 0
+        rasterMin = normMosaic.nanmin()
         tolerance = (float(arcpy.env.cellSize) * -10)
-        if rasterMin < tolerance:
+        if rasterMin is not None and rasterMin < tolerance:
             lu.dashline(1)
             msg = ('WARNING: Minimum value of mosaicked corridor map is '
                    'much less than zero ('+str(rasterMin)+').'
@@ -375,6 +446,21 @@ def calc_lccs(normalize):
                    'resistance map. \n')
             lu.warn(msg)
 
+        # ---------------------------------------------------------------------
+        # Convert mosaics to integer and write to output geodatabases
+        gprint('\nWriting corridor rasters...')
+        intRaster, truncRaster = write_corridors(
+            normMosaic, grid, cfg.OUTPUTGDB, "_corridors",
+            cfg.WRITETRUNCRASTER)
+        del normMosaic
+        nonNormRaster = None
+        if nonNormMosaic is not None:
+            nonNormRaster = write_corridors(
+                nonNormMosaic, grid, cfg.EXTRAGDB,
+                "_NON_NORMALIZED_corridors", False)[0]
+            del nonNormMosaic
+
+        arcpy.env.workspace = cfg.OUTPUTGDB
 
         gprint('\nWriting final LCP maps...')
         if cfg.STEP4:
@@ -425,11 +511,16 @@ def calc_lccs(normalize):
                           'for corridor raster')
         lu.build_stats(intRaster)
 
-        if writeTruncRaster:
+        if truncRaster:
             arcpy.AddMessage('Building output statistics '
                               'for truncated corridor raster')
             lu.build_stats(truncRaster)
 
+        if nonNormRaster:
+            arcpy.AddMessage('Building output statistics '
+                              'for NON-normalized corridor raster')
+            lu.build_stats(nonNormRaster)
+
         save_parameters()
         if cfg.OUTPUTFORMODELBUILDER:
             arcpy.CopyFeatures_management(cfg.COREFC, cfg.OUTPUTFORMODELBUILDER)
@@ -16,6 +16,10 @@ import arcpy
 from lm_config import tool_env as cfg
 import lm_util as lu
 from lm_util import gprint
+import lm_barrier as lb
+import lm_focal as lf
+import lm_grid as lg
+import lm_raster as lr
 from lm_retry_decorator import Retry
 
 
@@ -30,6 +34,115 @@ TIF = '.tif'
 SET_CORES_TO_NULL = False
 
 
+def focal_file(core, radius):
+    """Return path of cached focal minimum array for core at radius."""
+    return lu.get_focal_path(core, radius) + '.npy'
+
+
+@Retry(10)
+def calc_focal_mins(core, grid, radii):
+    """Cache focal minimums of a core's CWD at each search radius.
+
+    Equivalent to FocalStatistics MINIMUM over an "ANNULUS radius - 1
+    radius MAP" neighborhood, ignoring NoData. The CWD raster is read once
+    for all radii. Returns window of grid covered by the focal arrays.
+    """
+    cwd_ras = lu.get_cwd_path(core)
+    window = lr.raster_window(cwd_ras, grid)
+    cwd = lr.read_window(cwd_ras, grid, window)
+    segment_lists = [lf.annulus_segments((radius - 1) / grid.cell_size,
+                                         radius / grid.cell_size)
+                     for radius in radii]
+    focals = lf.focal_reduce_multi(cwd, segment_lists, lg.MINIMUM)
+    for radius, focal in zip(radii, focals):
+        if SET_CORES_TO_NULL:
+            # Set areas overlapping cores to NoData xxx
+            with npy.errstate(invalid='ignore'):
+                focal[~(focal > 0)] = npy.nan
+        npy.save(focal_file(core, radius), focal)
+    return window
+
+
+@Retry(10)
+def save_cwd(core, grid):
+    """Cache a core's CWD as .npy file.
+
+    Returns window of grid covered by the CWD and the file name.
+    """
+    cwd_ras = lu.get_cwd_path(core)
+    window = lr.raster_window(cwd_ras, grid)
+    cwd_file = path.join(cfg.BARRIERBASEDIR, "cwd_" + str(core) + ".npy")
+    npy.save(cwd_file, lr.read_window(cwd_ras, grid, window))
+    return window, cwd_file
+
+
+@Retry(10)
+def save_resist_fill(grid, resist_file):
+    """Save resistance less one, with NoData set to 1e9, as .npy file.
+
+    Used to trim barrier circles. Written tile by tile so it can be opened
+    memory-mapped by worker processes.
+    """
+    resist = npy.lib.format.open_memmap(resist_file, mode='w+',
+                                        dtype=npy.float32,
+                                        shape=(grid.nrows, grid.ncols))
+    full_window = lg.Window(0, 0, grid.nrows, grid.ncols)
+    tiles = lg.TiledAccumulator(grid.nrows, grid.ncols, lg.MINIMUM)
+    for key in tiles.tile_keys(full_window):
+        window = tiles.tile_window(key)
+        values = lr.read_window(cfg.RESRAST, grid, window)
+        values -= 1
+        values[npy.isnan(values)] = 1000000000
+        resist[lg.window_slices(window, full_window)] = values
+    resist.flush()
+    del resist
+
+
+def barrier_values(acc, win, set_null=True):
+    """Return barrier values over window, with negative values NoData.
+
+    In SUM mode cells not reached by any link are 0.
+    """
+    array = acc.read(win)
+    if cfg.SUM_BARRIERS:
+        array[npy.isnan(array)] = 0
+    if set_null:
+        with npy.errstate(invalid='ignore'):
+            array[array < 0] = npy.nan
+    return array
+
+
+def save_barriers(acc, grid, out_ras, set_null=True):
+    """Save barrier accumulator to out_ras (see barrier_values)."""
+    full_window = lg.Window(0, 0, grid.nrows, grid.ncols)
+    lr.save_array(barrier_values(acc, full_window, set_null), grid,
+                  full_window, out_ras)
+
+
+def grow_barriers(acc, grid, radius):
+    """'Grow out' barrier values to circles of search radius.
+
+    Yields window and focal maximum of barrier values over a circle of
+    radius map units for each tile of the grid holding barrier values.
+    """
+    cells = int(radius / grid.cell_size)
+    full_window = lg.Window(0, 0, grid.nrows, grid.ncols)
+    for key in acc.tile_keys(full_window):
+        tile_window = acc.tile_window(key)
+        read_window = lg.window_buffer(tile_window, cells, full_window)
+        if not any(near_key in acc.tiles
+                   for near_key in acc.tile_keys(read_window)):
+            continue
+        values = barrier_values(acc, read_window)
+        if cfg.SUM_BARRIERS:
+            # Cells with no score are 0, and don't need growing out
+            values[values == 0] = npy.nan
+        if npy.isnan(values).all():
+            continue
+        fill = lf.circle_max(values, radius / grid.cell_size)
+        yield tile_window, fill[lg.window_slices(tile_window, read_window)]
+
+
 def step6_calc_barriers():
     """Detect influential barriers given CWD calculations from Step 3."""
     try:
@@ -78,6 +191,7 @@ def step6_calc_barriers():
         arcpy.env.cellSize = arcpy.Describe(cfg.RESRAST).MeanCellHeight
         arcpy.env.snapRaster = cfg.RESRAST
         spatialref = arcpy.Describe(cfg.RESRAST).spatialReference
+        grid = lr.grid_info(cfg.RESRAST)
         map_units = (str(spatialref.linearUnitName)).lower()
         if len(map_units) > 1 and map_units[-1] != 's':
             map_units = map_units + 's'
@@ -138,569 +252,186 @@ def step6_calc_barriers():
                     gprint('...' + focal_dir)
                     arcpy.CreateFolder_management(path2, focal_dir)
 
-        # Create resistance raster with filled-in Nodata values for later use
-        arcpy.env.extent = cfg.RESRAST
-        resist_fill_ras = path.join(cfg.SCRATCHDIR, "resist_fill")
-        output = arcpy.sa.Con(arcpy.sa.IsNull(cfg.RESRAST), 1000000000,
-                              arcpy.sa.Raster(cfg.RESRAST) - 1)
-        output.save(resist_fill_ras)
-
         core_list = link_table[:, cfg.LTB_CORE1:cfg.LTB_CORE2 + 1]
         core_list = npy.sort(core_list)
-
-        # Loop through each search radius to calculate barriers in each link
-        rad_id = 0  # Keep track of no of radii processed - used for temp dir
-        for radius in range(start_radius, end_radius + 1, radius_step):
-            rad_id = rad_id + 1
-            link_table_tmp = link_table.copy()
-
-            @Retry(10)
-            # Can't pass vars in and modify them.
-            def do_radius_loop():
-                """Do radius loop."""
-                link_table = link_table_tmp.copy()
-                start_time = time.clock()
-                link_loop = 0
-                pct_done = 0
-                gprint('\nMapping barriers at a radius of ' + str(radius) +
-                       ' ' + str(map_units))
-                if cfg.SUM_BARRIERS:
-                    gprint('using SUM method')
-                else:
-                    gprint('using MAXIMUM method')
-                if num_corridor_links > 1:
-                    gprint('0 percent done')
-                last_mosaic_ras = None
-                last_mosaic_ras_pct = None
-                for x in range(0, num_links):
-                    pct_done = lu.report_pct_done(
-                        link_loop, num_corridor_links, pct_done)
-                    if ((link_table[x, cfg.LTB_LINKTYPE] > 0) and
-                            (link_table[x, cfg.LTB_LINKTYPE] < 1000)):
-                        link_loop = link_loop + 1
-                        # source and target cores
-                        corex = int(core_list[x, 0])
-                        corey = int(core_list[x, 1])
-
-                        # Get cwd rasters for source and target cores
-                        cwd_ras1 = lu.get_cwd_path(corex)
-                        cwd_ras2 = lu.get_cwd_path(corey)
-
-                        # Mask out areas above CWD threshold
-                        cwd_tmp1 = None
-                        cwd_tmp2 = None
-                        if cfg.BARRIER_CWD_THRESH is not None:
-                            if x == 1:
-                                lu.dashline(1)
-                                gprint('  Using CWD threshold of '
-                                       + str(cfg.BARRIER_CWD_THRESH)
-                                       + ' map units.')
-                            arcpy.env.extent = cfg.RESRAST
-                            arcpy.env.cellSize = cfg.RESRAST
-                            arcpy.env.snapRaster = cfg.RESRAST
-                            cwd_tmp1 = path.join(cfg.SCRATCHDIR,
-                                                 "tmp" + str(corex))
-                            out_con = arcpy.sa.Con(
-                                cwd_ras1 < float(cfg.BARRIER_CWD_THRESH),
-                                cwd_ras1)
-                            out_con.save(cwd_tmp1)
-                            cwd_ras1 = cwd_tmp1
-                            cwd_tmp2 = path.join(cfg.SCRATCHDIR,
-                                                 "tmp" + str(corey))
-                            out_con = arcpy.sa.Con(
-                                cwd_ras2 < float(cfg.BARRIER_CWD_THRESH),
-                                cwd_ras2)
-                            out_con.save(cwd_tmp2)
-                            cwd_ras2 = cwd_tmp2
-
-                        focal_ras1 = lu.get_focal_path(corex, radius)
-                        focal_ras2 = lu.get_focal_path(corey, radius)
-
-                        link = lu.get_links_from_core_pairs(link_table,
-                                                            corex, corey)
-                        lc_dist = float(link_table[link, cfg.LTB_CWDIST])
-
-                        # Detect barriers at radius using neighborhood stats
-                        # Create the Neighborhood Object
-                        inner_radius = radius - 1
-                        outer_radius = radius
-
-                        dia = 2 * radius
-                        in_neighborhood = ("ANNULUS " + str(inner_radius)
-                                           + " " + str(outer_radius) + " MAP")
-
-                        @Retry(10)
-                        def exec_focal():
-                            """Execute focal statistics."""
-                            if not path.exists(focal_ras1):
-                                arcpy.env.extent = cwd_ras1
-                                out_focal_stats = arcpy.sa.FocalStatistics(
-                                    cwd_ras1, in_neighborhood,
-                                    "MINIMUM", "DATA")
-                                if SET_CORES_TO_NULL:
-                                    # Set areas overlapping cores to NoData xxx
-                                    out_focal_stats2 = arcpy.sa.Con(
-                                        out_focal_stats > 0, out_focal_stats)
-                                    out_focal_stats2.save(focal_ras1)
-                                else:
-                                    out_focal_stats.save(focal_ras1)
-                                arcpy.env.extent = cfg.RESRAST
-
-                            if not path.exists(focal_ras2):
-                                arcpy.env.extent = cwd_ras2
-                                out_focal_stats = arcpy.sa.FocalStatistics(
-                                    cwd_ras2, in_neighborhood,
-                                    "MINIMUM", "DATA")
-                                if SET_CORES_TO_NULL:
-                                    # Set areas overlapping cores to NoData xxx
-                                    out_focal_stats2 = arcpy.sa.Con(
-                                        out_focal_stats > 0, out_focal_stats)
-                                    out_focal_stats2.save(focal_ras2)
-                                else:
-                                    out_focal_stats.save(focal_ras2)
-                                arcpy.env.extent = cfg.RESRAST
-                        exec_focal()
-
-                        lu.delete_data(cwd_tmp1)
-                        lu.delete_data(cwd_tmp2)
-
-                        barrier_ras = path.join(
-                            cbarrierdir, "b" + str(radius) + "_" + str(corex)
-                            + "_" + str(corey)+'.tif')
-
-                        # Need to set nulls to 0,
-                        # also create trim rasters as we go
-                        if cfg.SUM_BARRIERS:
-                            out_ras = ((lc_dist - arcpy.sa.Raster(focal_ras1) -
-                                        arcpy.sa.Raster(focal_ras2) - dia)
-                                       / dia)
-                            out_con = arcpy.sa.Con(arcpy.sa.IsNull(out_ras),
-                                                   0, out_ras)
-                            out_con2 = arcpy.sa.Con(out_con < 0, 0, out_con)
-                            out_con2.save(barrier_ras)
-
-                            # Execute FocalStatistics to fill out search radii
-                            in_neighborhood = ("CIRCLE " + str(outer_radius)
-                                               + " MAP")
-                            fill_ras = path.join(
-                                cbarrierdir, "b" + str(radius) + "_"
-                                + str(corex) + "_" + str(corey) + "_fill.tif")
-                            out_focal_stats = arcpy.sa.FocalStatistics(
-                                barrier_ras, in_neighborhood,
-                                "MAXIMUM", "DATA")
-                            out_focal_stats.save(fill_ras)
-
-                            if cfg.WRITE_TRIM_RASTERS:
-                                trm_ras = path.join(
-                                    cbarrierdir, "b" + str(radius) + "_"
-                                    + str(corex) + "_" + str(corey)
-                                    + "_trim.tif")
-                                ras_list = [fill_ras, resist_fill_ras]
-                                out_cell_statistics = arcpy.sa.CellStatistics(
-                                    ras_list, "MINIMUM")
-                                out_cell_statistics.save(trm_ras)
-
-                        else:
-
-                            @Retry(10)
-                            def clac_ben():
-                                """Calculate potential benefit.
-
-                                Calculate potential benefit per map unit
-                                restored.
-                                """
-                                out_ras = (
-                                    (lc_dist - arcpy.sa.Raster(focal_ras1)
-                                     - arcpy.sa.Raster(focal_ras2) - dia)
-                                    / dia)
-                                out_ras.save(barrier_ras)
-                            clac_ben()
-
-                        if cfg.WRITE_PCT_RASTERS:
-                            # Calculate % potential benefit per unit restored
-                            barrier_ras_pct = path.join(
-                                cbarrierdir, "b" + str(radius) + "_"
-                                + str(corex) + "_" + str(corey)
-                                + '_pct.tif')
-
-                            @Retry(10)
-                            def calc_ben_pct():
-                                """Calc benefit percentage."""
-                                outras = (100 * (arcpy.sa.Raster(barrier_ras)
-                                                 / lc_dist))
-                                outras.save(barrier_ras_pct)
-                            calc_ben_pct()
-
-                        # Mosaic barrier results across core area pairs
-                        mosaic_dir = path.join(cfg.SCRATCHDIR, 'mos'
-                                               + str(rad_id) + '_'
-                                               + str(x + 1))
-                        lu.create_dir(mosaic_dir)
-
-                        mos_fn = 'mos_temp'
-                        tmp_mosaic_ras = path.join(mosaic_dir, mos_fn)
-                        tmp_mosaic_ras_trim = path.join(mosaic_dir,
-                                                        'mos_temp_trm')
-                        arcpy.env.workspace = mosaic_dir
-                        if link_loop == 1:
-                            last_mosaic_ras_trim = None
-                            # For first grid copy rather than mosaic
-                            arcpy.CopyRaster_management(barrier_ras,
-                                                        tmp_mosaic_ras)
-                            if cfg.SUM_BARRIERS and cfg.WRITE_TRIM_RASTERS:
-                                arcpy.CopyRaster_management(
-                                    trm_ras, tmp_mosaic_ras_trim)
-                        else:
-                            if cfg.SUM_BARRIERS:
-                                out_con = arcpy.sa.Con(
-                                    arcpy.sa.Raster(barrier_ras) < 0,
-                                    last_mosaic_ras,
-                                    arcpy.sa.Raster(barrier_ras)
-                                    + arcpy.sa.Raster(last_mosaic_ras))
-                                out_con.save(tmp_mosaic_ras)
-                                if cfg.WRITE_TRIM_RASTERS:
-                                    out_con = arcpy.sa.Con(
-                                        arcpy.sa.Raster(trm_ras) < 0,
-                                        last_mosaic_ras_trim,
-                                        arcpy.sa.Raster(trm_ras)
-                                        + arcpy.sa.Raster(last_mosaic_ras_trim)
-                                        )
-                                    out_con.save(tmp_mosaic_ras_trim)
-
-                            else:
-                                in_rasters = (";".join([barrier_ras,
-                                                        last_mosaic_ras]))
-
-                                @Retry(10)
-                                def mosaic_to_new():
-                                    """Mosaic to new raster."""
-                                    arcpy.MosaicToNewRaster_management(
-                                        input_rasters=in_rasters,
-                                        output_location=mosaic_dir,
-                                        raster_dataset_name_with_extension\
-                                        =mos_fn,
-                                        pixel_type="32_BIT_FLOAT",
-                                        cellsize=arcpy.env.cellSize,
-                                        number_of_bands="1",
-                                        mosaic_method="MAXIMUM")
-                                mosaic_to_new()
-
-                        if link_loop > 1:  # Clean up from previous loop
-                            lu.delete_data(last_mosaic_ras)
-                            last_mosaic_dir = path.dirname(last_mosaic_ras)
-                            lu.clean_out_workspace(last_mosaic_dir)
-                            lu.delete_dir(last_mosaic_dir)
-
-                        last_mosaic_ras = tmp_mosaic_ras
-                        if cfg.WRITE_TRIM_RASTERS:
-                            last_mosaic_ras_trim = tmp_mosaic_ras_trim
-                        if cfg.WRITE_PCT_RASTERS:
-                            mos_pct_fn = 'mos_temp_pct'
-                            mosaic_dir_pct = path.join(cfg.SCRATCHDIR, 'mosP'
-                                                       + str(rad_id) + '_'
-                                                       + str(x+1))
-                            lu.create_dir(mosaic_dir_pct)
-                            tmp_mosaic_ras_pct = path.join(mosaic_dir_pct,
-                                                           mos_pct_fn)
-                            if link_loop == 1:
-                                # If this is the first grid then copy
-                                # rather than mosaic
-                                if cfg.SUM_BARRIERS:
-                                    out_con = arcpy.sa.Con(
-                                        arcpy.sa.Raster(barrier_ras_pct)
-                                        < 0, 0,
-                                        arcpy.sa.Con(arcpy.sa.IsNull
-                                                     (barrier_ras_pct),
-                                                     0, barrier_ras_pct))
-                                    out_con.save(tmp_mosaic_ras_pct)
-                                else:
-                                    arcpy.CopyRaster_management(
-                                        barrier_ras_pct, tmp_mosaic_ras_pct)
-
-                            else:
-                                if cfg.SUM_BARRIERS:
-
-                                    @Retry(10)
-                                    def sum_barriers():
-                                        """Sum barriers."""
-                                        out_con = arcpy.sa.Con(
-                                            arcpy.sa.Raster(barrier_ras_pct)
-                                            < 0,
-                                            last_mosaic_ras_pct,
-                                            arcpy.sa.Raster(barrier_ras_pct)
-                                            + arcpy.sa.Raster(
-                                                last_mosaic_ras_pct))
-                                        out_con.save(tmp_mosaic_ras_pct)
-                                    sum_barriers()
-                                else:
-                                    in_rasters = (";".join([barrier_ras_pct,
-                                                  last_mosaic_ras_pct]))
-
-                                    @Retry(10)
-                                    def max_barriers():
-                                        """Get max barriers."""
-                                        arcpy.MosaicToNewRaster_management(
-                                            input_rasters=in_rasters,
-                                            output_location=mosaic_dir_pct,
-                                            raster_dataset_name_with_extension
-                                            =mos_pct_fn,
-                                            pixel_type="32_BIT_FLOAT",
-                                            cellsize=arcpy.env.cellSize,
-                                            number_of_bands="1",
-                                            mosaic_method="MAXIMUM")
-                                    max_barriers()
-
-                            if link_loop > 1:  # Clean up from previous loop
-                                lu.delete_data(last_mosaic_ras_pct)
-                                last_mosaic_dir_pct = path.dirname(
-                                    last_mosaic_ras_pct)
-                                lu.clean_out_workspace(last_mosaic_dir_pct)
-                                lu.delete_dir(last_mosaic_dir_pct)
-
-                            last_mosaic_ras_pct = tmp_mosaic_ras_pct
-
-                        if not cfg.SAVEBARRIERRASTERS:
-                            lu.delete_data(barrier_ras)
-                            if cfg.WRITE_PCT_RASTERS:
-                                lu.delete_data(barrier_ras_pct)
-                            if cfg.WRITE_TRIM_RASTERS:
-                                lu.delete_data(trm_ras)
-
-                        # Temporarily disable links in linktable -
-                        # don't want to mosaic them twice
-                        for y in range(x + 1, num_links):
-                            corex1 = int(core_list[y, 0])
-                            corey1 = int(core_list[y, 1])
-                            if corex1 == corex and corey1 == corey:
-                                link_table[y, cfg.LTB_LINKTYPE] = (
-                                    link_table[y, cfg.LTB_LINKTYPE] + 1000)
-                            elif corex1 == corey and corey1 == corex:
-                                link_table[y, cfg.LTB_LINKTYPE] = (
-                                    link_table[y, cfg.LTB_LINKTYPE] + 1000)
-
-                if num_corridor_links > 1 and pct_done < 100:
-                    gprint('100 percent done')
-                gprint('Summarizing barrier data for search radius.')
-                # Rows that were temporarily disabled
-                rows = npy.where(link_table[:, cfg.LTB_LINKTYPE] > 1000)
-                link_table[rows, cfg.LTB_LINKTYPE] = (
-                    link_table[rows, cfg.LTB_LINKTYPE] - 1000)
-                # -----------------------------------------------------------------
-                # Set negative values to null or zero and write geodatabase.
-                mosaic_fn = (prefix + "_BarrierCenters" + sum_suffix + "_Rad" +
-                             str(radius))
-                mosaic_ras = path.join(cfg.BARRIERGDB, mosaic_fn)
-                arcpy.env.extent = cfg.RESRAST
-
-                out_set_null = arcpy.sa.SetNull(tmp_mosaic_ras,
-                                                tmp_mosaic_ras,
-                                                "VALUE < 0")  # xxx orig
-                out_set_null.save(mosaic_ras)
-
-                lu.delete_data(tmp_mosaic_ras)
-
-                if cfg.SUM_BARRIERS and cfg.WRITE_TRIM_RASTERS:
-                    mosaic_fn = (prefix + "_BarrierCircles_RBMin" + sum_suffix
-                                 + "_Rad" + str(radius))
-                    mosaic_ras_trim = path.join(cfg.BARRIERGDB, mosaic_fn)
-                    arcpy.CopyRaster_management(tmp_mosaic_ras_trim,
-                                                mosaic_ras_trim)
-                    lu.delete_data(tmp_mosaic_ras)
-
-                if cfg.WRITE_PCT_RASTERS:
-                    # Do same for percent raster
-                    mosaic_pct_fn = (prefix + "_BarrierCenters_Pct"
-                                     + sum_suffix + "_Rad" + str(radius))
-                    arcpy.env.extent = cfg.RESRAST
-                    out_set_null = arcpy.sa.SetNull(tmp_mosaic_ras_pct,
-                                                    tmp_mosaic_ras_pct,
-                                                    "VALUE < 0")
-                    mosaic_ras_pct = path.join(cfg.BARRIERGDB, mosaic_pct_fn)
-                    out_set_null.save(mosaic_ras_pct)
-                    lu.delete_data(tmp_mosaic_ras_pct)
-
-                # 'Grow out' maximum restoration gain to
-                # neighborhood size for display
-                in_neighborhood = "CIRCLE " + str(outer_radius) + " MAP"
-                # Execute FocalStatistics
-                fill_ras_fn = "barriers_fill" + str(outer_radius) + TIF
-                fill_ras = path.join(cfg.BARRIERBASEDIR, fill_ras_fn)
-                out_focal_stats = arcpy.sa.FocalStatistics(
-                    mosaic_ras, in_neighborhood, "MAXIMUM", "DATA")
-                out_focal_stats.save(fill_ras)
-
-                if cfg.WRITE_PCT_RASTERS:
-                    # Do same for percent raster
-                    fill_ras_pct_fn = (
-                        "barriers_fill_pct" + str(outer_radius) + TIF)
-                    fill_ras_pct = path.join(cfg.BARRIERBASEDIR,
-                                             fill_ras_pct_fn)
-                    out_focal_stats = arcpy.sa.FocalStatistics(
-                        mosaic_ras_pct, in_neighborhood, "MAXIMUM", "DATA")
-                    out_focal_stats.save(fill_ras_pct)
-
-                # Place copies of filled rasters in output geodatabase
-                arcpy.env.workspace = cfg.BARRIERGDB
-                fill_ras_fn = (prefix + "_BarrrierCircles" + sum_suffix
-                               + "_Rad" + str(outer_radius))
-                arcpy.CopyRaster_management(fill_ras, fill_ras_fn)
-                if cfg.WRITE_PCT_RASTERS:
-                    fill_ras_pct_fn = (prefix + "_BarrrierCircles_Pct"
-                                       + sum_suffix + "_Rad"
-                                       + str(outer_radius))
-                    arcpy.CopyRaster_management(fill_ras_pct,
-                                                fill_ras_pct_fn)
-
+        link_rows = {}
+        for x in range(0, num_links):
+            if link_table[x, cfg.LTB_LINKTYPE] > 0:
+                pair = (int(core_list[x, 0]), int(core_list[x, 1]))
+                if pair not in link_rows:  # don't want to mosaic them twice
+                    link_rows[pair] = x
+
+        radii = list(range(start_radius, end_radius + 1, radius_step))
+        full_window = lg.Window(0, 0, grid.nrows, grid.ncols)
+
+        # Focal minimums of each core's CWD, cached for all radii
+        gprint('\nMapping barriers at radii of ' +
+               ', '.join(str(radius) for radius in radii) + ' ' +
+               str(map_units))
+        if cfg.SUM_BARRIERS:
+            gprint('using SUM method')
+        else:
+            gprint('using MAXIMUM method')
+        if cfg.BARRIER_CWD_THRESH is not None:
+            lu.dashline(1)
+            gprint('  Using CWD threshold of '
+                   + str(cfg.BARRIER_CWD_THRESH) + ' map units.')
+        start_time = time.clock()
+        cores = sorted(set(core for pair in link_rows for core in pair))
+        focal = {}
+        cwd = {}
+        cwd_thresh = None
+        if cfg.BARRIER_CWD_THRESH is None:
+            gprint('Calculating focal minimums of core area CWDs.')
+            for core in cores:
+                focal[core] = (calc_focal_mins(core, grid, radii),
+                               [focal_file(core, radius) for radius in radii])
+        else:
+            # Focal minimums are found for each link, only near its corridor
+            cwd_thresh = float(cfg.BARRIER_CWD_THRESH)
+            for core in cores:
+                cwd[core] = save_cwd(core, grid)
+        resist_file = None
+        if cfg.WRITE_TRIM_RASTERS:
+            resist_file = path.join(cfg.BARRIERBASEDIR, "resist_fill.npy")
+            save_resist_fill(grid, resist_file)
+        start_time = lu.elapsed_time(start_time)
+
+        settings = lb.Settings(grid.nrows, grid.ncols, grid.cell_size, radii,
+                               cfg.SUM_BARRIERS, cfg.WRITE_PCT_RASTERS,
+                               cfg.WRITE_TRIM_RASTERS, focal, resist_file,
+                               cwd_thresh, cwd)
+        links = [lb.Link(pair[0], pair[1],
+                         float(link_table[link_rows[pair], cfg.LTB_CWDIST]))
+                 for pair in sorted(link_rows)]
+
+        # Calculate barriers at all search radii in one pass through links
+        if num_corridor_links > 1:
+            gprint('0 percent done')
+        pct_done = 0
+        if cfg.BARRIER_PROCESSES > 1 and not cfg.SAVEBARRIERRASTERS:
+            # Use up to half of available memory for links being processed
+            max_bytes = int(lu.get_mem_bytes()[1] * 0.5)
+            gprint('Using ' + str(cfg.BARRIER_PROCESSES) +
+                   ' worker processes.')
+
+            def report(links_done, total_links):
+                """Report percent of links done."""
+                nonlocal pct_done
+                pct_done = lu.report_pct_done(links_done, total_links,
+                                              pct_done)
+            lu.set_worker_executable()
+            results = lb.run_parallel(links, settings,
+                                      cfg.BARRIER_PROCESSES, max_bytes,
+                                      report)
+        else:
+            results = lb.new_results(settings)
+            for link_loop, link in enumerate(links):
+                pct_done = lu.report_pct_done(link_loop, num_corridor_links,
+                                              pct_done)
+                barrier_name = path.join(
+                    cbarrierdir, "b{}_" + str(link.core1) + "_"
+                    + str(link.core2))
+                suffixes = {lb.CENTERS: "", lb.PCT: "_pct", lb.TRIM: "_trim"}
+                for name, radius, window, values in lb.link_results(
+                        link, settings):
+                    results[name][radius].add(window, values)
+                    if cfg.SAVEBARRIERRASTERS:
+                        lr.save_array(values, grid, window,
+                                      barrier_name.format(radius)
+                                      + suffixes[name] + TIF)
+        centers = results[lb.CENTERS]
+        centers_pct = results.get(lb.PCT)
+        trims = results.get(lb.TRIM)
+        del results
+
+        if num_corridor_links > 1 and pct_done < 100:
+            gprint('100 percent done')
+        start_time = lu.elapsed_time(start_time)
+
+        # Results across radii are the maximum of results at each radius
+        multi_radii = len(radii) > 1
+        radii_results = {}
+        names = ["_BarrierCenters", "_BarrierCircles"]
+        if cfg.WRITE_PCT_RASTERS:
+            names.extend(["_BarrierCenters_Pct", "_BarrierCircles_Pct"])
+        if cfg.WRITE_TRIM_RASTERS:
+            names.append("_BarrierCircles_RBMin")
+        for name in names:
+            radii_results[name] = lg.TiledAccumulator(grid.nrows, grid.ncols,
+                                                      lg.MAXIMUM)
+        radius_names = {"_BarrierCircles": "_BarrrierCircles",
+                        "_BarrierCircles_Pct": "_BarrrierCircles_Pct"}
+
+        def save_result(name, acc, radius, set_null=True):
+            """Save result for radius and add it to result across radii."""
+            if cfg.SAVE_RADIUS_RASTERS:
+                out_ras = path.join(cfg.BARRIERGDB, prefix +
+                                    radius_names.get(name, name) +
+                                    sum_suffix + "_Rad" + str(radius))
+                save_barriers(acc, grid, out_ras, set_null)
+            if multi_radii:
+                radii_results[name].merge(acc)
+
+        if not cfg.SUM_BARRIERS and cfg.WRITE_TRIM_RASTERS:
+            trims = dict((radius, lg.TiledAccumulator(grid.nrows, grid.ncols,
+                                                      lg.MAXIMUM))
+                         for radius in radii)
+            resist = npy.load(resist_file, mmap_mode='r')
+        for radius in radii:
+            gprint('Summarizing barrier data for search radius of ' +
+                   str(radius) + ' ' + str(map_units) + '.')
+            save_result("_BarrierCenters", centers[radius], radius)
+            if centers_pct is not None:
+                save_result("_BarrierCenters_Pct", centers_pct[radius],
+                            radius)
+
+            # 'Grow out' maximum restoration gain to
+            # neighborhood size for display
+            fills = lg.TiledAccumulator(grid.nrows, grid.ncols, lg.MAXIMUM)
+            for tile_window, fill in grow_barriers(centers[radius], grid,
+                                                   radius):
+                fills.add(tile_window, fill)
                 if not cfg.SUM_BARRIERS and cfg.WRITE_TRIM_RASTERS:
-                    # Create pared-down version of filled raster- remove pixels
-                    # that don't need restoring by allowing a pixel to only
-                    # contribute its resistance value to restoration gain
-                    out_ras_fn = "barriers_trm" + str(outer_radius) + TIF
-                    out_ras = path.join(cfg.BARRIERBASEDIR, out_ras_fn)
-                    ras_list = [fill_ras, resist_fill_ras]
-                    out_cell_statistics = arcpy.sa.CellStatistics(ras_list,
-                                                                  "MINIMUM")
-                    out_cell_statistics.save(out_ras)
-
-                    # SECOND ROUND TO CLIP BY DATA VALUES IN BARRIER RASTER
-                    out_ras_2fn = ("barriers_trm" + sum_suffix
-                                   + str(outer_radius) + "_2" + TIF)
-                    out_ras2 = path.join(cfg.BARRIERBASEDIR, out_ras_2fn)
-                    output = arcpy.sa.Con(arcpy.sa.IsNull(fill_ras),
-                                          fill_ras, out_ras)
-                    output.save(out_ras2)
-                    out_ras_fn = (prefix + "_BarrierCircles_RBMin"
-                                  + sum_suffix + "_Rad"
-                                  + str(outer_radius))
-                    arcpy.CopyRaster_management(out_ras2, out_ras_fn)
-                start_time = lu.elapsed_time(start_time)
-
-            # Call the above function
-            do_radius_loop()
+                    # Create pared-down version of filled raster- remove
+                    # pixels that don't need restoring by allowing a pixel
+                    # to only contribute its resistance value to
+                    # restoration gain
+                    trims[radius].add(tile_window, npy.minimum(
+                        fill, resist[lg.window_slices(tile_window,
+                                                      full_window)]))
+            del centers[radius]
+            save_result("_BarrierCircles", fills, radius)
+            del fills
+
+            if centers_pct is not None:
+                # Do same for percent raster
+                fills = lg.TiledAccumulator(grid.nrows, grid.ncols,
+                                            lg.MAXIMUM)
+                for tile_window, fill in grow_barriers(centers_pct[radius],
+                                                       grid, radius):
+                    fills.add(tile_window, fill)
+                del centers_pct[radius]
+                save_result("_BarrierCircles_Pct", fills, radius)
+                del fills
+
+            if cfg.WRITE_TRIM_RASTERS:
+                save_result("_BarrierCircles_RBMin", trims[radius], radius,
+                            set_null=False)
+                del trims[radius]
+            start_time = lu.elapsed_time(start_time)
 
         # Combine rasters across radii
-        gprint('\nCreating summary rasters...')
-        if start_radius != end_radius:
+        if multi_radii:
+            gprint('\nCreating summary rasters...')
             radii_suffix = ('_Rad' + str(int(start_radius)) + 'To'
                             + str(int(end_radius)) + 'Step'
                             + str(int(radius_step)))
-            mosaic_fn = "bar_radii"
-            mosaic_pct_fn = "bar_radii_pct"
-            arcpy.env.workspace = cfg.BARRIERBASEDIR
-            for radius in range(start_radius, end_radius + 1, radius_step):
-                # Fixme: run speed test with gdb mosaicking above and here
-                radius_fn = (prefix + "_BarrierCenters" + sum_suffix + "_Rad"
-                             + str(radius))
-                radius_ras = path.join(cfg.BARRIERGDB, radius_fn)
-
-                if radius == start_radius:
-                    # If this is the first grid then copy rather than mosaic
-                    arcpy.CopyRaster_management(radius_ras, mosaic_fn)
-                else:
-                    mosaic_ras = path.join(cfg.BARRIERBASEDIR, mosaic_fn)
-                    arcpy.Mosaic_management(radius_ras, mosaic_ras,
-                                            "MAXIMUM", "MATCH")
-
-                if cfg.WRITE_PCT_RASTERS:
-                    radius_pct_fn = (prefix + "_BarrierCenters_Pct"
-                                     + sum_suffix + "_Rad" + str(radius))
-                    radius_ras_pct = path.join(cfg.BARRIERGDB, radius_pct_fn)
-
-                    if radius == start_radius:
-                        # If this is the first grid then copy rather than
-                        # mosaic
-                        arcpy.CopyRaster_management(radius_ras_pct,
-                                                    mosaic_pct_fn)
-                    else:
-                        mosaic_ras_pct = path.join(cfg.BARRIERBASEDIR,
-                                                   mosaic_pct_fn)
-                        arcpy.Mosaic_management(radius_ras_pct,
-                                                mosaic_ras_pct,
-                                                "MAXIMUM", "MATCH")
-
-            # Copy results to output geodatabase
-            arcpy.env.workspace = cfg.BARRIERGDB
-            mosaic_fn = prefix + "_BarrierCenters" + sum_suffix + radii_suffix
-            arcpy.CopyRaster_management(mosaic_ras, mosaic_fn)
-
-            if cfg.WRITE_PCT_RASTERS:
-                mosaic_pct_fn = (prefix + "_BarrierCenters_Pct" + sum_suffix +
-                                 radii_suffix)
-                arcpy.CopyRaster_management(mosaic_ras_pct, mosaic_pct_fn)
-
-            # GROWN OUT rasters
-            fill_mosaic_fn = "barriers_radii_fill" + TIF
-            fill_mosaic_pct_fn = "barriers_radii_fill_pct" + TIF
-            fill_mosaic_ras = path.join(cfg.BARRIERBASEDIR, fill_mosaic_fn)
-            trim_mosaic_ras_pct = path.join(cfg.BARRIERBASEDIR,
-                                            fill_mosaic_pct_fn)
-
-            arcpy.env.workspace = cfg.BARRIERBASEDIR
-            for radius in range(start_radius, end_radius + 1, radius_step):
-                radius_fn = "barriers_fill" + str(radius) + TIF
-                # fixme- do this when only a single radius too
-                radius_ras = path.join(cfg.BARRIERBASEDIR, radius_fn)
-                if radius == start_radius:
-                    # If this is the first grid then copy rather than mosaic
-                    arcpy.CopyRaster_management(radius_ras, fill_mosaic_fn)
-                else:
-                    arcpy.Mosaic_management(radius_ras, fill_mosaic_ras,
-                                            "MAXIMUM", "MATCH")
-
-                if cfg.WRITE_PCT_RASTERS:
-                    radius_pct_fn = "barriers_fill_pct" + str(radius) + TIF
-                    # fixme- do this when only a single radius too
-                    radius_ras_pct = path.join(cfg.BARRIERBASEDIR,
-                                               radius_pct_fn)
-                    if radius == start_radius:
-                        # For first grid copy rather than mosaic
-                        arcpy.CopyRaster_management(radius_ras_pct,
-                                                    fill_mosaic_pct_fn)
-                    else:
-                        arcpy.Mosaic_management(radius_ras_pct,
-                                                trim_mosaic_ras_pct,
-                                                "MAXIMUM", "MATCH")
-
-            # Copy result to output geodatabase
-            arcpy.env.workspace = cfg.BARRIERGDB
-            fill_mosaic_fn = (prefix + "_BarrierCircles" + sum_suffix
-                              + radii_suffix)
-            arcpy.CopyRaster_management(fill_mosaic_ras, fill_mosaic_fn)
-            if cfg.WRITE_PCT_RASTERS:
-                fill_mosaic_pct_fn = (prefix + "_BarrierCircles_Pct"
-                                      + sum_suffix + radii_suffix)
-                arcpy.CopyRaster_management(trim_mosaic_ras_pct,
-                                            fill_mosaic_pct_fn)
-
-            # GROWN OUT AND TRIMMED rasters (Can't do percent)
-            if cfg.WRITE_TRIM_RASTERS:
-                trim_mosaic_fn = "bar_radii_trm"
-                arcpy.env.workspace = cfg.BARRIERBASEDIR
-                trim_mosaic_ras = path.join(cfg.BARRIERBASEDIR, trim_mosaic_fn)
-                for radius in range(start_radius, end_radius + 1, radius_step):
-                    radius_fn = (prefix + "_BarrierCircles_RBMin" + sum_suffix
-                                 + "_Rad" + str(radius))
-                    # fixme- do this when only a single radius too
-                    radius_ras = path.join(cfg.BARRIERGDB, radius_fn)
-
-                    if radius == start_radius:
-                        # For first grid copy rather than mosaic
-                        arcpy.CopyRaster_management(radius_ras, trim_mosaic_fn)
-                    else:
-                        arcpy.Mosaic_management(radius_ras, trim_mosaic_ras,
-                                                "MAXIMUM", "MATCH")
-                # Copy result to output geodatabase
-                arcpy.env.workspace = cfg.BARRIERGDB
-                trim_mosaic_fn = (prefix + "_BarrierCircles_RBMin" + sum_suffix
-                                  + radii_suffix)
-                arcpy.CopyRaster_management(trim_mosaic_ras, trim_mosaic_fn)
-
-        if not cfg.SAVE_RADIUS_RASTERS:
-            arcpy.env.workspace = cfg.BARRIERGDB
-            rasters = arcpy.ListRasters()
-            for raster in rasters:
-                if 'rad' in raster.lower() and 'step' not in raster.lower():
-                    lu.delete_data(raster)
+            for name in names:
+                save_barriers(radii_results[name], grid, path.join(
+                    cfg.BARRIERGDB, prefix + name + sum_suffix +
+                    radii_suffix), name != "_BarrierCircles_RBMin")
+            del radii_results
 
         arcpy.env.workspace = cfg.BARRIERGDB
         rasters = arcpy.ListRasters()
@@ -7,12 +7,14 @@ ArcGIS Desktop 10.3+ or ArcGIS Pro with Spatial Analyst extension
 Numpy
 """
 
-from os import path
+from os import path, replace
 
 import numpy as npy
 import arcpy
 
 from lm_config import tool_env as cfg
+import lm_circuit as lc
+import lm_cs_process as lcp
 import lm_util as lu
 
 
@@ -98,26 +100,6 @@ def STEP7_calc_centrality():
         coreList = linkTable[:,cfg.LTB_CORE1:cfg.LTB_CORE2+1]
         coreList = npy.sort(coreList)
 
-        # set up directory for centrality
-        INCENTRALITYDIR = cfg.CENTRALITYBASEDIR
-        OUTCENTRALITYDIR = path.join(cfg.CENTRALITYBASEDIR,
-                                     cfg.CIRCUITOUTPUTDIR_NM)
-        CONFIGDIR = path.join(INCENTRALITYDIR, cfg.CIRCUITCONFIGDIR_NM)
-
-        # Set Circuitscape options and write config file
-        options = lu.set_cs_options()
-        options['data_type']='network'
-        options['habitat_file'] = path.join(INCENTRALITYDIR,
-                                            'Circuitscape_graph.txt')
-        # Setting point file equal to graph to do all pairs in Circuitscape
-        options['point_file'] = path.join(INCENTRALITYDIR,
-                                          'Circuitscape_graph.txt')
-        outputFN = 'Circuitscape_network.out'
-        options['output_file'] = path.join(OUTCENTRALITYDIR, outputFN)
-        configFN = 'Circuitscape_network.ini'
-        outConfigFile = path.join(CONFIGDIR, configFN)
-        lu.write_cs_cfg_file(outConfigFile, options)
-
         delRows = npy.asarray(npy.where(linkTable[:,cfg.LTB_LINKTYPE] < 1))
         delRowsVector = npy.zeros((delRows.shape[1]), dtype="int32")
         delRowsVector[:] = delRows[0, :]
@@ -129,58 +111,45 @@ def STEP7_calc_centrality():
         graphList[:,1] = LT[:,cfg.LTB_CORE2]
         graphList[:,2] = LT[:,cfg.LTB_CWDIST]
 
-        write_graph(options['habitat_file'] ,graphList)
-        gprint('\nCalculating current flow centrality using Circuitscape...')
-
-        memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
-
-        outputFN = 'Circuitscape_network_branch_currents_cum.txt'
-        currentList = path.join(OUTCENTRALITYDIR, outputFN)
-
-        if not arcpy.Exists(currentList):
-            write_graph(options['habitat_file'] ,graphList)
-            gprint('\nCalculating current flow centrality using Circuitscape '
-                   '(2nd try)...')
-            memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
-            if not arcpy.Exists(currentList):
-                lu.dashline(1)
-                msg = ('ERROR: No Circuitscape output found.\n'
-                       'It looks like Circuitscape failed.')
-                arcpy.AddError(msg)
-                lu.write_log(msg)
-                exit(1)
-
-
-        currents = load_graph(currentList,graphType='graph/network',
-                              datatype=npy.float64)
-
-        numLinks = currents.shape[0]
-        for x in range(0,numLinks):
-            corex = currents[x,0]
-            corey = currents[x,1]
-
-            #linkId = LT[x,cfg.LTB_LINKID]
-            row = lu.get_links_from_core_pairs(linkTable, corex, corey)
-            #row = lu.get_linktable_row(linkId, linkTable)
-            linkTable[row,cfg.LTB_CURRENT] = currents[x,2]
-
-        coreCurrentFN = 'Circuitscape_network_node_currents_cum.txt'
-        nodeCurrentList = path.join(OUTCENTRALITYDIR, coreCurrentFN)
-        nodeCurrents = load_graph(nodeCurrentList,graphType='graph/network',
-                              datatype=npy.float64)
-
-        numNodeCurrents = nodeCurrents.shape[0]
+        if cfg.CIRCUIT_IN_PROCESS:
+            gprint('\nCalculating current flow centrality...')
+            network, linkEdges, deltas = get_network(graphList)
+            write_current_changes(network, deltas)
+            linkCurrents = network.branch_currents()
+            coreCurrents = network.node_currents(linkCurrents)
+            currents = npy.column_stack((graphList[:, 0:2],
+                                         linkCurrents[linkEdges]))
+            inGraph = npy.isin(network.nodes, graphList[:, 0:2])
+            nodeCurrents = npy.column_stack((network.nodes[inGraph],
+                                             coreCurrents[inGraph]))
+        else:
+            currents, nodeCurrents = calc_centrality_circuitscape(graphList)
+
+        # Join link currents to link table rows on packed core pair keys.
+        # Where a pair has more than one current, the last one is used.
+        maxCore = max(linkTable[:, cfg.LTB_CORE1:cfg.LTB_CORE2 + 1].max(),
+                      currents[:, 0:2].max())
+        currentKeys = lu.core_pair_keys(currents[:, 0], currents[:, 1],
+                                        maxCore)
+        linkKeys = lu.core_pair_keys(linkTable[:, cfg.LTB_CORE1],
+                                     linkTable[:, cfg.LTB_CORE2], maxCore)
+        order = npy.argsort(currentKeys, kind='mergesort')
+        sortedKeys = currentKeys[order]
+        matches = npy.searchsorted(sortedKeys, linkKeys, side='right') - 1
+        found = matches >= 0
+        found[found] = sortedKeys[matches[found]] == linkKeys[found]
+        linkTable[found, cfg.LTB_CURRENT] = currents[order[matches[found]], 2]
+
+        currentsByCore = dict(zip(
+            nodeCurrents[:, 0].astype(npy.int64).tolist(),
+            nodeCurrents[:, 1].tolist()))
         rows = arcpy.UpdateCursor(coreCopy)
-        row = rows.newRow()
         for row in rows:
-            coreID = row.getValue(cfg.COREFN)
-            for i in range (0, numNodeCurrents):
-                if coreID == nodeCurrents[i,0]:
-                    row.setValue("CF_Central", nodeCurrents[i,1])
-                    break
-            rows.updateRow(row)
-            #row = rows.newRow()
-        del row, rows
+            coreID = int(row.getValue(cfg.COREFN))
+            if coreID in currentsByCore:
+                row.setValue("CF_Central", currentsByCore[coreID])
+                rows.updateRow(row)
+        del rows
         gprint('Done with centrality calculations.')
 
         finalLinkTable = lu.update_lcp_shapefile(linkTable, lastStep=5,
@@ -223,6 +192,147 @@ def STEP7_calc_centrality():
     return
 
 
+def get_network(graphList):
+    """Return centrality network for links, reusing the last run's network.
+
+    If only a few links were added, dropped or changed since the last run,
+    the saved network is updated rather than solved again. Networks with
+    more than lc.STATE_MAX_NODES cores are not saved, so are solved from
+    scratch each run. Returns the network, the index of each link in it and
+    the change in (core currents, link currents) since the last run, or None
+    for the changes if the network was solved from scratch.
+
+    """
+    core1 = graphList[:, 0]
+    core2 = graphList[:, 1]
+    cwDist = graphList[:, 2]
+    update = None
+    if path.exists(cfg.CENTRALITYSTATEFILE):
+        try:
+            network = lc.NetworkCircuit.load(cfg.CENTRALITYSTATEFILE)
+            update = network.update_links(core1, core2, cwDist)
+        except (IOError, KeyError, ValueError):
+            update = None
+    if update is None:
+        network = lc.NetworkCircuit(core1, core2, cwDist)
+        linkEdges = npy.arange(graphList.shape[0])
+        deltas = None
+    else:
+        gprint('Updated network from previous centrality run.')
+        linkEdges, deltas = update[0], update[1:]
+
+    if len(network.nodes) > lc.STATE_MAX_NODES:
+        lu.delete_file(cfg.CENTRALITYSTATEFILE)
+    else:
+        tmpFile = path.join(cfg.DATAPASSDIR, "centrality_state_tmp.npz")
+        network.save(tmpFile)
+        replace(tmpFile, cfg.CENTRALITYSTATEFILE)
+    return network, linkEdges, deltas
+
+
+def write_current_changes(network, deltas):
+    """Write tables of core and link current changes since the last run.
+
+    Tables go in the output folder beside the final link table. Links
+    dropped since the last run are included, with their current as a
+    negative change. If the network was solved from scratch (deltas is None)
+    there are no changes to report, and old tables are deleted.
+
+    """
+    coreFile = path.join(cfg.OUTPUTDIR,
+                         cfg.PREFIX + "_coreCentralityChanges.csv")
+    linkFile = path.join(cfg.OUTPUTDIR,
+                         cfg.PREFIX + "_linkCentralityChanges.csv")
+    if deltas is None:
+        lu.delete_file(coreFile)
+        lu.delete_file(linkFile)
+        return
+    nodeDelta, branchDelta = deltas
+    npy.savetxt(coreFile, npy.column_stack((network.nodes, nodeDelta)),
+                fmt=('%d', '%.10g'), delimiter=',',
+                header='coreId,CF_Change')
+    links = (network.conductance > 0) | (branchDelta != 0)
+    ends = network.nodes[network.ends[links]]
+    npy.savetxt(linkFile, npy.column_stack((ends, branchDelta[links])),
+                fmt=('%d', '%d', '%.10g'), delimiter=',',
+                header='coreId1,coreId2,CF_Change')
+    gprint('Changes in centrality since the previous run written to\n' +
+           coreFile + ' and\n' + linkFile)
+
+
+def calc_centrality_circuitscape(graphList):
+    """Calculate link and core currents by calling Circuitscape.
+
+    Returns arrays of core1, core2, current for links and core, current
+    for cores.
+
+    """
+    # set up directory for centrality
+    INCENTRALITYDIR = cfg.CENTRALITYBASEDIR
+    OUTCENTRALITYDIR = path.join(cfg.CENTRALITYBASEDIR,
+                                 cfg.CIRCUITOUTPUTDIR_NM)
+    CONFIGDIR = path.join(INCENTRALITYDIR, cfg.CIRCUITCONFIGDIR_NM)
+
+    # Set Circuitscape options and write config file
+    options = lu.set_cs_options()
+    options['data_type']='network'
+    options['habitat_file'] = path.join(INCENTRALITYDIR,
+                                        'Circuitscape_graph.txt')
+    # Setting point file equal to graph to do all pairs in Circuitscape
+    options['point_file'] = path.join(INCENTRALITYDIR,
+                                      'Circuitscape_graph.txt')
+    outputFN = 'Circuitscape_network.out'
+    options['output_file'] = path.join(OUTCENTRALITYDIR, outputFN)
+    write_graph(options['habitat_file'] ,graphList)
+
+    outputFN = 'Circuitscape_network_branch_currents_cum.txt'
+    currentList = path.join(OUTCENTRALITYDIR, outputFN)
+
+    configFN = 'Circuitscape_network.ini'
+    outConfigFile = path.join(CONFIGDIR, configFN)
+    lu.write_cs_cfg_file(outConfigFile, options)
+    gprint('\nCalculating current flow centrality using Circuitscape...')
+
+    if cfg.CIRCUIT_BATCH:
+        manifestFile = path.join(CONFIGDIR, 'Circuitscape_network.jsonl')
+        job = lcp.CSJob('network', outConfigFile, options['output_file'],
+                        None)
+        for record in lu.solve_circuit_batch([job], manifestFile):
+            if record['error'] is not None:
+                lu.raise_error('ERROR: Current flow centrality failed.')
+        return load_centrality_results(OUTCENTRALITYDIR)
+
+    memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
+
+    if not arcpy.Exists(currentList):
+        write_graph(options['habitat_file'] ,graphList)
+        gprint('\nCalculating current flow centrality using Circuitscape '
+               '(2nd try)...')
+        memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
+        if not arcpy.Exists(currentList):
+            lu.dashline(1)
+            msg = ('ERROR: No Circuitscape output found.\n'
+                   'It looks like Circuitscape failed.')
+            arcpy.AddError(msg)
+            lu.write_log(msg)
+            exit(1)
+    return load_centrality_results(OUTCENTRALITYDIR)
+
+
+def load_centrality_results(outDir):
+    """Load link and core currents written for the network circuit."""
+    outputFN = 'Circuitscape_network_branch_currents_cum.txt'
+    currentList = path.join(outDir, outputFN)
+    currents = load_graph(currentList,graphType='graph/network',
+                          datatype=npy.float64)
+
+    coreCurrentFN = 'Circuitscape_network_node_currents_cum.txt'
+    nodeCurrentList = path.join(outDir, coreCurrentFN)
+    nodeCurrents = load_graph(nodeCurrentList,graphType='graph/network',
+                              datatype=npy.float64)
+    return currents, nodeCurrents
+
+
 def write_graph(filename,graphList):
     npy.savetxt(filename,graphList)
     return
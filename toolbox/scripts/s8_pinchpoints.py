@@ -15,7 +15,12 @@ import arcpy
 
 from lm_retry_decorator import Retry
 from lm_config import tool_env as cfg
+import lm_circuit as lc
+import lm_cs_process as lcp
 import lm_util as lu
+import lm_nlcc as lnlcc
+import lm_raster as lr
+from lm_grid import Window
 
 _SCRIPT_NAME = "s8_pinchpoints.py"
 
@@ -113,10 +118,8 @@ def STEP8_calc_pinchpoints():
         coreList = linkTable[:,cfg.LTB_CORE1:cfg.LTB_CORE2+1]
         coreList = npy.sort(coreList)
 
-        INCIRCUITDIR = cfg.CIRCUITBASEDIR
         OUTCIRCUITDIR = path.join(cfg.CIRCUITBASEDIR,
                                   cfg.CIRCUITOUTPUTDIR_NM)
-        CONFIGDIR = path.join(INCIRCUITDIR, cfg.CIRCUITCONFIGDIR_NM)
 
         # Cutoff value text to append to filenames
         cutoffText = lu.cwd_cutoff_str(cfg.CWDCUTOFF)
@@ -141,22 +144,50 @@ def STEP8_calc_pinchpoints():
             gprint('and ending the cs_run.exe process.')
             lu.dashline(2)
 
+            # Link circuits to solve in process, and links finished
+            linkJobs = []
+            linkInfo = {}
+            batchJobs = []
+            batchOptions = {}
+            linksDone = 0
+            if restartFlag and arcpy.Exists(mosaicRaster):
+                # Add to mosaic from run being restarted
+                linksDone = 1
+
+            # Use corridors saved by step 5 if they extend to the cutoff
+            nlccReader = None
+            if path.isfile(cfg.NLCCFILE):
+                nlccReader = lnlcc.NlccReader(cfg.NLCCFILE)
+                if nlccReader.cwd_thresh < cfg.CWDCUTOFF:
+                    nlccReader.close()
+                    nlccReader = None
+                else:
+                    nlccGrid = lr.grid_from_nlcc(nlccReader)
+
             for x in range(0,numLinks):
                 linkId = str(int(linkTable[x,cfg.LTB_LINKID]))
                 if not (linkTable[x,cfg.LTB_LINKTYPE] > 0):
                     continue
                 linkLoop = linkLoop + 1
                 linkDir = path.join(cfg.SCRATCHDIR, 'link' + linkId)
-                if restartFlag == True and path.exists(linkDir):
-                    gprint('continuing')
-                    continue
-                restartFlag = False
-                lu.create_dir(linkDir)
-                start_time1 = time.clock()
 
                 # source and target cores
                 corex=int(coreList[x,0])
                 corey=int(coreList[x,1])
+                link = lu.get_links_from_core_pairs(linkTable, corex,
+                                                    corey)
+
+                doneFile = link_done_file(linkDir)
+                if restartFlag == True and path.exists(doneFile):
+                    # Finished and mosaicked by the run being restarted
+                    with open(doneFile) as done:
+                        set_link_resistance(linkTable, link,
+                                            float(done.read()))
+                    gprint('continuing')
+                    continue
+                lu.delete_file(doneFile)
+                lu.create_dir(linkDir)
+                start_time1 = time.clock()
 
                 # Get cwd rasters for source and target cores
                 cwdRaster1 = lu.get_cwd_path(corex)
@@ -165,23 +196,31 @@ def STEP8_calc_pinchpoints():
                 lccNormRaster = path.join(linkDir, 'lcc_norm')
                 arcpy.env.extent = "MINOF"
 
-                link = lu.get_links_from_core_pairs(linkTable, corex,
-                                                    corey)
                 lcDist = float(linkTable[link,cfg.LTB_CWDIST])
 
-                # Normalized lcc rasters are created by adding cwd rasters
-                # and subtracting the least cost distance between them.
-                outRas = (arcpy.sa.Raster(cwdRaster1)
-                          + arcpy.sa.Raster(cwdRaster2) - lcDist)
-                outRas.save(lccNormRaster)
-
                 #create raster mask
                 resMaskRaster = path.join(linkDir, 'res_mask'+tif)
 
-                #create raster mask
-                outCon = arcpy.sa.Con(arcpy.sa.Raster(lccNormRaster)
-                                      <= cfg.CWDCUTOFF, 1)
-                outCon.save(resMaskRaster)
+                if nlccReader is not None and nlccReader.has_link(corex,
+                                                                  corey):
+                    # Corridor cells within cutoff saved by step 5
+                    win, nlcc = nlccReader.dense(corex, corey,
+                                                 cfg.CWDCUTOFF)
+                    nlcc[~npy.isnan(nlcc)] = 1
+                    lr.save_array(nlcc, nlccGrid, win, resMaskRaster,
+                                  integer=True)
+                    del nlcc
+                else:
+                    # Normalized lcc rasters are created by adding cwd
+                    # rasters and subtracting the least cost distance
+                    # between them.
+                    outRas = (arcpy.sa.Raster(cwdRaster1)
+                              + arcpy.sa.Raster(cwdRaster2) - lcDist)
+                    outRas.save(lccNormRaster)
+
+                    outCon = arcpy.sa.Con(arcpy.sa.Raster(lccNormRaster)
+                                          <= cfg.CWDCUTOFF, 1)
+                    outCon.save(resMaskRaster)
 
                 # Convert to poly.  Use as mask to clip resistance raster.
                 resMaskPoly = path.join(linkDir,
@@ -199,22 +238,6 @@ def STEP8_calc_pinchpoints():
                 outRas = arcpy.sa.ExtractByMask(resRaster, resMaskPoly) + 0.0
                 outRas.save(resClipRasterMasked)
 
-                resNpyFN = 'resistances_link_' + linkId + '.npy'
-                resNpyFile = path.join(INCIRCUITDIR, resNpyFN)
-                numElements, numResistanceNodes = export_ras_to_npy(resClipRasterMasked,
-                                                          resNpyFile)
-
-                totMem, availMem = lu.get_mem()
-                if numResistanceNodes / availMem > 2000000:
-                    lu.dashline(1)
-                    lu.warn('Warning:')
-                    lu.warn('Circuitscape can only solve 2-3 million nodes')
-                    lu.warn('per gigabyte of available RAM. \nTotal physical RAM'
-                            ' on your machine is ~' + str(totMem)
-                            + ' GB. \nAvailable memory is ~'+ str(availMem)
-                            + ' GB. \nYour resistance raster has '
-                            + str(numResistanceNodes) + ' nodes.')
-                    lu.dashline(2)
                 corePairRaster = path.join(linkDir, 'core_pairs'+tif)
                 arcpy.env.extent = resClipRasterMasked
 
@@ -224,128 +247,84 @@ def STEP8_calc_pinchpoints():
                           + 0.0)))
                 outCon.save(corePairRaster)
 
-                coreNpyFN = 'cores_link_' + linkId + '.npy'
-                coreNpyFile = path.join(INCIRCUITDIR, coreNpyFN)
-                numElements, numNodes = export_ras_to_npy(corePairRaster,
-                                                          coreNpyFile)
-
                 arcpy.env.extent = "MINOF"
 
-                # Set circuitscape options and call
-                options = lu.set_cs_options()
-                if cfg.WRITE_VOLT_MAPS == True:
-                    options['write_volt_maps']=True
-                options['habitat_file'] = resNpyFile
-
-                options['point_file'] = coreNpyFile
-                options['set_focal_node_currents_to_zero']=True
-                outputFN = 'Circuitscape_link' + linkId + '.out'
-                options['output_file'] = path.join(OUTCIRCUITDIR, outputFN)
-                if numElements > 250000:
-                    options['print_timings']=True
-                configFN = 'pinchpoint_config' + linkId + '.ini'
-
-                outConfigFile = path.join(CONFIGDIR, configFN)
-                lu.write_cs_cfg_file(outConfigFile, options)
-                gprint('Processing link ID #' + str(linkId) + '. Resistance map'
-                        ' has ' + str(int(numResistanceNodes)) + ' nodes.')
-
-                memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
-
-                currentFN = ('Circuitscape_link' + linkId
-                            + '_cum_curmap.npy')
-                currentMap = path.join(OUTCIRCUITDIR, currentFN)
-
-                if not arcpy.Exists(currentMap):
-                    print_failure(numResistanceNodes, memFlag, 10)
-                    numElements, numNodes = export_ras_to_npy(
-                                                resClipRasterMasked,resNpyFile)
-                    memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
-
-                    currentFN = ('Circuitscape_link' + linkId
-                                + '_cum_curmap.npy')
-                    currentMap = path.join(OUTCIRCUITDIR, currentFN)
-
-                if not arcpy.Exists(currentMap):
-                    msg = ('\nCircuitscape failed. See error information above.')
-                    arcpy.AddError(msg)
-                    lu.write_log(msg)
-                    exit(1)
-
-                # Either set core areas to nodata in current map or
-                # divide each by its radius
-                currentRaster = path.join(linkDir, "current" + tif)
-                import_npy_to_ras(currentMap,corePairRaster,currentRaster)
-
-                if cfg.WRITE_VOLT_MAPS == True:
-                    voltFN = ('Circuitscape_link' + linkId + '_voltmap_'
-                           + str(corex) + '_'+str(corey) + '.npy')
-                    voltMap = path.join(OUTCIRCUITDIR, voltFN)
-                    voltRaster = path.join(outputGDB,
-                             cfg.PREFIX + "_voltMap_"+ str(corex) + '_'+str(corey))
-                    import_npy_to_ras(voltMap,corePairRaster,voltRaster)
-                    gprint('Building output statistics and pyramids '
-                                   'for voltage raster\n')
-                    lu.build_stats(voltRaster)
-
-                arcpy.env.extent = currentRaster
-
-                if SETCORESTONULL:
-                    # Set core areas to NoData in current map for color ramping
-                    currentRaster2 = currentRaster + '2' + tif
-                    outCon = (arcpy.sa.Con(arcpy.sa.IsNull(
-                              arcpy.sa.Raster(corePairRaster)),
-                              arcpy.sa.Raster(currentRaster)))
-                    outCon.save(currentRaster2)
-                    currentRaster = currentRaster2
-                arcpy.env.extent = "MAXOF"
-                if linkLoop == 1:
-                    lu.delete_data(mosaicRaster)
-                    @Retry(10)
-                    def copyRas2():
-                        arcpy.CopyRaster_management(currentRaster,
-                                                    mosaicRaster)
-                    copyRas2()
-                else:
-                    @Retry(10)
-                    def mosaicRas():
-                        arcpy.Mosaic_management(currentRaster,
-                                         mosaicRaster, "MAXIMUM", "MATCH")
-                    mosaicRas()
-
-                resistancesFN = ('Circuitscape_link' + linkId
-                            + '_resistances_3columns.out')
-
-                resistancesFile = path.join(OUTCIRCUITDIR,resistancesFN)
-                resistances = npy.loadtxt(resistancesFile,
-                                          dtype=npy.float64, comments='#')
-
-                resistance = float(arcpy.env.cellSize) * resistances[2]
-                linkTable[link,cfg.LTB_EFFRESIST] = resistance
-
-                # Ratio
-                if not cfg.SQUARERESISTANCES:
-                    linkTable[link,cfg.LTB_CWDTORR] = (linkTable[link,
-                           cfg.LTB_CWDIST] / linkTable[link,cfg.LTB_EFFRESIST])
-                # Clean up
-                if cfg.SAVE_TEMP_CIRCUIT_FILES == False:
-                    lu.delete_file(coreNpyFile)
-                    coreNpyBase, extension = path.splitext(coreNpyFile)
-                    lu.delete_data(coreNpyBase + '.hdr')
-                    lu.delete_file(resNpyFile)
-                    resNpyBase, extension = path.splitext(resNpyFile)
-                    lu.delete_data(resNpyBase + '.hdr')
-                    lu.delete_file(currentMap)
-                    curMapBase, extension = path.splitext(currentMap)
-                    lu.delete_data(curMapBase + '.hdr')
-                    lu.delete_data(currentRaster)
-                    lu.clean_out_workspace(linkDir)
-                    lu.delete_dir(linkDir)
+                if cfg.CIRCUIT_IN_PROCESS:
+                    # Solved below, in worker processes
+                    linkJobs.append(save_link_job(
+                        linkId, corex, corey, resClipRasterMasked,
+                        corePairRaster, linkDir))
+                    linkInfo[linkId] = (link, corePairRaster, linkDir,
+                                        lr.grid_info(resClipRasterMasked))
+                    continue
+                if cfg.CIRCUIT_BATCH:
+                    # Added to batch manifest, run below
+                    options = set_link_cs_options(
+                        linkId, resClipRasterMasked, corePairRaster)[0]
+                    outConfigFile = write_link_cs_config(linkId, options)
+                    batchJobs.append(lcp.CSJob(linkId, outConfigFile,
+                                               options['output_file'], None))
+                    batchOptions[linkId] = options
+                    linkInfo[linkId] = (link, corex, corey, corePairRaster,
+                                        linkDir)
+                    continue
+
+                currentRaster, effResistance = calc_link_circuitscape(
+                    linkId, corex, corey, resClipRasterMasked,
+                    corePairRaster, linkDir, outputGDB)
+                finish_link(linkTable, link, currentRaster, corePairRaster,
+                            effResistance, mosaicRaster, linksDone == 0,
+                            linkDir)
+                linksDone = linksDone + 1
                 gprint('Finished with link ID #' + str(linkId) + '. ' +
                         str(linkLoop) + ' out of ' + str(numCorridorLinks) +
                         ' links have been processed.')
                 start_time1 = lu.elapsed_time(start_time1)
 
+            if linkJobs:
+                lu.dashline(1)
+                gprint('Solving circuits for ' + str(len(linkJobs)) +
+                       ' links.')
+                for job, result in solve_link_jobs(linkJobs):
+                    link, corePairRaster, linkDir, grid = linkInfo[job.link_id]
+                    currentRaster = save_link_results(job, grid, outputGDB)
+                    finish_link(linkTable, link, currentRaster,
+                                corePairRaster, result[1], mosaicRaster,
+                                linksDone == 0, linkDir)
+                    linksDone = linksDone + 1
+                    gprint('Finished with link ID #' + str(job.link_id) +
+                           ' in ' + str(round(result[2], 1)) + ' seconds. ' +
+                           str(linksDone) + ' out of ' + str(len(linkJobs)) +
+                           ' links have been solved.')
+
+            if batchJobs:
+                lu.dashline(1)
+                gprint('Solving circuits for ' + str(len(batchJobs)) +
+                       ' links.')
+                manifestFile = path.join(cfg.CIRCUITBASEDIR,
+                                         cfg.CIRCUITCONFIGDIR_NM,
+                                         'pinchpoint_batch.jsonl')
+                for record in lu.solve_circuit_batch(batchJobs,
+                                                     manifestFile):
+                    linkId = record['name']
+                    if record['error'] is not None:
+                        lu.raise_error('Circuitscape failed on link ID #'
+                                       + linkId + '.')
+                    link, corex, corey, corePairRaster, linkDir = (
+                        linkInfo[linkId])
+                    currentRaster, effResistance = import_link_cs_results(
+                        batchOptions[linkId], corex, corey, corePairRaster,
+                        linkDir, outputGDB)
+                    finish_link(linkTable, link, currentRaster,
+                                corePairRaster, effResistance, mosaicRaster,
+                                linksDone == 0, linkDir)
+                    linksDone = linksDone + 1
+                    gprint('Finished with link ID #' + linkId + ' in ' +
+                           str(round(record['seconds'], 1)) + ' seconds.')
+
+            if nlccReader is not None:
+                nlccReader.close()
+
             outputRaster = path.join(outputGDB, cfg.PREFIX +
                                      "_current_adjacentPairs_" + cutoffText)
             lu.delete_data(outputRaster)
@@ -388,13 +367,13 @@ def STEP8_calc_pinchpoints():
 
         lu.dashline(1)
         gprint('Mapping global pinch points among all\n'
-                'core area pairs using Circuitscape.')
+                'core area pairs.')
 
         if cfg.ALL_PAIR_SCENARIO=='pairwise':
-            gprint('Circuitscape will be run in PAIRWISE mode.')
+            gprint('Circuits will be solved in PAIRWISE mode.')
 
         else:
-            gprint('Circuitscape will be run in ALL-TO-ONE mode.')
+            gprint('Circuits will be solved in ALL-TO-ONE mode.')
         arcpy.env.workspace = cfg.SCRATCHDIR
         arcpy.env.scratchWorkspace = cfg.ARCSCRATCHDIR
         arcpy.env.extent = cfg.RESRAST
@@ -434,74 +413,19 @@ def STEP8_calc_pinchpoints():
                               -9999, arcpy.sa.Raster(s8CoreRasPath))
         outCon.save(s8CoreRasClipped)
 
-        resNpyFN = 'resistances.npy'
-        resNpyFile = path.join(INCIRCUITDIR, resNpyFN)
-        numElements, numResistanceNodes = export_ras_to_npy(resRasClipPath,resNpyFile)
-
-        totMem, availMem = lu.get_mem()
-        if numResistanceNodes / availMem > 2000000:
-            lu.dashline(1)
-            lu.warn('Warning:')
-            lu.warn('Circuitscape can only solve 2-3 million nodes')
-            lu.warn('per gigabyte of available RAM. \nTotal physical RAM '
-                    'on your machine is ~' + str(totMem)
-                    + ' GB. \nAvailable memory is ~'+ str(availMem)
-                    + ' GB. \nYour resistance raster has '
-                    + str(numResistanceNodes) + ' nodes.')
-            lu.dashline(0)
-
-        coreNpyFN = 'cores.npy'
-        coreNpyFile = path.join(INCIRCUITDIR, coreNpyFN)
-        numElements, numNodes = export_ras_to_npy(s8CoreRasClipped,coreNpyFile)
-
-        arcpy.env.extent = "MINOF"
-
-        options = lu.set_cs_options()
-        options['scenario']=cfg.ALL_PAIR_SCENARIO
-        options['habitat_file'] = resNpyFile
-        options['point_file'] = coreNpyFile
-        options['set_focal_node_currents_to_zero']=True
-        outputFN = 'Circuitscape.out'
-        options['output_file'] = path.join(OUTCIRCUITDIR, outputFN)
-        options['print_timings']=True
-        configFN = 'pinchpoint_allpair_config.ini'
-        outConfigFile = path.join(CONFIGDIR, configFN)
-        lu.write_cs_cfg_file(outConfigFile, options)
-        gprint('\nResistance map has ' + str(int(numResistanceNodes)) + ' nodes.')
-        lu.dashline(1)
-        gprint('If you try to cancel your run and the Arc dialog hangs, ')
-        gprint('you can kill Circuitscape by opening Windows Task Manager')
-        gprint('and ending the cs_run.exe process.')
-        lu.dashline(0)
-
-        lu.call_circuitscape(cfg.CSPATH, outConfigFile)
-
-        if options['scenario']=='pairwise':
+        if cfg.ALL_PAIR_SCENARIO=='pairwise':
             rasterSuffix =  "_current_allPairs_" + cutoffText
 
         else:
             rasterSuffix =  "_current_allToOne_" + cutoffText
-
-        currentFN = 'Circuitscape_cum_curmap.npy'
-        currentMap = path.join(OUTCIRCUITDIR, currentFN)
         outputRaster = path.join(outputGDB, cfg.PREFIX + rasterSuffix)
-        currentRaster = path.join(cfg.SCRATCHDIR, "current")
 
-        try:
-            import_npy_to_ras(currentMap,resRasClipPath,outputRaster)
-        except Exception:
-            lu.dashline(1)
-            msg = ('ERROR: Circuitscape failed. \n'
-                  'Note: Circuitscape can only solve 2-3 million nodes'
-                  '\nper gigabyte of available RAM. The resistance '
-                  '\nraster for the last corridor had '
-                  + str(numResistanceNodes) + ' nodes.\n\nResistance '
-                  'raster values that vary by >6 orders of \nmagnitude'
-                  ' can also cause failures, as can a mismatch in '
-                  '\ncore area and resistance raster extents.')
-            arcpy.AddError(msg)
-            lu.write_log(msg)
-            exit(1)
+        arcpy.env.extent = "MINOF"
+        if cfg.CIRCUIT_IN_PROCESS:
+            calc_all_pairs(resRasClipPath, s8CoreRasClipped, outputRaster)
+        else:
+            calc_all_pairs_circuitscape(resRasClipPath, s8CoreRasClipped,
+                                        outputRaster)
 
         #set core areas to nodata
         if SETCORESTONULL:
@@ -533,6 +457,381 @@ def STEP8_calc_pinchpoints():
         lu.exit_with_python_error(_SCRIPT_NAME)
 
 
+def calc_all_pairs(resRasClipPath, coreRaster, outputRaster):
+    """Map cumulative current among all cores, solving circuits in process.
+
+    The grid circuit is factored once and shared by all core pairs (see
+    lm_circuit.raster_all_pairs). In pairwise mode effective resistances
+    between cores are written to a text file in the circuit output
+    directory.
+
+    """
+    OUTCIRCUITDIR = path.join(cfg.CIRCUITBASEDIR,
+                              cfg.CIRCUITOUTPUTDIR_NM)
+    grid = lr.grid_info(resRasClipPath)
+    win = Window(0, 0, grid.nrows, grid.ncols)
+    resistance = lr.read_window(resRasClipPath, grid, win, npy.float64)
+    cores = lr.read_window(coreRaster, grid, win)
+    gprint('\nResistance map has ' +
+           str(int((~npy.isnan(resistance)).sum())) + ' nodes.')
+    result = lc.raster_all_pairs(resistance, cores, cfg.ALL_PAIR_SCENARIO)
+    del resistance, cores
+    lr.save_array(result.current, grid, win, outputRaster)
+
+    if cfg.ALL_PAIR_SCENARIO == 'pairwise':
+        # Core ids down the first column and across the first row, as in
+        # Circuitscape's resistances file
+        resistances = npy.zeros((len(result.core_ids) + 1,) * 2)
+        resistances[0, 1:] = result.core_ids
+        resistances[1:, 0] = result.core_ids
+        resistances[1:, 1:] = result.resistances
+        npy.savetxt(path.join(OUTCIRCUITDIR, 'Circuitscape_resistances.out'),
+                    resistances, fmt='%.10g')
+
+
+def calc_all_pairs_circuitscape(resRasClipPath, coreRaster, outputRaster):
+    """Call Circuitscape to map cumulative current among all cores."""
+    INCIRCUITDIR = cfg.CIRCUITBASEDIR
+    OUTCIRCUITDIR = path.join(cfg.CIRCUITBASEDIR,
+                              cfg.CIRCUITOUTPUTDIR_NM)
+    CONFIGDIR = path.join(INCIRCUITDIR, cfg.CIRCUITCONFIGDIR_NM)
+
+    resNpyFN = 'resistances.npy'
+    resNpyFile = path.join(INCIRCUITDIR, resNpyFN)
+    numElements, numResistanceNodes = export_ras_to_npy(resRasClipPath,resNpyFile)
+
+    totMem, availMem = lu.get_mem()
+    if numResistanceNodes / availMem > 2000000:
+        lu.dashline(1)
+        lu.warn('Warning:')
+        lu.warn('Circuitscape can only solve 2-3 million nodes')
+        lu.warn('per gigabyte of available RAM. \nTotal physical RAM '
+                'on your machine is ~' + str(totMem)
+                + ' GB. \nAvailable memory is ~'+ str(availMem)
+                + ' GB. \nYour resistance raster has '
+                + str(numResistanceNodes) + ' nodes.')
+        lu.dashline(0)
+
+    coreNpyFN = 'cores.npy'
+    coreNpyFile = path.join(INCIRCUITDIR, coreNpyFN)
+    numElements, numNodes = export_ras_to_npy(coreRaster,coreNpyFile)
+
+    options = lu.set_cs_options()
+    options['scenario']=cfg.ALL_PAIR_SCENARIO
+    options['habitat_file'] = resNpyFile
+    options['point_file'] = coreNpyFile
+    options['set_focal_node_currents_to_zero']=True
+    outputFN = 'Circuitscape.out'
+    options['output_file'] = path.join(OUTCIRCUITDIR, outputFN)
+    options['print_timings']=True
+    gprint('\nResistance map has ' + str(int(numResistanceNodes)) + ' nodes.')
+    configFN = 'pinchpoint_allpair_config.ini'
+    outConfigFile = path.join(CONFIGDIR, configFN)
+    lu.write_cs_cfg_file(outConfigFile, options)
+    if cfg.CIRCUIT_BATCH:
+        manifestFile = path.join(CONFIGDIR, 'pinchpoint_allpair_batch.jsonl')
+        job = lcp.CSJob('allpairs', outConfigFile, options['output_file'],
+                        None)
+        for record in lu.solve_circuit_batch([job], manifestFile):
+            if record['error'] is not None:
+                lu.raise_error('Circuitscape failed on all-pairs pinch '
+                               'point run.')
+    else:
+        lu.dashline(1)
+        gprint('If you try to cancel your run and the Arc dialog hangs, ')
+        gprint('you can kill Circuitscape by opening Windows Task Manager')
+        gprint('and ending the cs_run.exe process.')
+        lu.dashline(0)
+
+        lu.call_circuitscape(cfg.CSPATH, outConfigFile)
+
+    currentFN = 'Circuitscape_cum_curmap.npy'
+    currentMap = path.join(OUTCIRCUITDIR, currentFN)
+    try:
+        import_npy_to_ras(currentMap,resRasClipPath,outputRaster)
+    except Exception:
+        lu.dashline(1)
+        msg = ('ERROR: Circuitscape failed. \n'
+              'Note: Circuitscape can only solve 2-3 million nodes'
+              '\nper gigabyte of available RAM. The resistance '
+              '\nraster for the last corridor had '
+              + str(numResistanceNodes) + ' nodes.\n\nResistance '
+              'raster values that vary by >6 orders of \nmagnitude'
+              ' can also cause failures, as can a mismatch in '
+              '\ncore area and resistance raster extents.')
+        arcpy.AddError(msg)
+        lu.write_log(msg)
+        exit(1)
+
+
+def save_link_job(linkId, corex, corey, resClipRasterMasked,
+                  corePairRaster, linkDir):
+    """Save a link's resistance and core arrays for solving its circuit.
+
+    Returns lm_circuit LinkJob.
+
+    """
+    grid = lr.grid_info(resClipRasterMasked)
+    win = Window(0, 0, grid.nrows, grid.ncols)
+    resistance = lr.read_window(resClipRasterMasked, grid, win, npy.float64)
+    numNodes = int((~npy.isnan(resistance)).sum())
+    resFile = path.join(linkDir, 'resistances.npy')
+    npy.save(resFile, resistance)
+    del resistance
+    coreFile = path.join(linkDir, 'cores.npy')
+    npy.save(coreFile, lr.read_window(corePairRaster, grid, win))
+    gprint('Link ID #' + str(linkId) + ' resistance map has ' +
+           str(numNodes) + ' nodes.')
+    return lc.LinkJob(linkId, corex, corey, resFile, coreFile,
+                      path.join(linkDir, 'circuit.npz'), numNodes)
+
+
+def solve_link_jobs(linkJobs):
+    """Solve link circuits, yielding (job, result) as each is done.
+
+    Circuits are solved in worker processes, admitted while their
+    estimated memory fits in half of available memory.
+
+    """
+    if cfg.CIRCUIT_PROCESSES < 2 or len(linkJobs) < 2:
+        for job in linkJobs:
+            yield job, lc.solve_link_job(job)
+        return
+    maxBytes = int(lu.get_mem_bytes()[1] * 0.5)
+    gprint('Using ' + str(cfg.CIRCUIT_PROCESSES) + ' worker processes and '
+           'up to ' + str(round(maxBytes / 1073741824.0, 1)) +
+           ' GB of memory.')
+    lu.set_worker_executable()
+    for job, result in lc.run_link_jobs(linkJobs, cfg.CIRCUIT_PROCESSES,
+                                        maxBytes, gprint):
+        yield job, result
+
+
+def save_link_results(job, grid, outputGDB):
+    """Save current (and voltage) rasters from a solved link circuit.
+
+    Returns path of the current raster.
+
+    """
+    win = Window(0, 0, grid.nrows, grid.ncols)
+    linkDir = path.dirname(job.out_file)
+    with npy.load(job.out_file) as circuit:
+        currentRaster = path.join(linkDir, "current" + tif)
+        lr.save_array(circuit['current'], grid, win, currentRaster)
+
+        if cfg.WRITE_VOLT_MAPS == True:
+            voltRaster = path.join(outputGDB, cfg.PREFIX + "_voltMap_" +
+                                   str(job.core1) + '_' + str(job.core2))
+            lr.save_array(circuit['voltage'], grid, win, voltRaster)
+            gprint('Building output statistics and pyramids '
+                   'for voltage raster\n')
+            lu.build_stats(voltRaster)
+    return currentRaster
+
+
+def finish_link(linkTable, link, currentRaster, corePairRaster,
+                effResistance, mosaicRaster, firstLink, linkDir):
+    """Add link current raster to mosaic and resistances to link table.
+
+    effResistance is in resistance units per cell. Use inf (or -1, as
+    Circuitscape reports) if the cores aren't connected.
+
+    """
+    arcpy.env.extent = currentRaster
+
+    if SETCORESTONULL:
+        # Set core areas to NoData in current map for color ramping
+        currentRaster2 = currentRaster + '2' + tif
+        outCon = (arcpy.sa.Con(arcpy.sa.IsNull(
+                  arcpy.sa.Raster(corePairRaster)),
+                  arcpy.sa.Raster(currentRaster)))
+        outCon.save(currentRaster2)
+        currentRaster = currentRaster2
+    arcpy.env.extent = "MAXOF"
+    if firstLink:
+        lu.delete_data(mosaicRaster)
+        @Retry(10)
+        def copyRas2():
+            arcpy.CopyRaster_management(currentRaster,
+                                        mosaicRaster)
+        copyRas2()
+    else:
+        @Retry(10)
+        def mosaicRas():
+            arcpy.Mosaic_management(currentRaster,
+                             mosaicRaster, "MAXIMUM", "MATCH")
+        mosaicRas()
+
+    if effResistance == npy.inf:
+        effResistance = -1
+    resistance = float(arcpy.env.cellSize) * effResistance
+    set_link_resistance(linkTable, link, resistance)
+
+    # Mark link done for restarts, keeping its resistance for the link
+    # table
+    with open(link_done_file(linkDir), 'w') as done:
+        done.write(repr(resistance))
+
+    # Clean up
+    if cfg.SAVE_TEMP_CIRCUIT_FILES == False:
+        lu.delete_data(currentRaster)
+        lu.clean_out_workspace(linkDir)
+        lu.delete_dir(linkDir)
+
+
+def set_link_resistance(linkTable, link, resistance):
+    """Set effective resistance and ratio to cwdist in link table."""
+    linkTable[link,cfg.LTB_EFFRESIST] = resistance
+
+    # Ratio
+    if not cfg.SQUARERESISTANCES:
+        linkTable[link,cfg.LTB_CWDTORR] = (linkTable[link,
+               cfg.LTB_CWDIST] / linkTable[link,cfg.LTB_EFFRESIST])
+
+
+def link_done_file(linkDir):
+    """Return path of file marking a link's current as mosaicked."""
+    return linkDir + '_done.txt'
+
+
+def set_link_cs_options(linkId, resClipRasterMasked, corePairRaster):
+    """Export a link's resistance and core arrays for Circuitscape.
+
+    Returns Circuitscape options for the link and number of resistance
+    nodes.
+
+    """
+    INCIRCUITDIR = cfg.CIRCUITBASEDIR
+    OUTCIRCUITDIR = path.join(cfg.CIRCUITBASEDIR,
+                              cfg.CIRCUITOUTPUTDIR_NM)
+
+    resNpyFN = 'resistances_link_' + linkId + '.npy'
+    resNpyFile = path.join(INCIRCUITDIR, resNpyFN)
+    numElements, numResistanceNodes = export_ras_to_npy(resClipRasterMasked,
+                                                        resNpyFile)
+
+    totMem, availMem = lu.get_mem()
+    if numResistanceNodes / availMem > 2000000:
+        lu.dashline(1)
+        lu.warn('Warning:')
+        lu.warn('Circuitscape can only solve 2-3 million nodes')
+        lu.warn('per gigabyte of available RAM. \nTotal physical RAM'
+                ' on your machine is ~' + str(totMem)
+                + ' GB. \nAvailable memory is ~'+ str(availMem)
+                + ' GB. \nYour resistance raster has '
+                + str(numResistanceNodes) + ' nodes.')
+        lu.dashline(2)
+    coreNpyFN = 'cores_link_' + linkId + '.npy'
+    coreNpyFile = path.join(INCIRCUITDIR, coreNpyFN)
+    numElements, numNodes = export_ras_to_npy(corePairRaster,
+                                              coreNpyFile)
+
+    options = lu.set_cs_options()
+    if cfg.WRITE_VOLT_MAPS == True:
+        options['write_volt_maps']=True
+    options['habitat_file'] = resNpyFile
+
+    options['point_file'] = coreNpyFile
+    options['set_focal_node_currents_to_zero']=True
+    outputFN = 'Circuitscape_link' + linkId + '.out'
+    options['output_file'] = path.join(OUTCIRCUITDIR, outputFN)
+    if numElements > 250000:
+        options['print_timings']=True
+    return options, numResistanceNodes
+
+
+def write_link_cs_config(linkId, options):
+    """Write a link's Circuitscape .ini file. Returns its path."""
+    CONFIGDIR = path.join(cfg.CIRCUITBASEDIR, cfg.CIRCUITCONFIGDIR_NM)
+    configFN = 'pinchpoint_config' + linkId + '.ini'
+    outConfigFile = path.join(CONFIGDIR, configFN)
+    lu.write_cs_cfg_file(outConfigFile, options)
+    return outConfigFile
+
+
+def calc_link_circuitscape(linkId, corex, corey, resClipRasterMasked,
+                           corePairRaster, linkDir, outputGDB):
+    """Call Circuitscape to pass current between a link's cores.
+
+    Returns path of the current raster and the effective resistance in
+    resistance units per cell.
+
+    """
+    # Set circuitscape options and call
+    options, numResistanceNodes = set_link_cs_options(
+        linkId, resClipRasterMasked, corePairRaster)
+    outConfigFile = write_link_cs_config(linkId, options)
+    gprint('Processing link ID #' + str(linkId) + '. Resistance map'
+            ' has ' + str(int(numResistanceNodes)) + ' nodes.')
+
+    memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
+
+    currentMap = lcp.result_file(options['output_file'], '_cum_curmap.npy')
+
+    if not arcpy.Exists(currentMap):
+        print_failure(numResistanceNodes, memFlag, 10)
+        numElements, numNodes = export_ras_to_npy(
+                                    resClipRasterMasked,
+                                    options['habitat_file'])
+        memFlag = lu.call_circuitscape(cfg.CSPATH, outConfigFile)
+
+    if not arcpy.Exists(currentMap):
+        msg = ('\nCircuitscape failed. See error information above.')
+        arcpy.AddError(msg)
+        lu.write_log(msg)
+        exit(1)
+
+    return import_link_cs_results(options, corex, corey, corePairRaster,
+                                  linkDir, outputGDB)
+
+
+def import_link_cs_results(options, corex, corey, corePairRaster, linkDir,
+                           outputGDB):
+    """Import current (and voltage) maps written for a link's circuit.
+
+    Returns path of the current raster and the effective resistance in
+    resistance units per cell.
+
+    """
+    outputFile = options['output_file']
+    currentMap = lcp.result_file(outputFile, '_cum_curmap.npy')
+
+    # Either set core areas to nodata in current map or
+    # divide each by its radius
+    currentRaster = path.join(linkDir, "current" + tif)
+    import_npy_to_ras(currentMap,corePairRaster,currentRaster)
+
+    if cfg.WRITE_VOLT_MAPS == True:
+        voltMap = lcp.result_file(outputFile, '_voltmap_' + str(corex) +
+                                  '_' + str(corey) + '.npy')
+        voltRaster = path.join(outputGDB,
+                 cfg.PREFIX + "_voltMap_"+ str(corex) + '_'+str(corey))
+        import_npy_to_ras(voltMap,corePairRaster,voltRaster)
+        gprint('Building output statistics and pyramids '
+                       'for voltage raster\n')
+        lu.build_stats(voltRaster)
+
+    resistancesFile = lcp.result_file(outputFile,
+                                      '_resistances_3columns.out')
+    resistances = npy.loadtxt(resistancesFile,
+                              dtype=npy.float64, comments='#')
+
+    # Clean up
+    if cfg.SAVE_TEMP_CIRCUIT_FILES == False:
+        coreNpyFile = options['point_file']
+        resNpyFile = options['habitat_file']
+        lu.delete_file(coreNpyFile)
+        coreNpyBase, extension = path.splitext(coreNpyFile)
+        lu.delete_data(coreNpyBase + '.hdr')
+        lu.delete_file(resNpyFile)
+        resNpyBase, extension = path.splitext(resNpyFile)
+        lu.delete_data(resNpyBase + '.hdr')
+        lu.delete_file(currentMap)
+        curMapBase, extension = path.splitext(currentMap)
+        lu.delete_data(curMapBase + '.hdr')
+    return currentRaster, resistances[2]
+
+
 @Retry(10)
 def export_ras_to_npy(raster,npyFile):
     descData=arcpy.Describe(raster)
@@ -0,0 +1,39 @@
+"""Put the toolbox scripts on the path for tests."""
+
+import sys
+import types
+from os import path
+
+import pytest
+
+SCRIPTS_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture
+def arcpy_stubs(monkeypatch):
+    """Stand in empty arcpy, lm_util and lm_config modules for imports.
+
+    Tool modules can then be imported to test code that doesn't call
+    arcpy, with tests adding the few functions they need to the stubs.
+    Modules imported while the stubs are in place are dropped afterwards.
+    Returns namespace of the stubs, with lm_util.gprint appending to
+    messages and the config (lm_config.tool_env) an empty namespace.
+    """
+    messages = []
+    arcpy = types.ModuleType('arcpy')
+    arcpy.sa = types.ModuleType('arcpy.sa')
+    # Called when some tool modules are imported
+    arcpy.CheckOutExtension = lambda extension: 'CheckedOut'
+    lm_util = types.ModuleType('lm_util')
+    lm_util.gprint = messages.append
+    lm_config = types.ModuleType('lm_config')
+    lm_config.tool_env = types.SimpleNamespace()
+    for module in (arcpy, arcpy.sa, lm_util, lm_config):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    before = set(sys.modules)
+    yield types.SimpleNamespace(arcpy=arcpy, lm_util=lm_util,
+                                cfg=lm_config.tool_env, messages=messages)
+    for name in set(sys.modules) - before:
+        del sys.modules[name]
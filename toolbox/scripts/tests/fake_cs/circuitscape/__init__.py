@@ -0,0 +1,13 @@
+"""Fake circuitscape package exposing Compute, for batch session tests."""
+
+import fake_circuitscape
+
+
+class Compute(object):
+    """Stand-in for circuitscape.Compute."""
+
+    def __init__(self, config_file, logger):
+        self.config_file = config_file
+
+    def compute(self):
+        fake_circuitscape.run(self.config_file)
@@ -0,0 +1,65 @@
+"""Circuitscape stand-in for tests.
+
+Run as a script on a Circuitscape .ini file, or through the fake
+circuitscape package's Compute. Prints progress and timing lines like
+Circuitscape, then writes a cumulative current map and three column
+resistances file named from output_file. A [Fake] section of the .ini
+controls it:
+
+    delay -- seconds to sleep before finishing
+    fail -- 'memory' or 'error' to print a traceback instead of results
+    exit_code -- exit code when failing
+    pid_file -- file to write the process id to on start
+
+"""
+
+import os
+import sys
+import time
+from configparser import RawConfigParser
+
+import numpy as npy
+
+
+class FakeError(Exception):
+    """Failure raised when run through Compute."""
+
+
+def run(config_file, as_script=False):
+    """Do a fake Circuitscape run on config_file."""
+    config = RawConfigParser()
+    config.read(config_file)
+    output_file = config.get('Output options', 'output_file')
+
+    def fake(option, default):
+        if config.has_option('Fake', option):
+            return config.get('Fake', option)
+        return default
+
+    pid_file = fake('pid_file', None)
+    if pid_file:
+        with open(pid_file, 'w') as pid_out:
+            pid_out.write(str(os.getpid()))
+    print('--- Processing ' + os.path.basename(config_file))
+    print('Reading maps 0:00:01.5 (hr:min:sec)')
+    sys.stdout.flush()
+    time.sleep(float(fake('delay', 0)))
+
+    fail = fake('fail', None)
+    if fail:
+        message = 'MemoryError: out of memory' if fail == 'memory' else \
+            'ValueError: bad input'
+        if not as_script:
+            raise FakeError(message)
+        print('Traceback (most recent call last):')
+        print(message)
+        sys.exit(int(fake('exit_code', 1)))
+
+    base = os.path.splitext(output_file)[0]
+    npy.save(base + '_cum_curmap.npy', npy.arange(9.0).reshape(3, 3))
+    npy.savetxt(base + '_resistances_3columns.out', [[1, 2, 3.5]])
+    print('Completed in 2.5 sec')
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], True)
@@ -0,0 +1,94 @@
+"""Fake GRASS module run by the grass.script stand-in.
+
+Run as
+
+    python fake_grass_cmd.py module option=value ...
+
+with GISRC in the environment naming the mapset to work in. Rasters are
+text files of a single value in the mapset's fake folder. The modules
+cc_grass_cwd runs for a core pass its number from the r.reclass rules
+through to the exported rasters, so mixed up mapsets show in the output.
+
+A command fails if another one is running in its mapset at the time. Each
+command appends "module mapset start end" to fake_grass.log in GISDBASE.
+r.walk sleeps for the seconds given for its core in FAKE_GRASS_DELAYS,
+e.g. "1:0.5,2:0".
+
+"""
+
+import os
+import re
+import sys
+import time
+
+
+def read_gisrc():
+    with open(os.environ['GISRC']) as rc_file:
+        return dict(line.strip().split(': ', 1) for line in rc_file
+                    if ': ' in line)
+
+
+def main(module, args):
+    start_time = time.time()
+    options = dict(arg.split('=', 1) for arg in args)
+    gisrc = read_gisrc()
+    map_dir = os.path.join(gisrc['GISDBASE'], gisrc['LOCATION_NAME'],
+                           gisrc['MAPSET'], 'fake')
+    if not os.path.isdir(map_dir):
+        os.makedirs(map_dir)
+    busy = os.path.join(map_dir, 'busy')
+    try:
+        os.close(os.open(busy, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        sys.stderr.write('ERROR: mapset ' + gisrc['MAPSET'] + ' in use\n')
+        sys.exit(1)
+
+    def read_map(name):
+        map_file = os.path.join(map_dir, name)
+        if not os.path.exists(map_file):
+            return None
+        with open(map_file) as map_in:
+            return map_in.read()
+
+    def write_map(name, value):
+        with open(os.path.join(map_dir, name), 'w') as map_out:
+            map_out.write(value)
+
+    try:
+        if module == 'r.reclass':
+            value = read_map(options['input'])
+            if value is None:
+                # Source core area, numbered by the left of the first rule
+                value = sys.stdin.read().split('=')[0]
+            else:
+                sys.stdin.read()
+            write_map(options['output'], value)
+        elif module == 'r.to.vect':
+            write_map(options['output'], read_map(options['input']))
+        elif module == 'r.walk':
+            value = read_map(options['start_points'])
+            delays = dict(delay.split(':') for delay in os.environ.get(
+                'FAKE_GRASS_DELAYS', '').split(',') if delay)
+            time.sleep(float(delays.get(value, 0)))
+            write_map(options['output'], value)
+            write_map(options['outdir'], value)
+        elif module == 'r.mapcalc':
+            output, expression = options['expression'].split('=', 1)
+            values = [read_map(name)
+                      for name in re.findall(r'\w+', expression)]
+            write_map(output.strip(),
+                      [value for value in values if value is not None][0])
+        elif module == 'r.out.gdal':
+            with open(options['output'], 'w') as out_file:
+                out_file.write(read_map(options['input']))
+    finally:
+        os.remove(busy)
+
+    with open(os.path.join(gisrc['GISDBASE'], 'fake_grass.log'),
+              'a') as log:
+        log.write(' '.join([module, gisrc['MAPSET'], str(start_time),
+                            str(time.time())]) + '\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2:])
@@ -0,0 +1 @@
+"""Fake GRASS GIS package for tests of cc_grass_cwd."""
@@ -0,0 +1,30 @@
+"""Stand-in for grass.script running fake_grass_cmd.py for each module."""
+
+import os
+import subprocess
+import sys
+
+PIPE = subprocess.PIPE
+
+FAKE_CMD = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'fake_grass_cmd.py')
+
+_POPEN_ARGS = ('stdin', 'stdout', 'stderr', 'env', 'startupinfo')
+
+
+class ScriptError(Exception):
+    pass
+
+
+def start_command(prog, flags="", overwrite=False, **kwargs):
+    """Start fake GRASS module prog. Returns Popen object."""
+    popen_args = dict((arg, kwargs.pop(arg)) for arg in _POPEN_ARGS
+                      if arg in kwargs)
+    popen_args.pop('startupinfo', None)
+    args = [sys.executable, FAKE_CMD, prog]
+    args.extend(key + '=' + str(value) for key, value in kwargs.items())
+    return subprocess.Popen(args, **popen_args)
+
+
+def create_location(gisdbase, location, filename=None):
+    os.makedirs(os.path.join(gisdbase, location, 'PERMANENT'))
@@ -0,0 +1,5 @@
+"""Stand-in for grass.script.setup."""
+
+
+def init(gisbase, gisdbase, location, mapset):
+    pass
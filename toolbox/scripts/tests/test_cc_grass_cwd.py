@@ -0,0 +1,132 @@
+"""Tests of cc_grass_cwd's GRASS workers run on a fake GRASS package."""
+
+import importlib
+import os
+import shutil
+import types
+
+import pytest
+
+from cc_config import cc_env
+
+FAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_grass')
+
+
+@pytest.fixture
+def grass_run(tmp_path, monkeypatch, arcpy_stubs):
+    """Import cc_grass_cwd with fake GRASS and stub arcpy and lm_util.
+
+    Returns namespace of the module, the worker environments' gisdbase,
+    messages printed and (source, output) of rasters copied.
+    """
+    copies = []
+
+    def copy_raster(source, output):
+        shutil.copy(source, output)
+        copies.append((source, output))
+
+    arcpy = arcpy_stubs.arcpy
+    arcpy.Describe = lambda dataset: types.SimpleNamespace(
+        spatialReference=None)
+    arcpy.CopyRaster_management = copy_raster
+    arcpy.DefineProjection_management = lambda dataset, spatial_ref: None
+    cwd_dir = tmp_path / 'cwds'
+    cwd_dir.mkdir()
+    lm_util = arcpy_stubs.lm_util
+    lm_util.get_cwd_path = lambda core: str(cwd_dir / ('cwd_' + str(core)))
+    lm_util.delete_data = os.remove
+    monkeypatch.syspath_prepend(FAKE_DIR)
+    cc_grass_cwd = importlib.import_module('cc_grass_cwd')
+    monkeypatch.setattr(cc_grass_cwd, 'hideprocess', lambda: None)
+
+    scratch_dir = tmp_path / 'scratch'
+    scratch_dir.mkdir()
+    for name, value in (('scratch_dir', str(scratch_dir)),
+                        ('climate_cost', 1000.0),
+                        ('prj_core_rast', 'cores'),
+                        ('grass_exchange', 'GTiff')):
+        monkeypatch.setattr(cc_env, name, value, raising=False)
+
+    gisdbase = str(tmp_path / 'grass')
+    location_dir = os.path.join(gisdbase, cc_grass_cwd.LOCATION)
+    os.makedirs(os.path.join(location_dir, 'PERMANENT'))
+    with open(os.path.join(location_dir, 'PERMANENT', 'WIND'), 'w') as wind:
+        wind.write('rows: 10\n')
+    return types.SimpleNamespace(module=cc_grass_cwd, gisdbase=gisdbase,
+                                 messages=arcpy_stubs.messages, copies=copies)
+
+
+def run_cores(grass_run, core_list, workers, delays, monkeypatch):
+    """Run gen_cwd_back, with r.walk taking delays seconds by core."""
+    monkeypatch.setenv('FAKE_GRASS_DELAYS', ','.join(
+        str(core) + ':' + str(delay) for core, delay in delays.items()))
+    envs = grass_run.module.make_worker_envs(grass_run.gisdbase, workers)
+    grass_run.module.gen_cwd_back(core_list, 'climate', 'resist', 'cores',
+                                  envs)
+
+
+def read_log(gisdbase):
+    with open(os.path.join(gisdbase, 'fake_grass.log')) as log:
+        return [(module, mapset, float(start), float(end))
+                for module, mapset, start, end in
+                (line.split() for line in log)]
+
+
+def test_workers_run_in_own_mapsets(grass_run, monkeypatch):
+    core_list = [1, 2, 3, 4, 5]
+    run_cores(grass_run, core_list, 2,
+              dict((core, 0.4) for core in core_list), monkeypatch)
+
+    log = read_log(grass_run.gisdbase)
+    walks = [entry for entry in log if entry[0] == 'r.walk']
+    assert len(walks) == len(core_list)
+    assert set(entry[1] for entry in log) == {'worker1', 'worker2'}
+    # Walks overlapped, but never in the same mapset
+    assert any(walk1[2] < walk2[3] and walk2[2] < walk1[3]
+               for walk1 in walks for walk2 in walks if walk1 != walk2)
+    for mapset in ('worker1', 'worker2'):
+        runs = sorted(entry[2:] for entry in log if entry[1] == mapset)
+        assert all(end <= next_start for (start, end), (next_start, _) in
+                   zip(runs, runs[1:]))
+
+    # Each core's rasters come from its own run
+    for core in core_list:
+        for rtype in ('cwd_', 'back_'):
+            with open(os.path.join(os.path.dirname(
+                    grass_run.copies[0][1]), rtype + str(core))) as grid:
+                assert grid.read() == str(core)
+
+
+def test_shared_mapset_is_detected(grass_run, monkeypatch):
+    # Negative control: the stand-in fails walks sharing a mapset
+    monkeypatch.setenv('FAKE_GRASS_DELAYS', '1:0.5,2:0.5')
+    env = grass_run.module.make_worker_envs(grass_run.gisdbase, 1)[0]
+    with pytest.raises(Exception, match='in use'):
+        grass_run.module.gen_cwd_back([1, 2], 'climate', 'resist', 'cores',
+                                      [env, env])
+
+
+def test_results_collected_in_completion_order(grass_run, monkeypatch):
+    run_cores(grass_run, [1, 2, 3], 3, {1: 1.2, 2: 0.6, 3: 0}, monkeypatch)
+    copied = [os.path.basename(output) for source, output in grass_run.copies]
+    assert copied == ['cwd_3', 'back_3', 'cwd_2', 'back_2', 'cwd_1',
+                      'back_1']
+    done = [message for message in grass_run.messages
+            if message.startswith('Generated')]
+    assert done == ['Generated CWD and back rasters for Core 3 (1/3)',
+                    'Generated CWD and back rasters for Core 2 (2/3)',
+                    'Generated CWD and back rasters for Core 1 (3/3)']
+    # Exported GeoTIFFs are removed once copied
+    assert not os.listdir(cc_env.scratch_dir)
+
+
+def test_walk_workers_capped_by_memory(grass_run):
+    walk_workers = grass_run.module.walk_workers
+    gb = 1073741824
+    # 1000 x 1000 cells use 40 MB plus 100 MB a worker
+    assert walk_workers(7, 1000000, 64 * gb) == 7
+    assert walk_workers(7, 1000000, 1 * gb) == 3
+    # The segment cache caps memory on large regions
+    assert walk_workers(16, 10 ** 9, 8 * gb) == 10
+    assert walk_workers(4, 10 ** 9, 0) == 1
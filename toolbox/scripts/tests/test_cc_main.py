@@ -0,0 +1,42 @@
+"""Tests of Climate Linkage Mapper's climate filter on core pairs."""
+
+import importlib
+from itertools import combinations
+import sys
+import types
+
+import numpy as npy
+import pytest
+
+
+@pytest.fixture
+def cc_main(arcpy_stubs, monkeypatch):
+    """Import cc_main with stub arcpy and arcinfo."""
+    monkeypatch.setitem(sys.modules, 'arcinfo', types.ModuleType('arcinfo'))
+    return importlib.import_module('cc_main')
+
+
+def brute_force(core_ids, umin2std, threshold):
+    """Return pairs differing by over threshold, or with a NaN core."""
+    return [[core1, core2] for (core1, value1), (core2, value2) in
+            combinations(zip(core_ids.tolist(), umin2std), 2)
+            if npy.isnan(value1) or npy.isnan(value2) or
+            abs(value1 - value2) > threshold]
+
+
+@pytest.mark.parametrize('threshold', [0.0, 1.0, 2.5, 100.0])
+def test_sweep_matches_all_pairs(cc_main, threshold):
+    random = npy.random.RandomState(1)
+    core_ids = npy.unique(random.choice(500, 40, replace=False)) + 1
+    # Whole values, so some differences equal the threshold exactly
+    umin2std = random.randint(0, 12, len(core_ids)).astype(npy.float64)
+    umin2std[[0, 7, 8, 30]] = npy.nan
+    pairs = cc_main.limit_cores(core_ids, umin2std, threshold)
+    assert pairs.tolist() == brute_force(core_ids, umin2std, threshold)
+
+
+def test_sweep_without_climate_values(cc_main):
+    core_ids = npy.array([3, 5, 9])
+    pairs = cc_main.limit_cores(core_ids, npy.full(3, npy.nan), 1.0)
+    assert pairs.tolist() == [[3, 5], [3, 9], [5, 9]]
+    assert cc_main.limit_cores(core_ids, npy.zeros(3), 1.0).shape[0] == 0
@@ -0,0 +1,72 @@
+"""Tests of cc_near core distances against brute force."""
+
+import numpy as npy
+import pytest
+
+import cc_near as cn
+
+
+def star_polygon(center, radii, turn=0.0):
+    """Return ring of a star-shaped polygon around center."""
+    angles = turn + npy.linspace(0, 2 * npy.pi, len(radii), endpoint=False)
+    return npy.column_stack((center[0] + radii * npy.cos(angles),
+                             center[1] + radii * npy.sin(angles)))
+
+
+def point_segment(point, start, end):
+    """Return distance from point to segment start-end."""
+    seg = end - start
+    length2 = seg.dot(seg)
+    frac = 0.0 if length2 == 0 else min(max(
+        (point - start).dot(seg) / length2, 0.0), 1.0)
+    return npy.hypot(*(point - (start + frac * seg)))
+
+
+def brute_force(rings1, rings2):
+    """Return least distance from any vertex to any segment of the other."""
+    dist = npy.inf
+    for rings, others in ((rings1, rings2), (rings2, rings1)):
+        for ring in rings:
+            for point in ring:
+                for other in others:
+                    for start, end in zip(other, npy.roll(other, -1, axis=0)):
+                        dist = min(dist, point_segment(point, start, end))
+    return dist
+
+
+def test_distances_match_brute_force():
+    random = npy.random.RandomState(3)
+    for _ in range(40):
+        rings = [[star_polygon(random.uniform(0, 40, 2),
+                               random.uniform(2, 10, random.randint(3, 40)),
+                               random.uniform(0, 1))]
+                 for _ in range(2)]
+        boundaries = [cn.core_boundary(core_rings) for core_rings in rings]
+        dist = cn.core_distance(*boundaries)
+        if cn.boundaries_meet(*boundaries):
+            assert dist == 0
+        else:
+            assert dist == pytest.approx(brute_force(*rings))
+        assert cn.core_distance(*boundaries[::-1]) == pytest.approx(dist)
+
+
+def test_touching_and_nested_cores():
+    square = npy.array([[0, 0], [4, 0], [4, 4], [0, 4]], dtype=float)
+    inner = cn.core_boundary([square / 2 + 2])
+    outer = cn.core_boundary([square * 3 - 4])
+    # Core with a hole holding the inner core
+    ring_core = cn.core_boundary([square * 3 - 4, square + 1])
+    touching = cn.core_boundary([square + [4, 2]])
+    base = cn.core_boundary([square])
+    assert cn.core_distance(inner, outer) == 0
+    assert cn.core_distance(base, touching) == 0
+    assert cn.core_distance(inner, ring_core) == pytest.approx(1.0)
+
+
+def test_pair_distances_limited_by_max_dist():
+    square = npy.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float)
+    boundaries = dict((core, cn.core_boundary([square + [3 * core, 0]]))
+                      for core in (1, 2, 4))
+    dists = cn.pair_distances(boundaries, npy.array([1, 1, 2, 3]),
+                              npy.array([2, 4, 4, 1]), max_dist=5.0)
+    npy.testing.assert_allclose(dists, [2.0, npy.inf, 5.0, npy.inf])
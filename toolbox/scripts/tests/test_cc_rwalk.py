@@ -0,0 +1,101 @@
+"""Tests of cc_rwalk cost-weighted distances against a heap Dijkstra."""
+
+import heapq
+
+import numpy as npy
+import pytest
+
+import cc_rwalk as cr
+
+NAN = npy.nan
+CELL_SIZE = 100.0
+
+
+def move_cost(elevation, friction, cell, neighbor, walk_coeff=cr.WALK_COEFF,
+              slope_factor=cr.SLOPE_FACTOR):
+    """Return r.walk cost of moving from cell to neighbor."""
+    a, b, c, d = walk_coeff
+    dist = CELL_SIZE * npy.hypot(neighbor[0] - cell[0], neighbor[1] - cell[1])
+    dh = elevation[neighbor] - elevation[cell]
+    if dh >= 0:
+        coeff = b
+    elif dh / dist < slope_factor:
+        coeff = d
+    else:
+        coeff = c
+    return max(0.0, a * dist + coeff * dh +
+               dist * (friction[cell] + friction[neighbor]) / 2)
+
+
+def heap_dijkstra(elevation, friction, sources):
+    """Return least cost to each cell from sources, NaN if unreached."""
+    nrows, ncols = elevation.shape
+    valid = ~npy.isnan(elevation) & ~npy.isnan(friction)
+    cwd = npy.full(elevation.shape, npy.inf)
+    heap = []
+    for cell in zip(*npy.nonzero(sources & valid)):
+        cwd[cell] = 0
+        heap.append((0.0, cell))
+    heapq.heapify(heap)
+    while heap:
+        cost, cell = heapq.heappop(heap)
+        if cost > cwd[cell]:
+            continue
+        for row_off, col_off in cr.BACK_OFFSETS:
+            neighbor = (cell[0] + row_off, cell[1] + col_off)
+            if (not (0 <= neighbor[0] < nrows and 0 <= neighbor[1] < ncols)
+                    or not valid[neighbor]):
+                continue
+            new_cost = cost + move_cost(elevation, friction, cell, neighbor)
+            if new_cost < cwd[neighbor]:
+                cwd[neighbor] = new_cost
+                heapq.heappush(heap, (new_cost, neighbor))
+    cwd[npy.isinf(cwd)] = NAN
+    return cwd
+
+
+@pytest.fixture
+def surfaces():
+    """Return random climate and friction surfaces with NoData cells."""
+    random = npy.random.RandomState(5)
+    elevation = random.uniform(0, 40, (12, 15))
+    friction = random.uniform(0, 3, (12, 15))
+    elevation[4, 2:14] = NAN  # Wall with gaps at either end
+    friction[8:, 9] = NAN
+    friction[0, 0] = NAN
+    # Cell walled off by NoData
+    elevation[9:12, 0:3] = NAN
+    elevation[10, 0] = 5.0
+    return elevation, friction
+
+
+def test_cwd_matches_heap_dijkstra(surfaces):
+    elevation, friction = surfaces
+    sources = npy.zeros(elevation.shape, dtype=bool)
+    sources[0:2, 12:14] = True
+    sources[11, 4] = True
+    sources[0, 0] = True  # NoData, so not a source
+    walk = cr.walk_graph(elevation, friction, CELL_SIZE)
+    cwd, back = cr.cwd_back(walk, sources)
+    expected = heap_dijkstra(elevation, friction, sources)
+    npy.testing.assert_allclose(cwd, expected, rtol=1e-10)
+    assert npy.isnan(cwd[10, 0]) and npy.isnan(cwd[0, 0])
+
+    # Following a cell's back direction leads one move nearer a source
+    assert (back[sources & ~npy.isnan(cwd)] == 0).all()
+    for cell in zip(*npy.nonzero(~npy.isnan(cwd) & ~sources)):
+        code = int(back[cell])
+        assert 1 <= code <= 8
+        row_off, col_off = cr.BACK_OFFSETS[code - 1]
+        previous = (cell[0] + row_off, cell[1] + col_off)
+        assert cwd[cell] == pytest.approx(
+            cwd[previous] + move_cost(elevation, friction, previous, cell))
+    npy.testing.assert_array_equal(npy.isnan(back), npy.isnan(cwd))
+
+
+def test_no_valid_sources(surfaces):
+    elevation, friction = surfaces
+    walk = cr.walk_graph(elevation, friction, CELL_SIZE)
+    sources = npy.isnan(elevation)
+    cwd, back = cr.cwd_back(walk, sources)
+    assert npy.isnan(cwd).all() and npy.isnan(back).all()
@@ -0,0 +1,324 @@
+"""Tests of lm_circuit solvers against dense solves, and of updates."""
+
+from itertools import combinations
+import os
+
+import numpy as npy
+import pytest
+
+import lm_circuit as lc
+
+NAN = npy.nan
+
+# Two components: a ring of cores 1 to 6 with a chord, and cores 10 to 12
+CORE1 = [1, 2, 3, 4, 5, 6, 1, 10, 11]
+CORE2 = [2, 3, 4, 5, 6, 1, 4, 11, 12]
+CWDIST = [2.0, 3.0, 1.5, 4.0, 2.5, 1.0, 5.0, 2.0, 3.0]
+COMPONENTS = [[1, 2, 3, 4, 5, 6], [10, 11, 12]]
+
+# Resistance grid with NoData cells, and cores 1 to 3 joined through it.
+# Core 4 is cut off by NoData.
+RESISTANCE = npy.array([
+    [1.0, 2.0, 3.0, 1.0, 4.0, NAN, 2.0],
+    [2.0, 5.0, NAN, 2.0, 1.0, NAN, NAN],
+    [3.0, 1.0, NAN, 6.0, 2.0, 3.0, 1.0],
+    [1.0, 4.0, 2.0, 1.0, NAN, 2.0, 5.0],
+    [2.0, 1.0, 3.0, 2.0, 1.0, 4.0, 2.0],
+])
+CORES = npy.array([
+    [1, 1, 0, 0, 0, 0, 4],
+    [1, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 2],
+    [0, 0, 0, 0, 0, 0, 2],
+    [3, 0, 0, 0, 0, 0, 0],
+], dtype=npy.float64)
+
+
+def assert_matches_full_solve(network):
+    links = network.conductance > 0
+    full = lc.NetworkCircuit(network.nodes[network.ends[links, 0]],
+                             network.nodes[network.ends[links, 1]],
+                             1.0 / network.conductance[links])
+    npy.testing.assert_allclose(network.branch_currents()[links],
+                                full.branch_currents(), atol=1e-10)
+    in_full = npy.isin(network.nodes, full.nodes)
+    npy.testing.assert_allclose(network.node_currents()[in_full],
+                                full.node_currents(), atol=1e-10)
+
+
+def test_inverse_found_again_after_max_updates():
+    network = lc.NetworkCircuit(CORE1, CORE2, CWDIST)
+    ring = network.labels[network.ends[0, 0]]
+    for update in range(lc.MAX_UPDATES):
+        network.change_links([update % 6], [10.0 + update])
+        assert network.updates[ring] == update + 1
+    assert_matches_full_solve(network)
+
+    network.change_links([2], [7.0])
+    assert network.updates[ring] == 0
+    assert network.updates[1 - ring] == 0
+    assert_matches_full_solve(network)
+    network.change_links([2], [8.0])
+    assert network.updates[ring] == 1
+
+
+def test_update_count_saved(tmp_path):
+    network = lc.NetworkCircuit(CORE1, CORE2, CWDIST)
+    network.change_links([7], [4.0])
+    network.change_links([8], [4.0])
+    state_file = str(tmp_path / 'centrality_state.npz')
+    network.save(state_file)
+
+    loaded = lc.NetworkCircuit.load(state_file)
+    npy.testing.assert_array_equal(loaded.updates, network.updates)
+    assert sorted(loaded.updates) == [0, 2]
+    edges = loaded.update_links(CORE1, CORE2, CWDIST[:-1] + [6.0])[0]
+    npy.testing.assert_array_equal(edges, npy.arange(len(CORE1)))
+    assert sorted(loaded.updates) == [0, 3]
+    assert_matches_full_solve(loaded)
+
+
+def test_splitting_component_resets_updates():
+    network = lc.NetworkCircuit(CORE1, CORE2, CWDIST)
+    network.change_links([0], [1.0])
+    # Dropping the link 11-12 cuts core 12 off
+    network.change_links([8], [npy.inf])
+    assert len(network.components) == 3
+    npy.testing.assert_array_equal(network.updates, [0, 0, 0])
+    assert_matches_full_solve(network)
+
+
+def test_update_returns_current_changes():
+    network = lc.NetworkCircuit(CORE1, CORE2, CWDIST)
+    old_branch = network.branch_currents()
+    old_node = network.node_currents()
+    # Drop the chord 1-4, change 2-3 and add 2-5
+    core1 = CORE1[:6] + CORE1[7:] + [2]
+    core2 = CORE2[:6] + CORE2[7:] + [5]
+    cwdist = [2.0, 6.0] + CWDIST[2:6] + CWDIST[7:] + [3.5]
+    edges, node_delta, branch_delta = network.update_links(
+        core1, core2, cwdist, max_changes=3)
+    full = lc.NetworkCircuit(core1, core2, cwdist)
+    npy.testing.assert_allclose(old_node + node_delta, full.node_currents(),
+                                atol=1e-10)
+    new_branch = npy.append(old_branch, 0.0) + branch_delta
+    npy.testing.assert_allclose(new_branch[edges], full.branch_currents(),
+                                atol=1e-10)
+    assert new_branch[6] == 0 and branch_delta[6] == -old_branch[6]
+
+
+def grid_connections(resistance):
+    """Return (cell1, cell2, conductance) of 8-neighbor grid connections."""
+    nrows, ncols = resistance.shape
+    connections = []
+    for row in range(nrows):
+        for col in range(ncols):
+            for row_off, col_off in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                row2, col2 = row + row_off, col + col_off
+                if row2 >= nrows or not 0 <= col2 < ncols:
+                    continue
+                res1, res2 = resistance[row, col], resistance[row2, col2]
+                if npy.isnan(res1) or npy.isnan(res2):
+                    continue
+                dist = npy.hypot(row_off, col_off)
+                connections.append((row * ncols + col, row2 * ncols + col2,
+                                    2.0 / (dist * (res1 + res2))))
+    return connections
+
+
+def dense_laplacian(connections, node_of_cell, num_nodes):
+    matrix = npy.zeros((num_nodes, num_nodes))
+    for cell1, cell2, cond in connections:
+        node1, node2 = node_of_cell[cell1], node_of_cell[cell2]
+        if node1 != node2:
+            matrix[[node1, node2], [node2, node1]] -= cond
+            matrix[[node1, node2], [node1, node2]] += cond
+    return matrix
+
+
+def shorted_nodes(terminals, valid):
+    """Number nodes with cells of terminal t (0 to n - 1) merged as node t.
+
+    Other valid cells are numbered from n, and NoData cells -1.
+    """
+    terminals = terminals.ravel()
+    num_terminals = terminals.max() + 1
+    node_of_cell = terminals.copy()
+    others = npy.flatnonzero((terminals < 0) & valid.ravel())
+    node_of_cell[others] = num_terminals + npy.arange(len(others))
+    return node_of_cell, num_terminals + len(others)
+
+
+def dense_cell_currents(connections, node_voltage, node_of_cell, shape):
+    """Return half the current on each cell's connections."""
+    current = npy.zeros(shape[0] * shape[1])
+    for cell1, cell2, cond in connections:
+        branch = abs(cond * (node_voltage[node_of_cell[cell1]] -
+                             node_voltage[node_of_cell[cell2]]))
+        current[[cell1, cell2]] += branch / 2.0
+    return current.reshape(shape)
+
+
+def test_network_centrality_matches_pseudoinverse():
+    nodes, node_current, branch = lc.network_centrality(CORE1, CORE2,
+                                                        CWDIST)
+    npy.testing.assert_array_equal(nodes, sorted(set(CORE1 + CORE2)))
+    ends = npy.searchsorted(nodes, npy.column_stack((CORE1, CORE2)))
+    cond = 1.0 / npy.array(CWDIST)
+    matrix = npy.zeros((len(nodes), len(nodes)))
+    for (node1, node2), link_cond in zip(ends, cond):
+        matrix[[node1, node2], [node2, node1]] -= link_cond
+        matrix[[node1, node2], [node1, node2]] += link_cond
+    inverse = npy.linalg.pinv(matrix)
+
+    expected_branch = npy.zeros(len(CWDIST))
+    expected_node = npy.zeros(len(nodes))
+    for component in COMPONENTS:
+        for core1, core2 in combinations(npy.searchsorted(nodes, component),
+                                         2):
+            source = npy.zeros(len(nodes))
+            source[[core1, core2]] = [1, -1]
+            voltage = inverse.dot(source)
+            pair_branch = npy.abs(cond * (voltage[ends[:, 0]] -
+                                          voltage[ends[:, 1]]))
+            expected_branch += pair_branch
+            # Current through a core is half that on its links, or 1 A for
+            # the pair's own cores
+            pair_node = (npy.bincount(ends[:, 0], pair_branch, len(nodes)) +
+                         npy.bincount(ends[:, 1], pair_branch,
+                                      len(nodes))) / 2.0
+            pair_node[[core1, core2]] = 1
+            expected_node += pair_node
+    npy.testing.assert_allclose(branch, expected_branch, atol=1e-10)
+    npy.testing.assert_allclose(node_current, expected_node, atol=1e-10)
+
+
+def test_raster_pair_current_matches_dense_solve():
+    # Without the cut off cell of core 4, so the dense system is not singular
+    resistance = npy.where(CORES == 4, NAN, RESISTANCE)
+    result = lc.raster_pair_current(resistance, CORES == 1, CORES == 2)
+    valid = ~npy.isnan(resistance)
+    terminals = npy.where(CORES == 1, 0, npy.where(CORES == 2, 1, -1))
+    node_of_cell, num_nodes = shorted_nodes(terminals, valid)
+    connections = grid_connections(resistance)
+    matrix = dense_laplacian(connections, node_of_cell, num_nodes)
+    # Ground terminal 2 (node 1) and pass 1 A in at terminal 1 (node 0)
+    keep = npy.arange(num_nodes) != 1
+    node_voltage = npy.zeros(num_nodes)
+    node_voltage[keep] = npy.linalg.solve(matrix[npy.ix_(keep, keep)],
+                                          npy.eye(num_nodes)[keep, 0])
+    assert result.resistance == pytest.approx(node_voltage[0])
+    npy.testing.assert_allclose(
+        result.voltage[valid], node_voltage[node_of_cell[valid.ravel()]],
+        rtol=1e-5)
+
+    # Current is conserved at every node with the voltages returned
+    net = npy.zeros(num_nodes)
+    for cell1, cell2, cond in connections:
+        flow = cond * (result.voltage.flat[cell1] - result.voltage.flat[cell2])
+        net[node_of_cell[cell1]] += flow
+        net[node_of_cell[cell2]] -= flow
+    expected_net = npy.zeros(num_nodes)
+    expected_net[[0, 1]] = [1, -1]
+    npy.testing.assert_allclose(net, expected_net, atol=1e-5)
+
+    current = dense_cell_currents(connections, node_voltage, node_of_cell,
+                                  resistance.shape)
+    current[(CORES == 1) | (CORES == 2)] = 0
+    current[~valid] = NAN
+    npy.testing.assert_allclose(result.current, current, rtol=1e-5)
+
+
+@pytest.mark.parametrize('scenario', [lc.PAIRWISE, lc.ALL_TO_ONE])
+def test_raster_all_pairs_matches_pair_solves(scenario):
+    cores = CORES.copy()
+    cores[0, 2] = NAN
+    result = lc.raster_all_pairs(RESISTANCE, cores, scenario)
+    npy.testing.assert_array_equal(result.core_ids, [1, 2, 3, 4])
+    valid = ~npy.isnan(RESISTANCE)
+    # All cores are shorted for every solve, not just the pair's
+    node_of_cell, num_nodes = shorted_nodes(
+        npy.where(cores > 0, npy.nan_to_num(cores) - 1, -1).astype(int),
+        valid)
+    connections = grid_connections(RESISTANCE)
+    inverse = npy.linalg.pinv(dense_laplacian(connections, node_of_cell,
+                                              num_nodes))
+    joined = [0, 1, 2]  # Core 4 isn't connected
+    sources = []
+    for ground in joined:
+        if scenario == lc.PAIRWISE:
+            sources += [(source, ground) for source in joined
+                        if source < ground]
+        else:
+            sources.append(([source for source in joined
+                             if source != ground], ground))
+    current = npy.zeros(RESISTANCE.shape)
+    resistances = npy.full((4, 4), -1.0)
+    npy.fill_diagonal(resistances, 0)
+    for source, ground in sources:
+        injected = npy.zeros(num_nodes)
+        injected[source] = 1
+        injected[ground] = -injected.sum()
+        node_voltage = inverse.dot(injected)
+        current += dense_cell_currents(connections, node_voltage,
+                                       node_of_cell, RESISTANCE.shape)
+        if scenario == lc.PAIRWISE:
+            resistances[source, ground] = resistances[ground, source] = (
+                node_voltage[source] - node_voltage[ground])
+    current[cores > 0] = 0
+    current[~valid] = NAN
+    npy.testing.assert_allclose(result.current, current, rtol=1e-5)
+    if scenario == lc.PAIRWISE:
+        npy.testing.assert_allclose(result.resistances, resistances,
+                                    rtol=1e-6)
+    else:
+        assert npy.isnan(result.resistances).all()
+
+
+SERIAL_LINKS = []  # Links solved in this process by solve_in_process
+
+
+def solve_in_process(job):
+    """Solve a link job, noting links solved in the test's process."""
+    if os.getpid() == TEST_PID:
+        SERIAL_LINKS.append(job.link_id)
+    return SOLVE_LINK_JOB(job)
+
+
+TEST_PID = os.getpid()
+SOLVE_LINK_JOB = lc.solve_link_job
+
+
+def test_link_jobs_over_budget_solved_serially(tmp_path, monkeypatch):
+    jobs = []
+    for link_id, size in enumerate((4, 12, 5, 6)):
+        resistance = npy.ones((size, size))
+        cores = npy.zeros((size, size))
+        cores[:, 0], cores[:, -1] = 1, 2
+        files = [str(tmp_path / (name + str(link_id) + ext))
+                 for name, ext in (('res', '.npy'), ('cores', '.npy'),
+                                   ('out', '.npz'))]
+        npy.save(files[0], resistance)
+        npy.save(files[1], cores)
+        jobs.append(lc.LinkJob(link_id, 1, 2, files[0], files[1], files[2],
+                               size * size))
+    monkeypatch.setattr(lc, 'solve_link_job', solve_in_process)
+    monkeypatch.setattr(lc, 'calibrate_link_job',
+                        lambda job: (solve_in_process(job), 1000.0))
+    del SERIAL_LINKS[:]
+    messages = []
+    # Only link 1, with 144 nodes, is over a 100 kB budget
+    results = list(lc.run_link_jobs(jobs, 2, 100000, messages.append))
+
+    order = [job.link_id for job, result in results]
+    # The median job calibrates, and link 1 is solved after the pool
+    assert order[0] == 2 and sorted(order[1:3]) == [0, 3] and order[3] == 1
+    assert SERIAL_LINKS == [2, 1]
+    assert messages[-1] == ('1 links are too large to solve in parallel '
+                            'and will be solved one at a time.')
+    for job, result in results:
+        cores = npy.load(job.core_file)
+        expected = lc.raster_pair_current(npy.load(job.res_file), cores == 1,
+                                          cores == 2)
+        assert result[0] == job.link_id
+        assert result[1] == pytest.approx(expected.resistance)
@@ -0,0 +1,59 @@
+"""Tests of batch Circuitscape sessions run on the fake circuitscape package."""
+
+import ast
+import sys
+
+import pytest
+
+import lm_cs_batch
+import lm_cs_process as lcp
+from test_lm_cs_process import FAKE_DIR, make_job
+
+
+def test_session_runs_each_job_and_streams_records(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', FAKE_DIR)
+    jobs = [make_job(tmp_path, 'link1'),
+            make_job(tmp_path, 'link2', fail='error'),
+            make_job(tmp_path, 'link3')]
+    manifest = str(tmp_path / 'batch.jsonl')
+    lcp.write_manifest(manifest, jobs)
+    lines = []
+    records = list(lcp.stream_manifest(sys.executable, manifest,
+                                       lines.append))
+
+    assert [record['name'] for record in records] == ['link1', 'link2',
+                                                      'link3']
+    assert records[0]['error'] is None
+    assert lcp.load_resistances(jobs[0].output_file).tolist() == [[1, 2,
+                                                                     3.5]]
+    assert 'FakeError' in records[1]['error']
+    assert records[2]['error'] is None
+    # Circuitscape's own output is passed on
+    assert sum(line.startswith('--- Processing') for line in lines) == 3
+    assert lcp.read_result(lcp.CSRun(jobs[2], 0, 0, [], False, False,
+                                     False)).current.shape == (3, 3)
+
+
+def test_session_without_circuitscape_fails(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    manifest = str(tmp_path / 'batch.jsonl')
+    lcp.write_manifest(manifest, [make_job(tmp_path, 'link1')])
+    lines = []
+    with pytest.raises(RuntimeError):
+        list(lcp.stream_manifest(sys.executable, manifest, lines.append))
+    assert 'Circuitscape Python package not found' in lines[0]
+
+
+def test_session_script_only_needs_standard_library():
+    # The session runs under Circuitscape 4's Python 2.7
+    with open(lm_cs_batch.__file__) as script:
+        tree = ast.parse(script.read())
+    imported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imported.add(node.module)
+    assert imported == {'json', 'sys', 'time', 'traceback', 'circuitscape',
+                        'circuitscape.compute'}
+    assert lm_cs_batch.RECORD_PREFIX == lcp.RECORD_PREFIX
@@ -0,0 +1,119 @@
+"""Tests of lm_cs_process run against the fake Circuitscape stand-in."""
+
+import os
+import sys
+import time
+from configparser import RawConfigParser
+
+import numpy as npy
+import pytest
+
+import lm_cs_process as lcp
+
+FAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_cs')
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='stand-in is run with a shell script')
+
+
+@pytest.fixture
+def cspath(tmp_path):
+    """Executable running the fake Circuitscape on an .ini file."""
+    script = tmp_path / 'cs_run'
+    script.write_text('#!/bin/sh\nexec "{0}" "{1}" "$@"\n'.format(
+        sys.executable, os.path.join(FAKE_DIR, 'fake_circuitscape.py')))
+    script.chmod(0o755)
+    return str(script)
+
+
+def make_job(tmp_path, name, timeout=None, **fake):
+    """Write an .ini for the stand-in. Returns CSJob."""
+    config = RawConfigParser()
+    output_file = str(tmp_path / (name + '.out'))
+    config.add_section('Output options')
+    config.set('Output options', 'output_file', output_file)
+    config.add_section('Fake')
+    for option, value in fake.items():
+        config.set('Fake', option, str(value))
+    config_file = str(tmp_path / (name + '.ini'))
+    with open(config_file, 'w') as config_out:
+        config.write(config_out)
+    return lcp.CSJob(name, config_file, output_file, timeout)
+
+
+def pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_result_files_and_timings_read(cspath, tmp_path):
+    lines = []
+    run = lcp.run_jobs(cspath, [make_job(tmp_path, 'job')],
+                       report=lambda job, line: lines.append(line))[0]
+    assert run.returncode == 0
+    assert not (run.failed or run.mem_error or run.timed_out)
+    assert lines == run.output
+    assert lines[0].startswith('--- Processing')
+
+    result = lcp.read_result(run)
+    npy.testing.assert_array_equal(result.current,
+                                   npy.arange(9.0).reshape(3, 3))
+    npy.testing.assert_array_equal(result.resistances, [[1, 2, 3.5]])
+    assert result.branch_currents is None
+    assert result.timings == [('Reading maps', 1.5), ('Completed in', 2.5)]
+
+
+def test_failure_flags(cspath, tmp_path):
+    runs = lcp.run_jobs(cspath, [
+        make_job(tmp_path, 'memory', fail='memory', exit_code=3),
+        make_job(tmp_path, 'error', fail='error')], processes=2)
+    assert runs[0].returncode == 3
+    assert runs[0].failed and runs[0].mem_error
+    assert runs[1].failed and not runs[1].mem_error
+    assert lcp.read_result(runs[1]).current is None
+
+
+def test_jobs_run_in_parallel_and_return_in_job_order(cspath, tmp_path):
+    jobs = [make_job(tmp_path, 'job' + str(job), delay=1) for job in range(3)]
+    start_time = time.time()
+    runs = lcp.run_jobs(cspath, jobs, processes=3)
+    assert time.time() - start_time < 2.5
+    assert [run.job for run in runs] == jobs
+
+    start_time = time.time()
+    lcp.run_jobs(cspath, jobs[:2], processes=1)
+    assert time.time() - start_time >= 2
+
+
+def test_timeout_kills_job(cspath, tmp_path):
+    start_time = time.time()
+    runs = lcp.run_jobs(cspath, [make_job(tmp_path, 'slow', 0.5, delay=30),
+                                 make_job(tmp_path, 'quick')], processes=2)
+    assert time.time() - start_time < 10
+    assert runs[0].timed_out and runs[0].returncode is None
+    assert not runs[1].timed_out and runs[1].returncode == 0
+
+
+def test_interrupt_kills_running_processes(cspath, tmp_path):
+    pid_files = [str(tmp_path / ('pid' + str(job))) for job in range(2)]
+    jobs = [make_job(tmp_path, 'job' + str(job), delay=30, pid_file=pid_file)
+            for job, pid_file in enumerate(pid_files)]
+    started = set()
+
+    def report(job, line):
+        # Cancel once both processes are running
+        started.add(job.name)
+        if len(started) == 2:
+            raise KeyboardInterrupt
+
+    start_time = time.time()
+    with pytest.raises(KeyboardInterrupt):
+        lcp.run_jobs(cspath, jobs, processes=2, report=report)
+    assert time.time() - start_time < 10
+    for pid_file in pid_files:
+        with open(pid_file) as pid_in:
+            assert not pid_running(int(pid_in.read()))
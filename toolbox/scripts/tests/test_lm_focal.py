@@ -0,0 +1,140 @@
+"""Tests of lm_focal circle and annulus statistics against brute force."""
+
+import numpy as npy
+import pytest
+
+import lm_focal as lf
+from lm_grid import MINIMUM, MAXIMUM
+
+NAN = npy.nan
+
+# Small grid with NoData cells, including a whole NoData row and column
+GRID = npy.array([
+    [5.0, 3.0, NAN, 8.0, 1.0, 6.0, 2.0],
+    [4.0, 9.0, 7.0, NAN, 3.0, 5.0, 8.0],
+    [NAN, NAN, NAN, NAN, NAN, NAN, NAN],
+    [2.0, 6.0, 1.0, NAN, 9.0, 4.0, 7.0],
+    [8.0, 2.0, 5.0, NAN, 6.0, 3.0, 1.0],
+    [3.0, 7.0, 4.0, NAN, 2.0, 8.0, 5.0],
+], dtype=npy.float32)
+
+
+def brute_force(array, inner, outer, method):
+    """Return focal min or max, cells where inner < distance <= outer."""
+    func = npy.nanmin if method == MINIMUM else npy.nanmax
+    nrows, ncols = array.shape
+    rows, cols = npy.indices(array.shape)
+    out = npy.full(array.shape, npy.nan, dtype=npy.float32)
+    for row in range(nrows):
+        for col in range(ncols):
+            dist = npy.hypot(rows - row, cols - col)
+            values = array[(dist > inner) & (dist <= outer)]
+            values = values[~npy.isnan(values)]
+            if values.size:
+                out[row, col] = func(values)
+    return out
+
+
+def test_annulus_includes_cell_centers_beyond_inner_to_outer():
+    cells = set()
+    for row_off, col_off, length in lf.annulus_segments(1.0, 2.0):
+        cells.update((row_off, col_off + col) for col in range(length))
+    # Distance 1 is on the inner radius so left out, distance 2 is on the
+    # outer radius so kept
+    assert (0, 1) not in cells and (1, 0) not in cells
+    assert (0, 2) in cells and (-2, 0) in cells
+    assert (1, 1) in cells and (2, 1) not in cells
+    assert len(cells) == 8
+
+    circle = set()
+    for row_off, col_off, length in lf.circle_segments(1.0):
+        circle.update((row_off, col_off + col) for col in range(length))
+    assert circle == {(0, 0), (0, 1), (0, -1), (1, 0), (-1, 0)}
+
+
+@pytest.mark.parametrize('radius', [0.5, 1.0, 1.5, 2.0, 2.3, 3.2])
+@pytest.mark.parametrize('method', [MINIMUM, MAXIMUM])
+def test_circle_matches_brute_force(radius, method):
+    result = lf.focal_reduce(GRID, lf.circle_segments(radius), method)
+    npy.testing.assert_array_equal(result,
+                                   brute_force(GRID, -1, radius, method))
+
+
+@pytest.mark.parametrize('inner, outer', [(0.5, 1.5), (1.0, 2.0),
+                                          (1.2, 2.7), (0.0, 3.0)])
+@pytest.mark.parametrize('method', [MINIMUM, MAXIMUM])
+def test_annulus_matches_brute_force(inner, outer, method):
+    result = lf.focal_reduce(GRID, lf.annulus_segments(inner, outer), method)
+    npy.testing.assert_array_equal(result,
+                                   brute_force(GRID, inner, outer, method))
+
+
+@pytest.mark.parametrize('radius, cell_size', [(3, 1), (20, 10), (25, 10),
+                                               (30, 10), (5, 2.5)])
+def test_step6_thin_annulus(radius, cell_size):
+    # Step 6 takes CWD minimums over an annulus one map unit thick at each
+    # search radius
+    inner = (radius - 1) / cell_size
+    outer = radius / cell_size
+    result = lf.focal_reduce_multi(
+        GRID, [lf.annulus_segments(inner, outer)], MINIMUM)[0]
+    npy.testing.assert_array_equal(result,
+                                   brute_force(GRID, inner, outer, MINIMUM))
+    npy.testing.assert_array_equal(lf.annulus_min(GRID, inner, outer),
+                                   result)
+
+
+def test_annulus_thinner_than_cell_spacing_can_be_empty():
+    # No cell center is more than 2.1 but no more than 2.2 cells away
+    assert lf.annulus_segments(2.1, 2.2) == ()
+    result = lf.focal_reduce(GRID, lf.annulus_segments(2.1, 2.2), MINIMUM)
+    assert npy.isnan(result).all()
+
+
+def test_multiple_neighborhoods_share_runs():
+    neighborhoods = [(-1, 1.5), (0.5, 1.5), (1.0, 2.0), (1.9, 3.0)]
+    results = lf.focal_reduce_multi(
+        GRID, [lf.annulus_segments(inner, outer)
+               for inner, outer in neighborhoods], MAXIMUM)
+    for result, (inner, outer) in zip(results, neighborhoods):
+        npy.testing.assert_array_equal(
+            result, brute_force(GRID, inner, outer, MAXIMUM))
+
+
+def test_focal_reduce_at_cells():
+    rows = npy.array([0, 2, 3, 5, 5])
+    cols = npy.array([0, 3, 3, 6, 0])
+    segments = lf.annulus_segments(0.5, 2.0)
+    expected = brute_force(GRID, 0.5, 2.0, MINIMUM)[rows, cols]
+    npy.testing.assert_array_equal(
+        lf.focal_reduce_at(GRID, segments, MINIMUM, rows, cols), expected)
+
+
+@pytest.mark.parametrize('radius', [1.0, 1.5, 2.0, 2.9])
+def test_circle_max_grows_sparse_cells(radius):
+    sparse = npy.full((7, 9), npy.nan, dtype=npy.float32)
+    sparse[1, 2] = 4.0
+    sparse[1, 3] = 2.0
+    sparse[5, 6] = 7.0
+    sparse[6, 8] = 1.0
+    npy.testing.assert_array_equal(
+        lf.circle_max(sparse, radius),
+        brute_force(sparse, -1, radius, MAXIMUM))
+    assert npy.isnan(lf.circle_max(npy.full((3, 3), npy.nan), 2.0)).all()
+
+
+@pytest.mark.parametrize('length', [1, 2, 3, 4, 7])
+def test_running_reduce(length):
+    expected = npy.array([[npy.nanmin(row[col:col + length])
+                           if not npy.isnan(row[col:col + length]).all()
+                           else npy.nan
+                           for col in range(GRID.shape[1] - length + 1)]
+                          for row in GRID], dtype=npy.float32)
+    with npy.errstate(invalid='ignore'):
+        result = lf.running_reduce(GRID, length, MINIMUM)
+    npy.testing.assert_array_equal(result, expected)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        lf.focal_reduce(GRID, lf.circle_segments(1), 'MEAN')
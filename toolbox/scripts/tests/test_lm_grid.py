@@ -0,0 +1,37 @@
+"""Tests of lm_grid zone statistics merged across tiles."""
+
+import numpy as npy
+
+import lm_grid as lg
+
+
+def test_zone_stats_match_whole_grid():
+    random = npy.random.RandomState(7)
+    zones = random.choice([1.0, 2.0, 5.0, 9.0], (20, 23))
+    zones[random.uniform(size=zones.shape) < 0.1] = npy.nan
+    zones[14:, 16:] = 12.0  # Zone first seen in a late tile
+    # Large values, so the variance needs the merged deviations
+    values = 1e6 + random.normal(0, 3, zones.shape) * zones
+    values[random.uniform(size=values.shape) < 0.1] = npy.nan
+    values[zones == 5.0] = npy.nan  # Zone without data
+
+    outer = lg.Window(0, 0, 20, 23)
+    tiles = ((zones[lg.window_slices(win, outer)],
+              values[lg.window_slices(win, outer)])
+             for win in lg.grid_windows(20, 23, tile_size=7))
+    stats = lg.zone_stats(tiles)
+
+    npy.testing.assert_array_equal(stats.zones, [1, 2, 9, 12])
+    for index, zone in enumerate(stats.zones):
+        zone_values = values[(zones == zone) & ~npy.isnan(values)]
+        assert stats.count[index] == len(zone_values)
+        npy.testing.assert_allclose(stats.mean[index], npy.mean(zone_values),
+                                    rtol=1e-12)
+        npy.testing.assert_allclose(stats.std[index], npy.std(zone_values),
+                                    rtol=1e-8)
+
+
+def test_zone_stats_without_data():
+    tiles = [(npy.full((2, 2), npy.nan), npy.ones((2, 2)))]
+    stats = lg.zone_stats(tiles)
+    assert len(stats.zones) == len(stats.mean) == 0
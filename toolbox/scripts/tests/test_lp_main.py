@@ -0,0 +1,127 @@
+"""Tests of Linkage Priority helpers run on stub arcpy."""
+
+import importlib
+import os
+import types
+
+import numpy as npy
+import pytest
+
+NAN = npy.nan
+
+
+@pytest.fixture
+def lp_main(arcpy_stubs, tmp_path):
+    """Import lp_main with its datapass folder in tmp_path."""
+    cfg = arcpy_stubs.cfg
+    cfg.LCCBASEDIR = str(tmp_path / 'nlcc')
+    cfg.NLCCFILE = str(tmp_path / 'nlcc' / 'nlcc_sparse.npz')
+    cfg.LCCNLCDIR_NM = 'nlc'
+    cfg.CWDTHRESH = 5000
+    cfg.KEEPINTERMEDIATE = False
+    cfg.COREFN = 'core_ID'
+    cfg.FROMCOREFIELD = 'From_Core'
+    cfg.TOCOREFIELD = 'To_Core'
+    return importlib.import_module('lp_main')
+
+
+def test_nlcc_grids_clipped_without_container(lp_main, arcpy_stubs):
+    nlc_dir = os.path.join(arcpy_stubs.cfg.LCCBASEDIR, 'nlc1')
+    arcpy = arcpy_stubs.arcpy
+    arcpy.env = types.SimpleNamespace(workspace='project')
+    workspaces = []
+
+    def walk(top, topdown, datatype):
+        assert (top, datatype) == (arcpy_stubs.cfg.LCCBASEDIR,
+                                   'RasterDataset')
+        yield arcpy_stubs.cfg.LCCBASEDIR, ['nlc1'], []
+        yield nlc_dir, [], ['1_2', '1_3', '2_3']
+
+    def extract_by_attributes(raster, where_clause):
+        workspaces.append(arcpy.env.workspace)
+        return (raster, where_clause)
+
+    arcpy.da = types.SimpleNamespace(Walk=walk)
+    arcpy.sa.ExtractByAttributes = extract_by_attributes
+    nlcc_list = lp_main.clip_nlcc_to_threashold(['1_2', '2_3', '3_4'])
+    assert nlcc_list == [['nlc_1_2', ('1_2', 'VALUE <= 5000')],
+                         ['nlc_2_3', ('2_3', 'VALUE <= 5000')]]
+    assert workspaces == [nlc_dir, nlc_dir]
+    assert arcpy.env.workspace == 'project'
+
+    arcpy.da = types.SimpleNamespace(
+        Walk=lambda top, topdown, datatype: iter([]))
+    with pytest.raises(lp_main.AppError, match='No normalized'):
+        lp_main.clip_nlcc_to_threashold(['1_2'])
+
+
+def test_core_values_by_core_id(lp_main):
+    cores = {'core_ID': npy.array([5, 2, 9]),
+             'cav': npy.array([50.0, 20.0, 90.0])}
+    npy.testing.assert_array_equal(
+        lp_main.core_values(cores, 'cav', npy.array([9, 2, 9, 5])),
+        [90.0, 20.0, 90.0, 50.0])
+    with pytest.raises(lp_main.AppError, match='Core 7 not found'):
+        lp_main.core_values(cores, 'cav', npy.array([2, 7]))
+
+
+def test_pair_values_in_either_order(lp_main):
+    pairs = {'From_Core': npy.array([1, 2, 5]),
+             'To_Core': npy.array([2, 5, 3]),
+             'cwd': npy.array([12.0, 25.0, 53.0])}
+    npy.testing.assert_array_equal(
+        lp_main.pair_values(pairs, 'cwd', npy.array([2, 5, 3, 1]),
+                            npy.array([1, 2, 5, 2])),
+        [12.0, 25.0, 53.0, 12.0])
+    with pytest.raises(lp_main.AppError, match='pair 1-5 not found'):
+        lp_main.pair_values(pairs, 'cwd', npy.array([1]), npy.array([5]))
+
+
+@pytest.mark.parametrize('method, invert, expected', [
+    ('SCORE_RANGE', False, [0.0, 0.25, NAN, 1.0]),
+    ('SCORE_RANGE', True, [1.0, 0.75, NAN, 0.0]),
+    ('MAX_VALUE', False, [0.2, 0.4, NAN, 1.0]),
+    ('MAX_VALUE', True, [1.0, 0.8, NAN, 0.2]),
+])
+def test_normalize_values(lp_main, method, invert, expected):
+    values = npy.array([2.0, 4.0, NAN, 10.0])
+    npy.testing.assert_allclose(
+        lp_main.normalize_values(values, method, invert), expected)
+
+
+@pytest.mark.filterwarnings('ignore:All-NaN slice')
+@pytest.mark.parametrize('values', [[NAN, NAN], [-3.0, 0.0, NAN]])
+def test_normalize_values_without_positive_values(lp_main, values):
+    for method in ('SCORE_RANGE', 'MAX_VALUE'):
+        npy.testing.assert_array_equal(
+            lp_main.normalize_values(npy.array(values), method, True),
+            npy.zeros(len(values)))
+
+
+def scalar_clim_lnk_value(lp_main, xlnk, min_pnt, target_pnt, max_pnt):
+    """Return climate linkage value of one link, as Linkage Priority did."""
+    if target_pnt.y is None:
+        line_slope = lp_main.slope(min_pnt, max_pnt)
+        line_intercept = lp_main.intercept(max_pnt, line_slope)
+    elif xlnk < target_pnt.y:
+        line_slope = lp_main.slope(min_pnt, target_pnt)
+        line_intercept = lp_main.intercept(target_pnt, line_slope)
+    elif xlnk > target_pnt.y:
+        line_slope = lp_main.slope(target_pnt, max_pnt)
+        line_intercept = lp_main.intercept(max_pnt, line_slope)
+    else:
+        line_slope = line_intercept = 1
+    return lp_main.sline_y_value(xlnk, line_slope, line_intercept)
+
+
+@pytest.mark.parametrize('target_y', [None, 1.0, 1.5])
+def test_clim_lnk_value_matches_each_link(lp_main, target_y):
+    point = lp_main.CoordPoint
+    min_pnt, max_pnt = point(0.2, 0.0), point(3.0, 0.1)
+    target_pnt = point(1.0, target_y)
+    # Ratios below, at and above the target
+    xlnk = npy.array([0.2, 0.7, 1.0, 1.2, 1.5, 2.4, 3.0])
+    expected = [scalar_clim_lnk_value(lp_main, x, min_pnt, target_pnt,
+                                      max_pnt) for x in xlnk]
+    npy.testing.assert_allclose(
+        lp_main.clim_lnk_value(xlnk, min_pnt, target_pnt, max_pnt), expected)
@@ -0,0 +1,52 @@
+"""Tests of step 5's handling of corridor state left by earlier runs."""
+
+import importlib
+import zipfile
+
+import numpy as npy
+import pytest
+
+
+@pytest.fixture
+def s5(arcpy_stubs, tmp_path):
+    """Import s5_calcLccs with state files in tmp_path."""
+    cfg = arcpy_stubs.cfg
+    cfg.STEP3 = False
+    cfg.SAVENORMLCCS = False
+    cfg.CWDTHRESH = 200000
+    cfg.LCCSTATEFILE = str(tmp_path / 'lcc_state.npz')
+    cfg.NLCCFILE = str(tmp_path / 'nlcc_sparse.npz')
+    return importlib.import_module('s5_calcLccs')
+
+
+def truncate(filename):
+    """Cut a file short, as when a run dies part way through writing it."""
+    with open(filename, 'rb') as in_file:
+        data = in_file.read()
+    with open(filename, 'wb') as out_file:
+        out_file.write(data[:len(data) // 2])
+
+
+def test_unclosed_nlcc_container_is_no_state(s5, arcpy_stubs):
+    cfg = arcpy_stubs.cfg
+    cfg.SAVENORMLCCS = True
+    npy.savez(cfg.LCCSTATEFILE, grid=npy.zeros(6))
+    # Local file entries but no central directory, as left by a writer
+    # that was never closed
+    with zipfile.ZipFile(cfg.NLCCFILE, 'w') as zip_file:
+        zip_file.writestr('meta.npy', b'x' * 1000)
+    truncate(cfg.NLCCFILE)
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(cfg.NLCCFILE)
+    assert s5.load_lcc_state(None) is None
+
+
+def test_truncated_state_file_is_no_state(s5, arcpy_stubs):
+    npy.savez(arcpy_stubs.cfg.LCCSTATEFILE, grid=npy.zeros(6),
+              links=npy.zeros((50, 9)))
+    truncate(arcpy_stubs.cfg.LCCSTATEFILE)
+    assert s5.load_lcc_state(None) is None
+
+
+def test_missing_state_file_is_no_state(s5):
+    assert s5.load_lcc_state(None) is None
@@ -0,0 +1,63 @@
+"""Tests of step 7's tables of centrality changes between runs."""
+
+import importlib
+import os
+
+import numpy as npy
+import pytest
+
+# Ring of cores 1 to 8 with chords 1-5 and 3-7
+GRAPH = npy.array([[core, core % 8 + 1, 1.0 + core % 3]
+                   for core in range(1, 9)] + [[1, 5, 4.0], [3, 7, 5.0]])
+
+
+@pytest.fixture
+def s7(arcpy_stubs, tmp_path):
+    """Import s7_centrality with its state and outputs in tmp_path."""
+    def delete_file(filename):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    arcpy_stubs.lm_util.delete_file = delete_file
+    cfg = arcpy_stubs.cfg
+    cfg.DATAPASSDIR = cfg.OUTPUTDIR = str(tmp_path)
+    cfg.CENTRALITYSTATEFILE = str(tmp_path / 'centrality_state.npz')
+    cfg.PREFIX = 'run'
+    return importlib.import_module('s7_centrality')
+
+
+def read_changes(tmp_path, table):
+    changes = tmp_path / ('run_' + table + 'CentralityChanges.csv')
+    if not changes.exists():
+        return None
+    return npy.loadtxt(str(changes), delimiter=',', ndmin=2)
+
+
+def test_changes_written_for_updated_network(s7, tmp_path):
+    network, edges, deltas = s7.get_network(GRAPH)
+    assert deltas is None
+    s7.write_current_changes(network, deltas)
+    assert read_changes(tmp_path, 'core') is None
+    old_links = network.branch_currents()
+    old_cores = network.node_currents()
+
+    # Drop the chord 1-5 and double the resistance of 2-3
+    graph = GRAPH[[0, 1, 2, 3, 4, 5, 6, 7, 9]]
+    graph[1, 2] *= 2
+    network, edges, deltas = s7.get_network(graph)
+    s7.write_current_changes(network, deltas)
+    core_changes = read_changes(tmp_path, 'core')
+    npy.testing.assert_array_equal(core_changes[:, 0], npy.arange(1, 9))
+    npy.testing.assert_allclose(core_changes[:, 1],
+                                network.node_currents() - old_cores)
+    link_changes = read_changes(tmp_path, 'link')
+    npy.testing.assert_array_equal(link_changes[:, 0:2], GRAPH[:, 0:2])
+    npy.testing.assert_allclose(link_changes[:, 2],
+                                network.branch_currents() - old_links)
+    assert link_changes[8, 2] == pytest.approx(-old_links[8])
+
+    # Solving from scratch removes the tables
+    os.remove(s7.cfg.CENTRALITYSTATEFILE)
+    network, edges, deltas = s7.get_network(GRAPH)
+    s7.write_current_changes(network, deltas)
+    assert read_changes(tmp_path, 'link') is None
@@ -0,0 +1,62 @@
+"""Tests of step 8's record of links finished, used when restarting."""
+
+import importlib
+import os
+import shutil
+import types
+
+import numpy as npy
+import pytest
+
+
+@pytest.fixture
+def s8(arcpy_stubs, monkeypatch):
+    """Import s8_pinchpoints with stubs for mosaicking a link's current."""
+    arcpy = arcpy_stubs.arcpy
+    arcpy.env = types.SimpleNamespace(extent=None, cellSize=10)
+    arcpy.CopyRaster_management = lambda source, output: None
+    arcpy.Mosaic_management = lambda source, target, how, colormap: None
+    lm_util = arcpy_stubs.lm_util
+    lm_util.delete_data = lambda dataset: None
+    lm_util.clean_out_workspace = lambda workspace: None
+    lm_util.delete_dir = shutil.rmtree
+    cfg = arcpy_stubs.cfg
+    cfg.LTB_CWDIST, cfg.LTB_EFFRESIST, cfg.LTB_CWDTORR = 0, 1, 2
+    cfg.SQUARERESISTANCES = False
+    cfg.SAVE_TEMP_CIRCUIT_FILES = False
+    s8 = importlib.import_module('s8_pinchpoints')
+    monkeypatch.setattr(s8, 'SETCORESTONULL', False)
+    return s8
+
+
+def test_finished_link_marked_with_resistance(s8, tmp_path):
+    link_table = npy.zeros((2, 3))
+    link_table[:, 0] = [100.0, 300.0]
+    link_dir = str(tmp_path / 'link7')
+    os.mkdir(link_dir)
+    link = npy.array([1])
+    s8.finish_link(link_table, link, 'current.tif', 'core_pairs.tif', 2.5,
+                   'mosaic', True, link_dir)
+    assert link_table[1, 1] == 25.0 and link_table[1, 2] == 12.0
+
+    # The link's folder is cleaned up, but the marker stays
+    assert not os.path.exists(link_dir)
+    done_file = s8.link_done_file(link_dir)
+    assert os.path.dirname(done_file) == str(tmp_path)
+
+    # A restart fills in the link table from the marker
+    restart_table = npy.zeros((2, 3))
+    restart_table[:, 0] = link_table[:, 0]
+    with open(done_file) as done:
+        s8.set_link_resistance(restart_table, link, float(done.read()))
+    npy.testing.assert_array_equal(restart_table, link_table)
+
+
+def test_unconnected_link_marked(s8, tmp_path):
+    link_table = npy.ones((1, 3))
+    link_dir = str(tmp_path / 'link1')
+    os.mkdir(link_dir)
+    s8.finish_link(link_table, npy.array([0]), 'current.tif',
+                   'core_pairs.tif', npy.inf, 'mosaic', False, link_dir)
+    with open(s8.link_done_file(link_dir)) as done:
+        assert float(done.read()) == -10.0